@@ -1,15 +1,48 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import pandas as pd
-import sqlite3
 import os
 from pathlib import Path
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
 import seaborn as sns
 import numpy as np
+import codecs
+from itertools import islice
 from difflib import SequenceMatcher
 
+from groupRules import RULE_TYPES, validate_rule, match_group_rules, describe_rule
+from metricsEngine import (DEFAULT_ALLOWANCE, DEFAULT_OUTLIER_METHOD, DEFAULT_RATING, METRIC_COLUMNS,
+                           OUTLIER_METHODS, SAMPLE_SIZE_ACCURACY, SAMPLE_SIZE_CONFIDENCE, SECONDS_COLUMNS,
+                           FenceExplorer, MetricsCache, add_standard_times, build_results_table,
+                           required_sample_sizes, validate_outlier_method, validate_sample_size_settings,
+                           validate_time_factors)
+from parallelEngine import PARALLEL_MIN_ROWS, default_workers
+from columnStore import ColumnStore
+from fileSummaries import FileSummary, file_content_hash, merge_file_summaries
+from exportEngine import (CSV_COMPRESSIONS, DEFAULT_CSV_COMPRESSION, DEFAULT_SAMPLE_LAYOUT, PYARROW_AVAILABLE,
+                          SAMPLE_LAYOUTS, ChunkedCsvWriter, columnar_paths, csv_filename, numeric_results_frame,
+                          processed_sample_blocks, resolve_sample_layout, sample_rows, validate_csv_compression,
+                          write_columnar, write_export_workbook)
+from boxPlots import MAX_BOXES, box_stats, draw_box_plots
+from bootstrapEngine import BOOTSTRAP_COLUMNS, BOOTSTRAP_CONFIDENCE, BOOTSTRAP_SEED, bootstrap_intervals
+from quantileSketch import APPROXIMATE_COLUMNS, ActivitySketches, k_for_error
+from sessionStore import DEFAULT_DB_PATH, SessionStore
+from sqlAnalysis import sql_metrics
+
+# Linhas lidas por bloco na análise aproximada (streaming)
+STREAM_CHUNK_ROWS = 200_000
+
+# Bytes do início de um CSV usados para escolher a codificação da leitura em blocos
+ENCODING_PROBE_BYTES = 1 << 20
+
+# Maior multiplicador oferecido no controle deslizante de cada método de outliers
+FENCE_SLIDER_MAX = {"tukey": 5.0, "mad": 10.0, "percentile": 25.0, "zscore": 6.0}
+
+# Linhas da tabela formatadas por ciclo da interface (inserção das atividades e após mudar o multiplicador)
+RESULT_REFRESH_CHUNK = 300
+
 # Configurações de design moderno
 class ModernColors:
     # Cores principais
@@ -201,12 +234,27 @@ class TimeStudyAnalyzer:
         
         # Variáveis de estado
         self.uploaded_files = []
-        self.processed_data = None
+        self.disabled_files = set()  # Arquivos carregados mas fora da análise
+        self.file_summaries = {}  # Arquivo -> FileSummary (contribuição já processada)
+        self.file_hashes = {}  # Arquivo -> hash do conteúdo (cópias do mesmo arquivo são ignoradas)
+        self._summary_columns = None  # Mapeamento de colunas usado nos resumos
+        self._records_in_database = False  # Sessão aberta sem carregar os registros (ficam só no banco)
+        self.processed_data = None  # ColumnStore: visão sobre as colunas .npy (memmap) de cada arquivo
         self.activity_column = None
         self.time_column = None
         self.rework_column = None  # Nova coluna de retrabalho
         self.unified_activities = {}
         self.activity_groups = {}
+        self.activity_factors = {}  # Atividade (nome unificado) -> {'rating', 'allowance'} próprios
+        self.analysis_results = None  # Tabela numérica de resultados (uma linha por grupo/atividade)
+        self.analysis_settings = {}  # Parâmetros usados na última análise (registrados na exportação)
+        self.metrics_cache = MetricsCache()  # Métricas reaproveitadas entre análises
+        self._result_items = {}  # Linha da tabela -> item já exibido na árvore
+        self._refresh_job = None  # Reformatação em andamento da árvore de resultados
+        self._insert_job = None  # Inserção em blocos das linhas de atividades
+        self.fence_explorer = None  # Recalcula outliers da última análise para outro multiplicador
+        self._results_in_memory = False  # Tempos ordenados da última análise disponíveis no cache de métricas
+        self._csv_writer = None  # Exportação CSV em andamento (gravada em blocos)
         
         # Criar interface moderna
         self.create_modern_interface()
@@ -215,54 +263,10 @@ class TimeStudyAnalyzer:
         self.center_window()
         
     def init_database(self):
-        """Inicializa o banco de dados SQLite"""
-        self.db_path = "time_study.db"
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Criar tabelas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS files (
-                id INTEGER PRIMARY KEY,
-                filename TEXT NOT NULL,
-                upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                data TEXT NOT NULL
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS activities (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                unified_name TEXT,
-                group_name TEXT,
-                time_seconds REAL NOT NULL
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS groups (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                color TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS statistics (
-                id INTEGER PRIMARY KEY,
-                activity_name TEXT NOT NULL,
-                group_name TEXT,
-                q1 REAL,
-                median REAL,
-                q3 REAL,
-                iqr REAL,
-                outliers TEXT,
-                mean_all REAL,
-                mean_no_outliers REAL,
-                total_time REAL
-            )
-        ''')
+        """Inicializa o banco de dados SQLite (tabelas e índices da sessão)"""
+        self.db_path = DEFAULT_DB_PATH
+        self.session_store = SessionStore(self.db_path)
+        self.session_path = None  # Banco da sessão escolhido pelo usuário (salva ou aberta)
         
     def center_window(self):
         """Centralizar janela na tela"""
@@ -385,6 +389,32 @@ class TimeStudyAnalyzer:
                               style='Secondary.TButton')
         clear_btn.pack(side=tk.LEFT)
         
+        # Remover ou ativar/desativar um arquivo sem reprocessar os demais
+        remove_btn = ttk.Button(button_frame,
+                               text="➖ Remover Selecionado",
+                               command=self.remove_selected_file,
+                               style='Secondary.TButton')
+        remove_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
+        toggle_btn = ttk.Button(button_frame,
+                               text="⏯️ Ativar/Desativar",
+                               command=self.toggle_selected_file,
+                               style='Secondary.TButton')
+        toggle_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
+        # Sessão gravada no banco: reabrir sem reler os arquivos
+        save_session_btn = ttk.Button(button_frame,
+                                     text="💾 Salvar Sessão",
+                                     command=self.save_session,
+                                     style='Secondary.TButton')
+        save_session_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
+        open_session_btn = ttk.Button(button_frame,
+                                     text="📂 Abrir Sessão",
+                                     command=self.open_session,
+                                     style='Secondary.TButton')
+        open_session_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
         # Status de arquivos
         self.upload_status = ttk.Label(button_frame,
                                      text="Nenhum arquivo selecionado",
@@ -688,7 +718,15 @@ class TimeStudyAnalyzer:
         
         add_to_group_btn = ttk.Button(group_btn_frame, text="📝 Adicionar ao Grupo",
                                      command=self.add_to_group, style='Secondary.TButton')
-        add_to_group_btn.pack(side=tk.LEFT)
+        add_to_group_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        rules_btn = ttk.Button(group_btn_frame, text="🧩 Regras de Agrupamento",
+                              command=self.manage_group_rules, style='Secondary.TButton')
+        rules_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        factors_btn = ttk.Button(group_btn_frame, text="⏳ Ritmo e Tolerâncias",
+                                command=self.manage_time_factors, style='Secondary.TButton')
+        factors_btn.pack(side=tk.LEFT)
         
         # Tree para grupos
         self.group_tree = ttk.Treeview(right_frame, style='Modern.Treeview')
@@ -715,22 +753,108 @@ class TimeStudyAnalyzer:
         # Frame do cabeçalho para botões e status
         header_frame = ttk.Frame(content)
         header_frame.grid(row=0, column=0, sticky="ew", pady=(0, 20))
-        header_frame.grid_columnconfigure(1, weight=1)
+        header_frame.grid_columnconfigure(2, weight=1)
         
         # Botão de análise principal
         analyze_btn = ttk.Button(header_frame, text="🚀 Executar Análise Completa",
                                 command=self.perform_analysis, style='Primary.TButton')
         analyze_btn.grid(row=0, column=0, sticky="w")
         
+        # Modo multiprocesso para estudos muito grandes
+        self.parallel_var = tk.BooleanVar(value=False)
+        parallel_check = ttk.Checkbutton(header_frame,
+                                        text=f"⚡ Processamento paralelo ({default_workers()} núcleos, "
+                                             f"a partir de {PARALLEL_MIN_ROWS:,} registros)".replace(",", "."),
+                                        variable=self.parallel_var)
+        parallel_check.grid(row=0, column=1, sticky="w", padx=(15, 0))
+        
+        # Método de detecção de outliers e multiplicador
+        outlier_frame = ttk.Frame(header_frame)
+        outlier_frame.grid(row=1, column=0, sticky="w", pady=(8, 0))
+        
+        ttk.Label(outlier_frame, text="🎯 Outliers:",
+                 font=('Segoe UI', 10, 'bold'),
+                 foreground=ModernColors.TEXT_PRIMARY).pack(side=tk.LEFT, padx=(0, 5))
+        self.outlier_method_combo = ttk.Combobox(outlier_frame, state="readonly", style='Modern.TCombobox',
+                                                 values=[label for label, _ in OUTLIER_METHODS.values()],
+                                                 width=34)
+        self.outlier_method_combo.current(list(OUTLIER_METHODS).index(DEFAULT_OUTLIER_METHOD))
+        self.outlier_method_combo.pack(side=tk.LEFT)
+        self.outlier_method_combo.bind("<<ComboboxSelected>>", self._on_outlier_method_changed)
+        
+        ttk.Label(outlier_frame, text="k:",
+                 font=('Segoe UI', 10, 'normal'),
+                 foreground=ModernColors.TEXT_SECONDARY).pack(side=tk.LEFT, padx=(10, 5))
+        self.fence_multiplier_var = tk.StringVar(value=str(OUTLIER_METHODS[DEFAULT_OUTLIER_METHOD][1]))
+        ttk.Spinbox(outlier_frame, textvariable=self.fence_multiplier_var, from_=0, to=49.9,
+                   increment=0.1, width=6).pack(side=tk.LEFT)
+        
+        # Simulação: arrastar recalcula os outliers da última análise na hora
+        self.fence_scale = ttk.Scale(outlier_frame, from_=0, to=FENCE_SLIDER_MAX[DEFAULT_OUTLIER_METHOD],
+                                     orient='horizontal', length=160, command=self._on_fence_slider)
+        self.fence_scale.set(OUTLIER_METHODS[DEFAULT_OUTLIER_METHOD][1])
+        self.fence_scale.pack(side=tk.LEFT, padx=(10, 0))
+        
+        # Estatísticas opcionais da tabela de resultados
+        stats_frame = ttk.Frame(header_frame)
+        stats_frame.grid(row=2, column=0, columnspan=2, sticky="w", pady=(8, 0))
+        
+        self.bootstrap_var = tk.BooleanVar(value=False)
+        bootstrap_check = ttk.Checkbutton(stats_frame,
+                                         text=f"📏 IC bootstrap {BOOTSTRAP_CONFIDENCE:.0%} (mediana e T. Norm.)",
+                                         variable=self.bootstrap_var)
+        bootstrap_check.pack(side=tk.LEFT)
+        
+        # Número de observações necessárias (confiança e precisão)
+        ttk.Label(stats_frame, text="📐 N necessário • Confiança (%):",
+                 font=('Segoe UI', 10, 'normal'),
+                 foreground=ModernColors.TEXT_SECONDARY).pack(side=tk.LEFT, padx=(20, 5))
+        self.sample_confidence_var = tk.StringVar(value=f"{SAMPLE_SIZE_CONFIDENCE * 100:g}")
+        ttk.Combobox(stats_frame, textvariable=self.sample_confidence_var, values=["90", "95", "99"],
+                    width=5, style='Modern.TCombobox').pack(side=tk.LEFT)
+        
+        ttk.Label(stats_frame, text="Precisão ± (%):",
+                 font=('Segoe UI', 10, 'normal'),
+                 foreground=ModernColors.TEXT_SECONDARY).pack(side=tk.LEFT, padx=(10, 5))
+        self.sample_accuracy_var = tk.StringVar(value=f"{SAMPLE_SIZE_ACCURACY * 100:g}")
+        ttk.Entry(stats_frame, textvariable=self.sample_accuracy_var, width=5,
+                 style='Modern.TEntry').pack(side=tk.LEFT)
+        
+        # Modo aproximado: lê os arquivos em blocos e mantém sketches de quantis
+        approx_frame = ttk.Frame(header_frame)
+        approx_frame.grid(row=1, column=1, sticky="w", padx=(15, 0), pady=(8, 0))
+        
+        self.approx_var = tk.BooleanVar(value=False)
+        approx_check = ttk.Checkbutton(approx_frame, text="≈ Modo aproximado (streaming, sem carregar os dados)",
+                                      variable=self.approx_var)
+        approx_check.pack(side=tk.LEFT)
+        
+        ttk.Label(approx_frame, text="Erro máx. (%):",
+                 font=('Segoe UI', 10, 'normal'),
+                 foreground=ModernColors.TEXT_SECONDARY).pack(side=tk.LEFT, padx=(10, 5))
+        self.approx_error_var = tk.StringVar(value="1.0")
+        ttk.Entry(approx_frame, textvariable=self.approx_error_var, width=6,
+                 style='Modern.TEntry').pack(side=tk.LEFT)
+        
+        # Análise no banco: agregações e quartis calculados pelo SQLite sobre os registros gravados
+        self.sql_var = tk.BooleanVar(value=False)
+        sql_check = ttk.Checkbutton(header_frame, text="🗄️ Calcular no banco SQLite (sem carregar os tempos)",
+                                   variable=self.sql_var)
+        sql_check.grid(row=3, column=0, columnspan=2, sticky="w", pady=(8, 0))
+        
         # Status da análise
         self.analysis_status = ttk.Label(header_frame, text="Pronto para análise",
                                         font=('Segoe UI', 10, 'normal'),
                                         foreground=ModernColors.TEXT_SECONDARY)
-        self.analysis_status.grid(row=0, column=1, sticky="e")
+        self.analysis_status.grid(row=0, column=2, sticky="e")
+        
+        # Tabela de resultados e box plots, com divisória ajustável
+        results_panes = ttk.PanedWindow(content, orient=tk.VERTICAL)
+        results_panes.grid(row=1, column=0, sticky="nsew")
         
         # Frame da Tabela de resultados
-        table_frame = ttk.LabelFrame(content, text="📈 Resultados Estatísticos Detalhados", style='Modern.TLabelframe')
-        table_frame.grid(row=1, column=0, sticky="nsew")
+        table_frame = ttk.LabelFrame(results_panes, text="📈 Resultados Estatísticos Detalhados", style='Modern.TLabelframe')
+        results_panes.add(table_frame, weight=3)
         table_frame.grid_rowconfigure(0, weight=1)
         table_frame.grid_columnconfigure(0, weight=1)
         
@@ -738,7 +862,8 @@ class TimeStudyAnalyzer:
         cols = (
             "n", "std_dev", "min", "max", "median", "q1", "q3", "iqr", 
             "lower_fence", "upper_fence", "outlier_count", "non_outlier_count",
-            "mean_all", "mean_no_outliers", "time_non_norm", "time_norm"
+            "mean_all", "mean_no_outliers", "time_non_norm", "time_norm", "standard_time",
+            "median_ci", "time_norm_ci", "required_n"
         )
         
         self.results_tree = ttk.Treeview(table_frame, columns=cols, show="tree headings", style='Modern.Treeview')
@@ -760,7 +885,11 @@ class TimeStudyAnalyzer:
             "mean_all": ("📊 Média Geral", 100),
             "mean_no_outliers": ("📈 Média s/ Out.", 100),
             "time_non_norm": ("⏱️ T. Não Norm. (min)", 130),
-            "time_norm": ("✨ T. Norm. (min)", 120)
+            "time_norm": ("✨ T. Norm. (min)", 120),
+            "standard_time": ("⏳ T. Padrão (min)", 120),
+            "median_ci": ("🎯 IC Mediana", 150),
+            "time_norm_ci": ("📏 IC T. Norm. (min)", 150),
+            "required_n": ("📐 N Necessário", 110)
         }
         
         self.results_tree.heading("#0", text="🏷️ Atividade/Grupo")
@@ -785,6 +914,31 @@ class TimeStudyAnalyzer:
         results_h_scroll = ttk.Scrollbar(table_frame, orient="horizontal", command=self.results_tree.xview)
         results_h_scroll.grid(row=1, column=0, sticky="ew", padx=10)
         self.results_tree.configure(xscrollcommand=results_h_scroll.set)
+        
+        # Box plots desenhados a partir das estatísticas já calculadas
+        chart_frame = ttk.LabelFrame(results_panes, text="📦 Box Plots", style='Modern.TLabelframe')
+        results_panes.add(chart_frame, weight=2)
+        chart_frame.grid_rowconfigure(1, weight=1)
+        chart_frame.grid_columnconfigure(0, weight=1)
+        
+        chart_btn_frame = ttk.Frame(chart_frame)
+        chart_btn_frame.grid(row=0, column=0, sticky="ew", padx=10, pady=(10, 0))
+        
+        box_plot_btn = ttk.Button(chart_btn_frame, text="📦 Gerar Box Plot",
+                                 command=self.show_box_plots, style='Secondary.TButton')
+        box_plot_btn.pack(side=tk.LEFT)
+        
+        self.chart_status = ttk.Label(chart_btn_frame,
+                                     text="Selecione grupos/atividades na tabela (nenhum = todos os grupos)",
+                                     font=('Segoe UI', 10, 'normal'),
+                                     foreground=ModernColors.TEXT_SECONDARY)
+        self.chart_status.pack(side=tk.LEFT, padx=(15, 0))
+        
+        self.box_figure = Figure(figsize=(8, 3), dpi=100, constrained_layout=True)
+        self.box_axes = self.box_figure.add_subplot(111)
+        self.box_axes.set_axis_off()
+        self.box_canvas = FigureCanvasTkAgg(self.box_figure, master=chart_frame)
+        self.box_canvas.get_tk_widget().grid(row=1, column=0, sticky="nsew", padx=10, pady=10)
 
     def create_modern_export_tab(self):
         """Aba de exportação com design moderno"""
@@ -826,7 +980,17 @@ class TimeStudyAnalyzer:
                               font=('Segoe UI', 10, 'normal'),
                               foreground=ModernColors.TEXT_SECONDARY,
                               justify=tk.CENTER)
-        excel_desc.pack(pady=(5, 15))
+        excel_desc.pack(pady=(5, 10))
+        
+        # Layout das amostras: largo (Amostra 1..N) ou longo, para estudos acima do limite de colunas
+        self.sample_layout_combo = ttk.Combobox(excel_content, state="readonly", style='Modern.TCombobox',
+                                                values=list(SAMPLE_LAYOUTS.values()), width=32)
+        self.sample_layout_combo.current(list(SAMPLE_LAYOUTS).index(DEFAULT_SAMPLE_LAYOUT))
+        self.sample_layout_combo.pack(pady=(0, 5))
+        
+        self.highlight_outliers_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(excel_content, text="🔴 Destacar outliers nas amostras",
+                       variable=self.highlight_outliers_var).pack(pady=(0, 15))
         
         export_excel_btn = ttk.Button(excel_content, text="📊 Exportar Excel",
                                      command=self.export_to_excel, style='Primary.TButton')
@@ -849,15 +1013,48 @@ class TimeStudyAnalyzer:
                              foreground=ModernColors.TEXT_PRIMARY)
         csv_title.pack()
         
-        csv_desc = ttk.Label(csv_content, text="Exporta dados brutos\nem formato CSV",
+        csv_desc = ttk.Label(csv_content, text="Exporta dados brutos\ncom grupos e unificações",
                             font=('Segoe UI', 10, 'normal'),
                             foreground=ModernColors.TEXT_SECONDARY,
                             justify=tk.CENTER)
-        csv_desc.pack(pady=(5, 15))
+        csv_desc.pack(pady=(5, 10))
+        
+        # Compressão opcional do CSV
+        self.csv_compression_combo = ttk.Combobox(csv_content, state="readonly", style='Modern.TCombobox',
+                                                  values=[label for label, _ in CSV_COMPRESSIONS.values()],
+                                                  width=20)
+        self.csv_compression_combo.current(list(CSV_COMPRESSIONS).index(DEFAULT_CSV_COMPRESSION))
+        self.csv_compression_combo.pack(pady=(0, 15))
+        
+        self.export_csv_btn = ttk.Button(csv_content, text="📄 Exportar CSV",
+                                        command=self.export_to_csv, style='Secondary.TButton')
+        self.export_csv_btn.pack()
         
-        export_csv_btn = ttk.Button(csv_content, text="📄 Exportar CSV",
-                                   command=self.export_to_csv, style='Secondary.TButton')
-        export_csv_btn.pack()
+        # Card Parquet/Arrow
+        columnar_card = ttk.Frame(options_frame, style='Card.TFrame', relief='solid', borderwidth=1)
+        columnar_card.grid(row=0, column=2, padx=(20, 0), pady=10, sticky="nsew")
+        
+        columnar_content = ttk.Frame(columnar_card)
+        columnar_content.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        columnar_icon = ttk.Label(columnar_content, text="🗃️", font=('Segoe UI', 24, 'normal'),
+                                 foreground=ModernColors.ACCENT)
+        columnar_icon.pack(pady=(0, 10))
+        
+        columnar_title = ttk.Label(columnar_content, text="Parquet / Arrow",
+                                  font=('Segoe UI', 14, 'bold'),
+                                  foreground=ModernColors.TEXT_PRIMARY)
+        columnar_title.pack()
+        
+        columnar_desc = ttk.Label(columnar_content, text="Amostras e métricas numéricas\ntipadas para BI",
+                                 font=('Segoe UI', 10, 'normal'),
+                                 foreground=ModernColors.TEXT_SECONDARY,
+                                 justify=tk.CENTER)
+        columnar_desc.pack(pady=(5, 15))
+        
+        export_columnar_btn = ttk.Button(columnar_content, text="🗃️ Exportar Parquet/Arrow",
+                                        command=self.export_to_columnar, style='Secondary.TButton')
+        export_columnar_btn.pack()
         
         # Status da exportação
         status_frame = ttk.Frame(content)
@@ -886,23 +1083,44 @@ class TimeStudyAnalyzer:
         )
         
         new_files = 0
+        duplicates = []
+        loaded_hashes = {content_hash: path for path, content_hash in self.file_hashes.items()}
         for file_path in files:
-            if file_path not in self.uploaded_files:
-                self.uploaded_files.append(file_path)
-                filename = os.path.basename(file_path)
-                self.file_listbox.insert(tk.END, f"📄 {filename}")
-                new_files += 1
+            if file_path in self.uploaded_files:
+                continue
+            # O mesmo conteúdo em outra pasta (ou baixado de novo) não entra duas vezes
+            try:
+                content_hash = file_content_hash(file_path)
+            except OSError as e:
+                messagebox.showerror("❌ Erro", f"Erro ao ler arquivo {os.path.basename(file_path)}:\n{str(e)}")
+                continue
+            if content_hash in loaded_hashes:
+                duplicates.append((file_path, loaded_hashes[content_hash]))
+                continue
+            loaded_hashes[content_hash] = file_path
+            self.file_hashes[file_path] = content_hash
+            self.uploaded_files.append(file_path)
+            self.file_listbox.insert(tk.END, self._file_label(file_path))
+            new_files += 1
         
         # Atualizar status
         total_files = len(self.uploaded_files)
+        duplicates_text = f" • {len(duplicates)} duplicado(s) ignorado(s)" if duplicates else ""
         if total_files == 0:
             self.upload_status.config(text="Nenhum arquivo selecionado", foreground=ModernColors.TEXT_SECONDARY)
         elif new_files > 0:
-            self.upload_status.config(text=f"✅ {total_files} arquivo(s) carregado(s) (+{new_files} novo(s))", 
+            self.upload_status.config(text=f"✅ {total_files} arquivo(s) carregado(s) (+{new_files} novo(s))"
+                                           f"{duplicates_text}", 
                                     foreground=ModernColors.SUCCESS)
         else:
-            self.upload_status.config(text=f"✅ {total_files} arquivo(s) carregado(s)", 
+            self.upload_status.config(text=f"✅ {total_files} arquivo(s) carregado(s){duplicates_text}", 
                                     foreground=ModernColors.SUCCESS)
+        if duplicates:
+            details = "\n".join(f"• {os.path.basename(path)} = {os.path.basename(original)}"
+                                for path, original in duplicates[:10])
+            messagebox.showinfo("ℹ️ Arquivos Duplicados",
+                               f"{len(duplicates)} arquivo(s) com conteúdo idêntico a um já carregado "
+                               f"foram ignorados:\n\n{details}")
                 
         self.update_preview()
         self.update_column_combos()
@@ -915,12 +1133,72 @@ class TimeStudyAnalyzer:
                                        icon='question')
             if result:
                 self.uploaded_files.clear()
+                self.disabled_files.clear()
+                self.file_summaries.clear()
+                self.file_hashes.clear()
+                self._records_in_database = False
                 self.file_listbox.delete(0, tk.END)
                 self.upload_status.config(text="Nenhum arquivo selecionado", foreground=ModernColors.TEXT_SECONDARY)
                 self.clear_preview()
         else:
             messagebox.showinfo("ℹ️ Informação", "Não há arquivos para limpar.")
             
+    def _file_label(self, file_path):
+        """Texto do arquivo na lista (arquivos desativados ficam marcados)"""
+        filename = os.path.basename(file_path)
+        if file_path in self.disabled_files:
+            return f"⏸️ {filename} (desativado)"
+        return f"📄 {filename}"
+
+    def _selected_file(self):
+        """Arquivo selecionado na lista (ou None com aviso)"""
+        selection = self.file_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("⚠️ Aviso", "Selecione um arquivo na lista")
+            return None
+        return self.uploaded_files[selection[0]]
+
+    def remove_selected_file(self):
+        """Remover um arquivo; apenas as atividades dele são recalculadas"""
+        file_path = self._selected_file()
+        if file_path is None:
+            return
+        
+        index = self.uploaded_files.index(file_path)
+        self.uploaded_files.pop(index)
+        self.file_listbox.delete(index)
+        was_enabled = file_path not in self.disabled_files
+        self.disabled_files.discard(file_path)
+        summary = self.file_summaries.pop(file_path, None)
+        self.file_hashes.pop(file_path, None)
+        
+        self.upload_status.config(text=f"✅ {len(self.uploaded_files)} arquivo(s) carregado(s) (-1 removido)",
+                                foreground=ModernColors.SUCCESS)
+        if index == 0:
+            self.update_preview()
+        if summary is not None and was_enabled:
+            self._rebuild_corpus(summary.activities)
+
+    def toggle_selected_file(self):
+        """Incluir ou excluir um arquivo da análise sem reprocessar os demais"""
+        file_path = self._selected_file()
+        if file_path is None:
+            return
+        
+        if file_path in self.disabled_files:
+            self.disabled_files.discard(file_path)
+        else:
+            self.disabled_files.add(file_path)
+        
+        index = self.uploaded_files.index(file_path)
+        self.file_listbox.delete(index)
+        self.file_listbox.insert(index, self._file_label(file_path))
+        self.file_listbox.selection_set(index)
+        
+        summary = self.file_summaries.get(file_path)
+        if summary is not None:
+            self._rebuild_corpus(summary.activities)
+
     def update_preview(self):
         """Atualizar preview dos dados com melhor tratamento de erros"""
         if not self.uploaded_files:
@@ -990,140 +1268,211 @@ class TimeStudyAnalyzer:
         except Exception as e:
             messagebox.showerror("❌ Erro", f"Erro ao ler colunas: {str(e)}")
 
-    def process_data(self):
-        """Processar dados dos arquivos com melhor feedback visual e filtro de retrabalho"""
-        if not self.uploaded_files:
-            messagebox.showwarning("⚠️ Aviso", "Nenhum arquivo selecionado")
-            return
-            
+    def _selected_columns(self):
+        """Colunas escolhidas no mapeamento (atividade, tempo, retrabalho) sem os ícones"""
         activity_col_display = self.activity_combo.get()
         time_col_display = self.time_combo.get()
         rework_col_display = self.rework_combo.get()
         
         if not activity_col_display or not time_col_display:
             messagebox.showwarning("⚠️ Aviso", "Selecione as colunas de atividade e tempo")
-            return
+            return None
         
         # Remover ícones dos nomes das colunas
         activity_col = activity_col_display.replace("📊 ", "")
         time_col = time_col_display.replace("📊 ", "")
         rework_col = rework_col_display.replace("📊 ", "") if rework_col_display else None
-            
+        return activity_col, time_col, rework_col
+
+    def _read_file(self, file_path, activity_col):
+        """
+        Ler um arquivo Excel ou CSV inteiro, tentando codificações comuns no CSV.
+
+        A coluna de atividade é lida como texto, como na leitura em blocos
+        (_iter_file_chunks): uma coluna numérica com células vazias viraria
+        float e '101' apareceria como '101.0' só na análise exata.
+        """
+        dtype = {activity_col: str}
+        if file_path.endswith('.xlsx'):
+            return pd.read_excel(file_path, dtype=dtype)
+        try:
+            return pd.read_csv(file_path, encoding='utf-8', dtype=dtype)
+        except UnicodeDecodeError:
+            try:
+                return pd.read_csv(file_path, encoding='latin1', dtype=dtype)
+            except UnicodeDecodeError:
+                return pd.read_csv(file_path, encoding='cp1252', dtype=dtype)
+
+    def _clean_file_data(self, df, activity_col, time_col, rework_col, source_name):
+        """Selecionar e limpar as colunas de um arquivo (ou bloco); retorna (dados, linhas de retrabalho)"""
+        # Verificar se as colunas obrigatórias existem
+        if activity_col not in df.columns or time_col not in df.columns:
+            missing_cols = []
+            if activity_col not in df.columns:
+                missing_cols.append(activity_col)
+            if time_col not in df.columns:
+                missing_cols.append(time_col)
+            print(f"Colunas não encontradas no arquivo {source_name}: {missing_cols}")
+            return None, 0
+        
+        rework_filtered_count = 0
+        
+        # Selecionar colunas necessárias
+        cols_to_select = [activity_col, time_col]
+        if rework_col and rework_col in df.columns:
+            cols_to_select.append(rework_col)
+            data = df[cols_to_select].copy()
+            data.columns = ['Atividade', 'Tempo', 'Retrabalho']
+        else:
+            data = df[cols_to_select].copy()
+            data.columns = ['Atividade', 'Tempo']
+        
+        # Aplicar filtro de retrabalho ANTES da limpeza geral
+        if rework_col and rework_col in df.columns:
+            before_filter = len(data)
+            # Filtrar linhas onde retrabalho é 1 (excluir essas linhas)
+            # Considerar também valores como "1", 1.0, True como retrabalho
+            data['Retrabalho'] = data['Retrabalho'].astype(str).str.strip()
+            rework_mask = data['Retrabalho'].isin(['1', '1.0', 'True', 'true', 'TRUE'])
+            data = data[~rework_mask]  # Manter apenas as que NÃO são retrabalho
+            after_filter = len(data)
+            rework_filtered_count = before_filter - after_filter
+            
+            # Remover a coluna de retrabalho após o filtro
+            data = data[['Atividade', 'Tempo']]
+        
+        # Limpeza de dados padrão
+        data.dropna(subset=['Atividade', 'Tempo'], how='any', inplace=True)
+        data['Atividade'] = data['Atividade'].astype(str).str.strip()
+        data = data[data['Atividade'] != '']
+        return data, rework_filtered_count
+
+    @staticmethod
+    def _convert_time(time_val):
+        """Converter um valor da coluna de tempo para segundos"""
+        if pd.isna(time_val): return None
+        if isinstance(time_val, (int, float)): return float(time_val)
+        
+        time_str = str(time_val).strip()
+        if ':' in time_str:
+            try:
+                parts = time_str.split(':')
+                total_seconds = 0
+                if len(parts) == 3: # HH:MM:SS
+                    total_seconds = float(parts[0])*3600 + float(parts[1])*60 + float(parts[2])
+                elif len(parts) == 2: # MM:SS
+                    total_seconds = float(parts[0])*60 + float(parts[1])
+                return total_seconds
+            except (ValueError, IndexError):
+                return None
+        try:
+            return float(time_str.replace(',', '.'))
+        except ValueError:
+            return None
+
+    def _summarize_file(self, file_path, activity_col, time_col, rework_col):
+        """Ler, limpar e resumir um arquivo (None se faltarem colunas)"""
+        df = self._read_file(file_path, activity_col)
+        data, rework_filtered = self._clean_file_data(df, activity_col, time_col, rework_col,
+                                                      os.path.basename(file_path))
+        if data is None:
+            return None
+        
+        # Aplicar conversão de tempo e remover falhas, tempos negativos ou zero
+        cleaned_count = len(data)
+        data['Tempo'] = data['Tempo'].apply(self._convert_time)
+        data = data.dropna(subset=['Tempo'])
+        data = data[data['Tempo'] > 0]
+        return FileSummary(file_path, data, rows_read=len(df), rework_filtered=rework_filtered,
+                           invalid_removed=cleaned_count - len(data))
+
+    def _stored_summary(self, file_path, columns):
+        """Resumo refeito a partir dos registros já gravados para o mesmo conteúdo (ou None)"""
         try:
-            all_data = []
-            total_rows_read = 0
-            files_processed = 0
-            rework_filtered_count = 0  # Contador de linhas filtradas por retrabalho
+            entry = self.session_store.load_parsed_file(self.file_hashes.get(file_path), columns)
+        except Exception as e:
+            print(f"Registros gravados indisponíveis para {os.path.basename(file_path)}: {str(e)}")
+            return None
+        if entry is None:
+            return None
+        return FileSummary(file_path, entry['data'], rows_read=entry['rows_read'],
+                           rework_filtered=entry['rework_filtered'], invalid_removed=entry['invalid_removed'])
+
+    def _active_summaries(self):
+        """Resumos dos arquivos ativos, na ordem de upload"""
+        return [self.file_summaries[file_path] for file_path in self.uploaded_files
+                if file_path in self.file_summaries and file_path not in self.disabled_files]
+
+    def _rebuild_corpus(self, changed_activities=None):
+        """
+        Refazer o conjunto de dados a partir dos resumos por arquivo.
+
+        Com `changed_activities` (as do arquivo adicionado, removido ou
+        alternado), só essas atividades são intercaladas de novo e o cache de
+        métricas recalcula só elas.
+        """
+        summaries = self._active_summaries()
+        self.processed_data = ColumnStore(summaries) if summaries else None
+        base = self.metrics_cache.base if changed_activities is not None else None
+        self.metrics_cache.set_base(merge_file_summaries(summaries, base, changed_activities), changed_activities)
+        
+        self.update_processed_preview()
+        self.update_available_activities()
+
+    def process_data(self):
+        """Processar dados dos arquivos com melhor feedback visual e filtro de retrabalho"""
+        if not self.uploaded_files:
+            messagebox.showwarning("⚠️ Aviso", "Nenhum arquivo selecionado")
+            return
             
+        columns = self._selected_columns()
+        if columns is None:
+            return
+        activity_col, time_col, rework_col = columns
+        
+        # Resumos feitos com outro mapeamento de colunas não servem mais
+        incremental = columns == self._summary_columns and bool(self.file_summaries)
+        if columns != self._summary_columns:
+            self.file_summaries.clear()
+            self._summary_columns = columns
+            
+        try:
+            # Ler apenas os arquivos que ainda não têm resumo
+            new_files = 0
+            changed_activities = set()
             for file_path in self.uploaded_files:
+                if file_path in self.file_summaries:
+                    continue
                 try:
-                    # Ler arquivo
-                    if file_path.endswith('.xlsx'):
-                        df = pd.read_excel(file_path)
-                    else:
-                        try:
-                            df = pd.read_csv(file_path, encoding='utf-8')
-                        except UnicodeDecodeError:
-                            try:
-                                df = pd.read_csv(file_path, encoding='latin1')
-                            except UnicodeDecodeError:
-                                df = pd.read_csv(file_path, encoding='cp1252')
-                    
-                    total_rows_read += len(df)
-                    
-                    # Verificar se as colunas obrigatórias existem
-                    if activity_col in df.columns and time_col in df.columns:
-                        # Selecionar colunas necessárias
-                        cols_to_select = [activity_col, time_col]
-                        if rework_col and rework_col in df.columns:
-                            cols_to_select.append(rework_col)
-                            data = df[cols_to_select].copy()
-                            data.columns = ['Atividade', 'Tempo', 'Retrabalho']
-                        else:
-                            data = df[cols_to_select].copy()
-                            data.columns = ['Atividade', 'Tempo']
-                        
-                        # Aplicar filtro de retrabalho ANTES da limpeza geral
-                        if rework_col and rework_col in df.columns:
-                            before_filter = len(data)
-                            # Filtrar linhas onde retrabalho é 1 (excluir essas linhas)
-                            # Considerar também valores como "1", 1.0, True como retrabalho
-                            data['Retrabalho'] = data['Retrabalho'].astype(str).str.strip()
-                            rework_mask = data['Retrabalho'].isin(['1', '1.0', 'True', 'true', 'TRUE'])
-                            data = data[~rework_mask]  # Manter apenas as que NÃO são retrabalho
-                            after_filter = len(data)
-                            rework_filtered_count += (before_filter - after_filter)
-                            
-                            # Remover a coluna de retrabalho após o filtro
-                            data = data[['Atividade', 'Tempo']]
-                        
-                        # Limpeza de dados padrão
-                        data.dropna(subset=['Atividade', 'Tempo'], how='any', inplace=True)
-                        data['Atividade'] = data['Atividade'].astype(str).str.strip()
-                        data = data[data['Atividade'] != '']
-                        
-                        if not data.empty:
-                            all_data.append(data)
-                            files_processed += 1
-                    else:
-                        missing_cols = []
-                        if activity_col not in df.columns:
-                            missing_cols.append(activity_col)
-                        if time_col not in df.columns:
-                            missing_cols.append(time_col)
-                        print(f"Colunas não encontradas no arquivo {os.path.basename(file_path)}: {missing_cols}")
-
+                    summary = self._stored_summary(file_path, columns)
+                    if summary is None:
+                        summary = self._summarize_file(file_path, activity_col, time_col, rework_col)
+                    if summary is not None:
+                        self.file_summaries[file_path] = summary
+                        changed_activities.update(summary.activities)
+                        new_files += 1
                 except Exception as e:
                     print(f"Erro ao processar arquivo {os.path.basename(file_path)}: {str(e)}")
                     continue
             
-            if not all_data:
+            summaries = self._active_summaries()
+            if not summaries:
                 messagebox.showerror("❌ Erro", "Nenhum dado válido pôde ser extraído dos arquivos.\nVerifique se as colunas selecionadas estão corretas e contêm dados.")
                 return
 
-            # Concatenar todos os dados limpos
-            self.processed_data = pd.concat(all_data, ignore_index=True)
-            original_count = len(self.processed_data)
-            
-            # Função para converter a coluna de tempo para segundos
-            def convert_time(time_val):
-                if pd.isna(time_val): return None
-                if isinstance(time_val, (int, float)): return float(time_val)
-                
-                time_str = str(time_val).strip()
-                if ':' in time_str:
-                    try:
-                        parts = time_str.split(':')
-                        total_seconds = 0
-                        if len(parts) == 3: # HH:MM:SS
-                            total_seconds = float(parts[0])*3600 + float(parts[1])*60 + float(parts[2])
-                        elif len(parts) == 2: # MM:SS
-                            total_seconds = float(parts[0])*60 + float(parts[1])
-                        return total_seconds
-                    except (ValueError, IndexError):
-                        return None
-                try:
-                    return float(time_str.replace(',', '.'))
-                except ValueError:
-                    return None
-
-            # Aplicar conversão de tempo e remover falhas
-            self.processed_data['Tempo'] = self.processed_data['Tempo'].apply(convert_time)
-            self.processed_data.dropna(subset=['Tempo'], inplace=True)
-            
-            # Remover tempos negativos ou zero
-            self.processed_data = self.processed_data[self.processed_data['Tempo'] > 0]
+            self._rebuild_corpus(changed_activities if incremental else None)
+            self._records_in_database = False
             
+            files_processed = len(summaries)
+            total_rows_read = sum(summary.rows_read for summary in summaries)
+            rework_filtered_count = sum(summary.rework_filtered for summary in summaries)
+            removed_count = sum(summary.invalid_removed for summary in summaries)
             final_count = len(self.processed_data)
-            removed_count = original_count - final_count
 
             if final_count > 0:
-                self.update_processed_preview()
-                self.update_available_activities()
-                
                 # Mensagem de sucesso com informações sobre retrabalho
                 success_message = (f"Dados processados com sucesso!\n\n"
-                                 f"📁 {files_processed} arquivo(s) processado(s)\n"
+                                 f"📁 {files_processed} arquivo(s) processado(s) ({new_files} lido(s) agora)\n"
                                  f"📊 {total_rows_read} linha(s) lida(s) no total\n")
                 
                 if rework_col:
@@ -1140,6 +1489,139 @@ class TimeStudyAnalyzer:
             messagebox.showerror("❌ Erro", f"Erro geral ao processar dados:\n{str(e)}")
             print(f"Erro detalhado: {str(e)}")
 
+    def _session_store(self, db_path):
+        """Banco de sessão escolhido (o padrão reaproveita o já aberto)"""
+        if os.path.abspath(db_path) == os.path.abspath(self.session_store.db_path):
+            return self.session_store
+        return SessionStore(db_path)
+
+    def _write_session(self, store):
+        """Gravar a sessão atual no banco (só os conteúdos ainda não gravados); retorna (gravados, reaproveitados)"""
+        settings = {
+            'summary_columns': list(self._summary_columns) if self._summary_columns else None,
+            'analysis_settings': self.analysis_settings,
+        }
+        return store.save_session(self.uploaded_files, self.disabled_files, self.file_summaries, self.file_hashes,
+                                  self._summary_columns, self.unified_activities, self.activity_groups,
+                                  self.activity_factors, settings, self.analysis_results,
+                                  keep_stored_records=self._records_in_database)
+
+    def _use_session(self, store):
+        """Adotar o banco escolhido pelo usuário como o da sessão (análise pelo SQLite e registros gravados)"""
+        self.session_store = store
+        self.session_path = store.db_path
+
+    def save_session(self):
+        """Gravar arquivos processados, unificações, grupos, fatores e resultados no banco"""
+        if not self.uploaded_files:
+            messagebox.showwarning("⚠️ Aviso", "Nenhum arquivo selecionado")
+            return
+
+        db_path = filedialog.asksaveasfilename(
+            title="💾 Salvar sessão",
+            defaultextension=".db",
+            initialfile=os.path.basename(self.db_path),
+            filetypes=[("Banco SQLite", "*.db"), ("Todos os arquivos", "*.*")]
+        )
+        if not db_path:
+            return
+        store = self._session_store(db_path)
+        if self._records_in_database and store is not self.session_store:
+            messagebox.showwarning("⚠️ Aviso", "Os registros desta sessão estão só no banco aberto.\n"
+                                              "Processe os dados antes de salvar em outro banco.")
+            return
+
+        try:
+            self.upload_status.config(text="💾 Salvando sessão...", foreground=ModernColors.WARNING)
+            written, reused = self._write_session(store)
+            self._use_session(store)
+
+            self.upload_status.config(text=f"💾 Sessão salva • {written + reused} registro(s)",
+                                    foreground=ModernColors.SUCCESS)
+            messagebox.showinfo("✅ Sucesso", f"Sessão salva em:\n{db_path}\n\n"
+                                             f"📁 {len(self.uploaded_files)} arquivo(s)\n"
+                                             f"📊 {written} registro(s) gravado(s)\n"
+                                             f"♻️ {reused} registro(s) já gravado(s) reaproveitado(s)")
+        except Exception as e:
+            self.upload_status.config(text="❌ Erro ao salvar sessão", foreground=ModernColors.ERROR)
+            messagebox.showerror("❌ Erro", f"Erro ao salvar sessão:\n{str(e)}")
+
+    def open_session(self):
+        """Reabrir uma sessão gravada sem reler os arquivos originais"""
+        db_path = filedialog.askopenfilename(
+            title="📂 Abrir sessão",
+            initialfile=os.path.basename(self.db_path),
+            filetypes=[("Banco SQLite", "*.db"), ("Todos os arquivos", "*.*")]
+        )
+        if not db_path:
+            return
+        if self.uploaded_files and not messagebox.askyesno(
+                "📂 Confirmar", "Abrir a sessão substitui os arquivos, grupos e resultados atuais. Continuar?",
+                icon='question'):
+            return
+
+        # Com o cálculo no banco marcado, os registros não são carregados: a análise roda sobre o próprio banco
+        in_database = self.sql_var.get()
+        try:
+            store = self._session_store(db_path)
+            session = store.load_session(include_records=not in_database)
+        except Exception as e:
+            messagebox.showerror("❌ Erro", f"Erro ao abrir sessão:\n{str(e)}")
+            return
+        if session is None:
+            messagebox.showinfo("ℹ️ Informação", "Não há sessão salva neste banco.")
+            return
+
+        self._use_session(store)
+        self._records_in_database = in_database and any(entry['processed'] for entry in session['files'])
+        self._restore_session(session)
+        total_records = sum(entry['records'] for entry in session['files'] if entry['enabled'])
+        self.upload_status.config(text=f"📂 Sessão aberta • {len(self.uploaded_files)} arquivo(s) • "
+                                       f"{total_records} registro(s)"
+                                       f"{' 🗄️ mantidos no banco' if self._records_in_database else ''}",
+                                  foreground=ModernColors.SUCCESS)
+
+    def _restore_session(self, session):
+        """Substituir o estado atual pelo de uma sessão lida do banco"""
+        files = session['files']
+        settings = session['settings']
+        columns = settings.get('summary_columns')
+
+        self.uploaded_files = [entry['path'] for entry in files]
+        self.disabled_files = {entry['path'] for entry in files if not entry['enabled']}
+        self.file_hashes = {entry['path']: entry['content_hash'] for entry in files if entry['content_hash']}
+        self.file_summaries = {entry['path']: FileSummary(entry['path'], entry['data'], rows_read=entry['rows_read'],
+                                                          rework_filtered=entry['rework_filtered'],
+                                                          invalid_removed=entry['invalid_removed'])
+                               for entry in files if entry['data'] is not None}
+        self._summary_columns = tuple(columns) if columns else None
+        self.unified_activities = session['unified_activities']
+        self.activity_groups = session['activity_groups']
+        self.activity_factors = session['activity_factors']
+        self.analysis_settings = settings.get('analysis_settings', {})
+        self.fence_explorer = None
+        self._results_in_memory = False
+
+        self.file_listbox.delete(0, tk.END)
+        for file_path in self.uploaded_files:
+            self.file_listbox.insert(tk.END, self._file_label(file_path))
+        # Os arquivos originais podem não estar mais disponíveis
+        if self.uploaded_files and os.path.exists(self.uploaded_files[0]):
+            self.update_preview()
+            self.update_column_combos()
+        else:
+            self.clear_preview()
+        if self._summary_columns:
+            activity_col, time_col, rework_col = self._summary_columns
+            self.activity_combo.set(f"📊 {activity_col}")
+            self.time_combo.set(f"📊 {time_col}")
+            self.rework_combo.set(f"📊 {rework_col}" if rework_col else "")
+
+        self._rebuild_corpus()
+        self.update_group_tree()
+        self.analysis_results = session['results']
+        self.populate_results_tree()
+
     def update_processed_preview(self):
         """Atualizar preview dos dados processados com ícones"""
         for item in self.processed_tree.get_children():
@@ -1154,19 +1636,17 @@ class TimeStudyAnalyzer:
         self.available_listbox.delete(0, tk.END)
         
         if self.processed_data is not None:
-            unique_activities = self.processed_data['Atividade'].unique()
+            activity_counts = self._activity_counts()
             
             # Atividades que já estão em grupos
             grouped_activities = set()
-            for group_data in self.activity_groups.values():
+            for group_data in MetricsCache.resolve_groups(self.activity_groups, self.unified_activities).values():
                 grouped_activities.update(group_data['activities'])
             
             # Adicionar apenas atividades que não estão em grupos
             available_count = 0
-            for activity in sorted(unique_activities):
+            for activity, count in activity_counts.items():
                 if activity not in grouped_activities:
-                    # Contar ocorrências da atividade
-                    count = len(self.processed_data[self.processed_data['Atividade'] == activity])
                     self.available_listbox.insert(tk.END, f"📊 {activity} ({count})")
                     available_count += 1
             
@@ -1180,6 +1660,28 @@ class TimeStudyAnalyzer:
                 total_grouped = sum(len(data['activities']) for data in self.activity_groups.values())
                 self.groups_count.config(text=f"{group_count} grupo(s) • {total_grouped} atividade(s) agrupada(s)")
                     
+    def _activity_counts(self):
+        """Número de registros por atividade (já com as unificações aplicadas), em ordem alfabética"""
+        counts = self.processed_data.activity_counts()
+        if self.unified_activities:
+            counts = counts.groupby(lambda activity: self.unified_activities.get(activity, activity)).sum()
+        return counts.sort_index()
+
+    def _store_unification(self, activity1, activity2, chosen_name):
+        """
+        Registrar a unificação de duas atividades em `chosen_name`.
+
+        O mapeamento é aplicado em um único passo (nome original -> unificado):
+        entradas que apontavam para uma das duas passam a apontar para o novo
+        nome, para que unificações encadeadas não percam registros.
+        """
+        chosen_name = self.unified_activities.get(chosen_name, chosen_name)
+        redirected = [original for original, unified in self.unified_activities.items()
+                      if unified in (activity1, activity2)]
+        for original in redirected + [activity1, activity2]:
+            self.unified_activities[original] = chosen_name
+        self.metrics_cache.mark_activities_dirty(redirected + [activity1, activity2, chosen_name])
+
     def detect_similarities(self):
         """Detectar atividades similares com melhor feedback"""
         if self.processed_data is None:
@@ -1190,7 +1692,8 @@ class TimeStudyAnalyzer:
         for item in self.similarity_tree.get_children():
             self.similarity_tree.delete(item)
             
-        unique_activities = list(self.processed_data['Atividade'].unique())
+        activity_counts = self._activity_counts()
+        unique_activities = list(activity_counts.index)
         similarities = []
         
         for i, activity1 in enumerate(unique_activities):
@@ -1205,8 +1708,8 @@ class TimeStudyAnalyzer:
         # Adicionar similaridades à árvore
         for activity1, activity2, similarity in similarities:
             # Adicionar contagem de ocorrências
-            count1 = len(self.processed_data[self.processed_data['Atividade'] == activity1])
-            count2 = len(self.processed_data[self.processed_data['Atividade'] == activity2])
+            count1 = activity_counts[activity1]
+            count2 = activity_counts[activity2]
             
             display_text = f"{activity1} ({count1}) ↔ {activity2} ({count2})"
             
@@ -1331,14 +1834,8 @@ class TimeStudyAnalyzer:
                                 messagebox.showerror("❌ Erro", "Digite um nome personalizado")
                                 return
                         
-                        # Realizar unificação
-                        self.processed_data.loc[self.processed_data['Atividade'] == activity2, 'Atividade'] = chosen_name
-                        if activity1 != chosen_name:
-                            self.processed_data.loc[self.processed_data['Atividade'] == activity1, 'Atividade'] = chosen_name
-                        
-                        # Armazenar unificação
-                        self.unified_activities[activity1] = chosen_name
-                        self.unified_activities[activity2] = chosen_name
+                        # Armazenar unificação (os dados processados ficam com os nomes originais)
+                        self._store_unification(activity1, activity2, chosen_name)
                         
                         # Atualizar status do item
                         self.similarity_tree.set(item, "Ação", "✅ Unificada")
@@ -1510,90 +2007,180 @@ class TimeStudyAnalyzer:
         for item in self.group_tree.get_children():
             self.group_tree.delete(item)
         
+        activity_counts = self._activity_counts() if self.processed_data is not None else None
+        
         # Adicionar grupos e suas atividades
         for group_name, group_data in self.activity_groups.items():
             activity_count = len(group_data['activities'])
+            rule_count = len(group_data.get('rules', []))
+            rules_text = f" • 🧩 {rule_count} regra(s)" if rule_count else ""
             # Adicionar grupo principal com contador
             group_item = self.group_tree.insert("", tk.END, 
-                                               text=f"📁 {group_name} ({activity_count} atividade(s))", 
+                                               text=f"📁 {group_name} ({activity_count} atividade(s)){rules_text}"
+                                                    f"{self._factors_text(group_data)}", 
                                                values=(), open=True)
             
             # Adicionar atividades do grupo
             for activity in group_data['activities']:
                 # Contar ocorrências da atividade se os dados estão processados
                 count_text = ""
-                if self.processed_data is not None:
-                    count = len(self.processed_data[self.processed_data['Atividade'] == activity])
+                if activity_counts is not None:
+                    count = activity_counts.get(self.unified_activities.get(activity, activity), 0)
                     count_text = f" ({count})"
                 
+                factors = self.activity_factors.get(self.unified_activities.get(activity, activity), {})
                 self.group_tree.insert(group_item, tk.END, 
-                                     text=f"  📊 {activity}{count_text}", values=())
+                                     text=f"  📊 {activity}{count_text}{self._factors_text(factors)}", values=())
         
         # Atualizar contadores
         self.update_available_activities()
 
+    def _on_outlier_method_changed(self, event=None):
+        """Ao trocar o método, sugerir o multiplicador padrão dele"""
+        method = list(OUTLIER_METHODS)[self.outlier_method_combo.current()]
+        self.fence_multiplier_var.set(str(OUTLIER_METHODS[method][1]))
+        self.fence_scale.configure(to=FENCE_SLIDER_MAX[method])
+        self.fence_scale.set(OUTLIER_METHODS[method][1])
+
+    def _on_fence_slider(self, value):
+        """Controle deslizante: atualizar o multiplicador e simular a análise"""
+        multiplier = round(float(value), 2)
+        self.fence_multiplier_var.set(f"{multiplier:g}")
+        self._preview_fence_multiplier(multiplier)
+
+    def _preview_fence_multiplier(self, multiplier):
+        """
+        Recalcular outliers, médias sem outliers e tempos normalizados da última
+        análise para outro multiplicador, por busca binária nos tempos ordenados.
+        """
+        results = self.analysis_results
+        if results is None or results.empty or not self._results_in_memory:
+            return
+        method = list(OUTLIER_METHODS)[self.outlier_method_combo.current()]
+        if validate_outlier_method(method, multiplier):
+            return
+
+        if self.fence_explorer is None or self.fence_explorer.outlier_method != method:
+            self.fence_explorer = FenceExplorer(self.metrics_cache.result_segments(results), results, method)
+        updated = self.fence_explorer.recompute(multiplier)
+        for col in updated.columns:
+            results[col] = updated[col].to_numpy(dtype=np.float64)
+        # Os intervalos bootstrap dependem dos limites: ficam para a próxima análise
+        results.drop(columns=[col for col in BOOTSTRAP_COLUMNS if col in results.columns], inplace=True)
+        add_standard_times(results, self.activity_groups, self.activity_factors)
+        self.analysis_settings.update({'outlier_method': method, 'fence_multiplier': multiplier})
+        self.analysis_settings.pop('bootstrap', None)
+
+        self._refresh_result_items()
+        self.analysis_status.config(text=f"🎚️ Simulação • outliers: {method} k={multiplier:g} "
+                                         f"(execute a análise para confirmar)",
+                                    foreground=ModernColors.PRIMARY)
+
+    def _outlier_settings(self):
+        """Método de outliers e multiplicador escolhidos (ou None com mensagem de erro)"""
+        method = list(OUTLIER_METHODS)[self.outlier_method_combo.current()]
+        try:
+            multiplier = float(self.fence_multiplier_var.get().replace(',', '.'))
+        except ValueError:
+            multiplier = float('nan')
+        error = validate_outlier_method(method, multiplier)
+        if error:
+            messagebox.showerror("❌ Erro", error)
+            return None
+        return method, multiplier
+
     def perform_analysis(self):
         """Executar análise estatística com feedback visual melhorado"""
-        if self.processed_data is None or self.processed_data.empty:
+        approximate = self.approx_var.get()
+        in_database = self.sql_var.get() and not approximate
+        if approximate and not self.uploaded_files:
+            messagebox.showwarning("⚠️ Aviso", "Nenhum arquivo selecionado")
+            return
+        from_database = in_database and self._records_in_database
+        if not approximate and not from_database and (self.processed_data is None or not len(self.processed_data)):
             messagebox.showwarning("⚠️ Aviso", "Não há dados válidos para analisar. Processe os arquivos primeiro.")
             return
+        
+        settings = self._outlier_settings()
+        if settings is None:
+            return
+        outlier_method, fence_multiplier = settings
+        sample_settings = self._sample_size_settings()
+        if sample_settings is None:
+            return
 
         try:
             # Atualizar status
             if hasattr(self, 'analysis_status'):
                 self.analysis_status.config(text="🔄 Executando análise...", foreground=ModernColors.WARNING)
             
-            # Limpar resultados anteriores
-            for item in self.results_tree.get_children():
-                self.results_tree.delete(item)
+            self.analysis_settings = {'outlier_method': outlier_method, 'fence_multiplier': fence_multiplier}
+            self.fence_explorer = None
+            self._results_in_memory = False
+            if approximate:
+                results = self._approximate_results(outlier_method, fence_multiplier)
+                if results is None:
+                    self.analysis_status.config(text="Pronto para análise", foreground=ModernColors.TEXT_SECONDARY)
+                    return
+                self.analysis_settings['rank_error'] = results['rank_error'].max()
+                self.analysis_results = add_standard_times(results, self.activity_groups, self.activity_factors)
+                under_sampled = self._add_sample_sizes(*sample_settings)
+                self.populate_results_tree()
+                self.analysis_status.config(
+                    text=f"✅ Análise aproximada concluída • {len(results)} item(s) • "
+                         f"erro de posto ≤ ±{results['rank_error'].max():.2%} • "
+                         f"⚠️ {under_sampled} com amostragem insuficiente",
+                    foreground=ModernColors.SUCCESS)
+                messagebox.showinfo("✅ Análise Concluída",
+                                   "A análise aproximada foi concluída!\n\n"
+                                   "≈ Valores marcados derivam de sketches de quantis; o erro de posto "
+                                   "máximo aparece ao lado de cada item.")
+                return
+            
+            if in_database:
+                metrics = self._database_metrics(outlier_method, fence_multiplier)
+                if metrics is None:
+                    self.analysis_status.config(text="Pronto para análise", foreground=ModernColors.TEXT_SECONDARY)
+                    return
+                activity_metrics, group_metrics = metrics
+            else:
+                self.metrics_cache.workers = default_workers() if self.parallel_var.get() else 1
+                
+                # Métricas por atividade (nomes unificados) e por grupo; o cache
+                # recalcula apenas o que mudou desde a última análise
+                activity_metrics, group_metrics = self.metrics_cache.update(self.processed_data,
+                                                                            self.unified_activities,
+                                                                            self.activity_groups,
+                                                                            fence_multiplier, outlier_method)
+                self._results_in_memory = True
+            resolved_groups = MetricsCache.resolve_groups(self.activity_groups, self.unified_activities)
 
-            # Analisar grupos (se existirem)
-            if self.activity_groups:
-                for group_name, group_data in self.activity_groups.items():
-                    if group_data['activities']:
-                        group_times = self.processed_data[self.processed_data['Atividade'].isin(group_data['activities'])]['Tempo']
-                        metrics = self._calculate_metrics(group_times)
-                        if metrics:
-                            group_item = self.results_tree.insert("", tk.END, 
-                                                                 text=f"📁 {group_name}", 
-                                                                 values=metrics, open=True)
-                            # Analisar atividades individuais do grupo
-                            for activity in group_data['activities']:
-                                activity_times = self.processed_data[self.processed_data['Atividade'] == activity]['Tempo']
-                                activity_metrics = self._calculate_metrics(activity_times)
-                                if activity_metrics:
-                                    self.results_tree.insert(group_item, tk.END, 
-                                                            text=f"  📊 {activity}", 
-                                                            values=activity_metrics)
-
-            # Analisar atividades não agrupadas
-            grouped_activities = {act for group in self.activity_groups.values() for act in group['activities']}
-            ungrouped_df = self.processed_data[~self.processed_data['Atividade'].isin(grouped_activities)]
-
-            if not ungrouped_df.empty:
-                # Criar um nó pai para atividades não agrupadas, se houver grupos.
-                parent_item = ""
-                if self.activity_groups:
-                    parent_item = self.results_tree.insert("", tk.END, 
-                                                          text="📋 Atividades Não Agrupadas", 
-                                                          open=True)
-
-                for activity, times in ungrouped_df.groupby('Atividade')['Tempo']:
-                    metrics = self._calculate_metrics(times)
-                    if metrics:
-                        self.results_tree.insert(parent_item, tk.END, 
-                                                text=f"📊 {activity}", 
-                                                values=metrics)
+            # Tabela numérica de resultados; a formatação fica para a exibição
+            self.analysis_results = build_results_table(activity_metrics, group_metrics, resolved_groups)
+            add_standard_times(self.analysis_results, self.activity_groups, self.activity_factors)
+            if self.bootstrap_var.get() and self._results_in_memory:
+                self._add_bootstrap_intervals(outlier_method, fence_multiplier)
+            under_sampled = self._add_sample_sizes(*sample_settings)
+            self.populate_results_tree()
 
             # Atualizar status de sucesso
             if hasattr(self, 'analysis_status'):
-                total_items = len(self.results_tree.get_children())
-                self.analysis_status.config(text=f"✅ Análise concluída • {total_items} item(s) analisado(s)", 
+                total_items = len(self.analysis_results)
+                self.analysis_status.config(text=f"✅ Análise concluída • {total_items} item(s) analisado(s) • "
+                                                 f"outliers: {outlier_method} k={fence_multiplier:g} • "
+                                                 f"{'🗄️ calculada no banco SQLite • ' if in_database else ''}"
+                                                 f"⚠️ {under_sampled} com amostragem insuficiente", 
                                           foreground=ModernColors.SUCCESS)
             
-            messagebox.showinfo("✅ Análise Concluída", 
-                               "A análise estatística foi concluída com sucesso!\n\n"
-                               "📊 Todos os dados foram processados e as métricas calculadas.")
+            message = ("A análise estatística foi concluída com sucesso!\n\n"
+                       "📊 Todos os dados foram processados e as métricas calculadas.")
+            if in_database and self.bootstrap_var.get():
+                message += ("\n\n📏 Os intervalos bootstrap precisam dos tempos em memória e não foram "
+                            "calculados na análise pelo banco.")
+            if under_sampled:
+                message += (f"\n\n⚠️ {under_sampled} atividade(s) com menos observações que o necessário "
+                            f"(coluna 📐 N Necessário). Recronometre antes de publicar os padrões.")
+            messagebox.showinfo("✅ Análise Concluída", message)
 
         except Exception as e:
             import traceback
@@ -1605,14 +2192,374 @@ class TimeStudyAnalyzer:
             
             messagebox.showerror("❌ Erro", f"Erro na análise estatística:\n{str(e)}\n\nVerifique o console para mais detalhes.")
             
-    def export_to_excel(self):
-        """Exportar resultados para Excel com feedback melhorado"""
-        if self.processed_data is None:
-            messagebox.showwarning("⚠️ Aviso", "Nenhum dado para exportar. Execute a análise primeiro.")
+    def _database_metrics(self, outlier_method, fence_multiplier):
+        """
+        Métricas calculadas pelo SQLite sobre os registros da sessão (ou None se cancelada).
+
+        Com a sessão aberta sem carregar os registros, eles já estão no banco.
+        Caso contrário, os que faltam são gravados no banco da sessão; sem
+        sessão escolhida, o usuário indica o banco (o diálogo confirma antes
+        de substituir um arquivo existente).
+        """
+        if not self._records_in_database:
+            if self.session_path is None:
+                db_path = filedialog.asksaveasfilename(
+                    title="🗄️ Banco da sessão para a análise",
+                    defaultextension=".db",
+                    initialfile=os.path.basename(self.db_path),
+                    filetypes=[("Banco SQLite", "*.db"), ("Todos os arquivos", "*.*")]
+                )
+                if not db_path:
+                    return None
+                self._use_session(self._session_store(db_path))
+
+            self.analysis_status.config(text="🗄️ Gravando registros no banco...", foreground=ModernColors.WARNING)
+            self.root.update_idletasks()
+            self._write_session(self.session_store)
+        
+        self.analysis_status.config(text="🗄️ Calculando métricas no banco...", foreground=ModernColors.WARNING)
+        self.root.update_idletasks()
+        self.analysis_settings['backend'] = 'sqlite'
+        files = [file_path for file_path in self.uploaded_files if file_path not in self.disabled_files]
+        return sql_metrics(self.session_store, self.unified_activities, self.activity_groups,
+                           fence_multiplier, outlier_method, files)
+
+    def _sample_size_settings(self):
+        """Confiança e precisão do N necessário, em frações (ou None com mensagem de erro)"""
+        try:
+            confidence = float(self.sample_confidence_var.get().replace(',', '.')) / 100
+            accuracy = float(self.sample_accuracy_var.get().replace(',', '.')) / 100
+        except ValueError:
+            messagebox.showerror("❌ Erro", "Informe confiança e precisão numéricas (em %)")
+            return None
+        error = validate_sample_size_settings(confidence, accuracy)
+        if error:
+            messagebox.showerror("❌ Erro", error)
+            return None
+        return confidence, accuracy
+
+    def _add_sample_sizes(self, confidence, accuracy):
+        """Acrescentar o N necessário de cada linha e retornar quantas atividades estão subamostradas"""
+        results = self.analysis_results
+        results['required_n'] = required_sample_sizes(results['mean_all'].to_numpy(),
+                                                      results['std_dev'].to_numpy(),
+                                                      confidence, accuracy)
+        self.analysis_settings.update({'sample_confidence': confidence, 'sample_accuracy': accuracy})
+        
+        # Sem desvio estimável (uma amostra) a atividade também conta como insuficiente
+        under_sampled = ~(results['n'] >= results['required_n'])
+        return int((under_sampled & (results['kind'] == 'activity')).sum())
+
+    def _add_bootstrap_intervals(self, outlier_method, fence_multiplier):
+        """Acrescentar à tabela de resultados os intervalos bootstrap de cada linha"""
+        self.analysis_status.config(text="🔄 Calculando intervalos bootstrap...", foreground=ModernColors.WARNING)
+        self.root.update_idletasks()
+        
+        results = self.analysis_results
+        intervals = bootstrap_intervals(self.metrics_cache.result_segments(results),
+                                        fence_multiplier, outlier_method)
+        for col in BOOTSTRAP_COLUMNS:
+            results[col] = intervals[col].to_numpy()
+        self.analysis_settings['bootstrap'] = True
+
+    def _iter_file_chunks(self, file_path, activity_col, chunksize=STREAM_CHUNK_ROWS):
+        """
+        Ler um arquivo em blocos de linhas, sem carregá-lo inteiro na memória.
+
+        A coluna de atividade é lida como texto em todos os blocos, como em
+        _read_file: sem isso, cada bloco infere o próprio tipo e '101' pode
+        virar '101.0' em outro.
+        """
+        if file_path.endswith('.xlsx'):
+            from openpyxl import load_workbook
+            workbook = load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                rows = workbook.worksheets[0].iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    return
+                columns = [str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(header)]
+                while True:
+                    block = list(islice(rows, chunksize))
+                    if not block:
+                        break
+                    yield pd.DataFrame(block, columns=columns, dtype=object)
+            finally:
+                workbook.close()
+        else:
+            # Codificação detectada pelo primeiro bloco do arquivo; se um byte inválido aparecer
+            # depois, a leitura continua em latin1 a partir da primeira linha ainda não entregue
+            with open(file_path, 'rb') as raw_file:
+                head = raw_file.read(ENCODING_PROBE_BYTES)
+            try:
+                codecs.getincrementaldecoder('utf-8')().decode(head)
+                encoding = 'utf-8'
+            except UnicodeDecodeError:
+                encoding = 'latin1'
+            delivered = 0
+            try:
+                for chunk in pd.read_csv(file_path, encoding=encoding, chunksize=chunksize, dtype={activity_col: str}):
+                    yield chunk
+                    delivered += len(chunk)
+            except UnicodeDecodeError:
+                yield from pd.read_csv(file_path, encoding='latin1', chunksize=chunksize, dtype={activity_col: str},
+                                       skiprows=range(1, delivered + 1))
+
+    def _approximate_results(self, outlier_method, fence_multiplier):
+        """Análise aproximada: sketches de quantis por atividade alimentados em blocos"""
+        columns = self._selected_columns()
+        if columns is None:
+            return None
+        activity_col, time_col, rework_col = columns
+
+        try:
+            rank_error = float(self.approx_error_var.get().replace(',', '.')) / 100
+        except ValueError:
+            rank_error = 0
+        if not 0 < rank_error < 1:
+            messagebox.showerror("❌ Erro", "Informe um erro máximo entre 0 e 100%")
+            return None
+
+        sketches = ActivitySketches(k_for_error(rank_error))
+        for file_path in self.uploaded_files:
+            if file_path in self.disabled_files:
+                continue
+            filename = os.path.basename(file_path)
+            rows_read = 0
+            try:
+                for chunk in self._iter_file_chunks(file_path, activity_col):
+                    data, _ = self._clean_file_data(chunk, activity_col, time_col, rework_col, filename)
+                    if data is None:
+                        break
+                    times = pd.to_numeric(data['Tempo'].apply(self._convert_time), errors='coerce')
+                    valid = times > 0
+                    sketches.update(data['Atividade'][valid], times[valid])
+
+                    rows_read += len(chunk)
+                    self.analysis_status.config(text=f"🔄 {filename}: {rows_read:,} linha(s) lida(s)...".replace(",", "."))
+                    self.root.update_idletasks()
+            except Exception as e:
+                print(f"Erro ao processar arquivo {filename}: {str(e)}")
+
+        if not sketches.sketches:
+            messagebox.showerror("❌ Erro", "Nenhum dado válido pôde ser extraído dos arquivos.")
+            return None
+        self.activity_sketches = sketches
+
+        # Unificações e grupos são aplicados mesclando os sketches das atividades originais
+        members = {}
+        for activity in sketches.sketches:
+            members.setdefault(self.unified_activities.get(activity, activity), []).append(activity)
+        members = dict(sorted(members.items()))
+        resolved_groups = MetricsCache.resolve_groups(self.activity_groups, self.unified_activities)
+        group_members = {name: [raw for activity in data['activities'] for raw in members.get(activity, [])]
+                         for name, data in resolved_groups.items()}
+
+        activity_metrics = sketches.metrics(members, fence_multiplier, outlier_method)
+        group_metrics = sketches.metrics(group_members, fence_multiplier, outlier_method)
+        return build_results_table(activity_metrics, group_metrics, resolved_groups)
+
+    def populate_results_tree(self):
+        """Preencher a árvore de resultados a partir da tabela numérica"""
+        for item in self.results_tree.get_children():
+            self.results_tree.delete(item)
+        self._result_items = {}
+        if self._insert_job is not None:
+            self.root.after_cancel(self._insert_job)
+            self._insert_job = None
+
+        results = self.analysis_results
+        if results is None or results.empty:
+            return
+
+        kinds = results['kind'].to_numpy()
+        groups = results['group'].to_numpy()
+        is_activity = kinds == 'activity'
+
+        # Grupos são formatados agora; as atividades de cada nó são inseridas em blocos
+        batches = []  # (item pai, linhas da tabela, recuo)
+        for position in np.flatnonzero(kinds == 'group'):
+            group_name = groups[position]
+            metrics = results.iloc[position]
+            group_item = self.results_tree.insert("", tk.END,
+                                                 text=f"📁 {group_name}{self._error_suffix(metrics)}",
+                                                 values=self._format_metrics(metrics),
+                                                 open=True)
+            self._result_items[position] = group_item
+            batches.append((group_item, np.flatnonzero(is_activity & (groups == group_name)), "  "))
+
+        ungrouped = np.flatnonzero(is_activity & (groups == ''))
+        if len(ungrouped):
+            parent_item = ""
+            if self.activity_groups:
+                # Criar um nó pai para atividades não agrupadas, se houver grupos.
+                parent_item = self.results_tree.insert("", tk.END,
+                                                      text="📋 Atividades Não Agrupadas",
+                                                      open=True)
+            batches.append((parent_item, ungrouped, ""))
+
+        self._insert_result_chunk(batches, 0, 0)
+
+    def _insert_result_rows(self, parent_item, positions, indent):
+        """Formatar e inserir linhas de atividades da tabela numérica"""
+        rows = self.analysis_results.iloc[positions]
+        for position, activity, metrics in zip(positions, rows['activity'], rows.to_dict('records')):
+            self._result_items[position] = self.results_tree.insert(
+                parent_item, tk.END,
+                text=f"{indent}📊 {activity}{self._error_suffix(metrics)}",
+                values=self._format_metrics(metrics))
+
+    def _insert_result_chunk(self, batches, index, start):
+        """Inserir até RESULT_REFRESH_CHUNK atividades (seguindo pelos nós em ordem) e agendar o próximo bloco"""
+        remaining = RESULT_REFRESH_CHUNK
+        while index < len(batches) and remaining > 0:
+            parent_item, positions, indent = batches[index]
+            stop = min(start + remaining, len(positions))
+            self._insert_result_rows(parent_item, positions[start:stop], indent)
+            remaining -= stop - start
+            index, start = (index, stop) if stop < len(positions) else (index + 1, 0)
+        self._insert_job = None
+        if index < len(batches):
+            self._insert_job = self.root.after(1, self._insert_result_chunk, batches, index, start)
+
+    def _refresh_result_items(self):
+        """Reformatar os itens já exibidos, em blocos, sem travar o controle deslizante"""
+        if self._refresh_job is not None:
+            self.root.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        self._refresh_result_chunk(list(self._result_items.items()), 0)
+
+    def _refresh_result_chunk(self, items, start):
+        chunk = items[start:start + RESULT_REFRESH_CHUNK]
+        if not chunk:
+            self._refresh_job = None
             return
+        rows = self.analysis_results.iloc[[position for position, _ in chunk]].to_dict('records')
+        for (_, item), metrics in zip(chunk, rows):
+            self.results_tree.item(item, values=self._format_metrics(metrics))
+        self._refresh_job = self.root.after(1, self._refresh_result_chunk, items, start + RESULT_REFRESH_CHUNK)
+
+    def _box_plot_positions(self):
+        """Linhas da tabela selecionadas na árvore (ou todos os grupos, ou as atividades se não houver grupos)"""
+        item_positions = {item: position for position, item in self._result_items.items()}
+        positions = [item_positions[item] for item in self.results_tree.selection() if item in item_positions]
+        if not positions:
+            kinds = self.analysis_results['kind'].to_numpy()
+            positions = np.flatnonzero(kinds == 'group') if (kinds == 'group').any() else np.arange(len(kinds))
+        return sorted(positions)
+
+    def show_box_plots(self):
+        """Desenhar box plots com quartis, limites e uma amostra limitada de outliers já calculados"""
+        results = self.analysis_results
+        if results is None or results.empty:
+            messagebox.showwarning("⚠️ Aviso", "Execute a análise primeiro")
+            return
+
+        positions = self._box_plot_positions()
+        hidden = max(len(positions) - MAX_BOXES, 0)
+        positions = positions[:MAX_BOXES]
+        rows = results.iloc[positions]
+
+        # Sem os tempos no cache (análise aproximada, no banco ou sessão reaberta) usam-se apenas as métricas
+        approximate = not self._results_in_memory
+        parts = [None] * len(rows) if approximate else self.metrics_cache.result_parts(rows)
+        stats = []
+        for metrics, row_parts in zip(rows.to_dict('records'), parts):
+            name = f"Grupo {metrics['group']}" if metrics['kind'] == 'group' else metrics['activity']
+            stats.append(box_stats(metrics, row_parts, label=f"{name}\n(n={int(metrics['n'])})"))
+
+        method = self.analysis_settings.get('outlier_method', DEFAULT_OUTLIER_METHOD)
+        multiplier = self.analysis_settings.get('fence_multiplier', OUTLIER_METHODS[method][1])
+        title = f"Outliers: {OUTLIER_METHODS[method][0]} • k={multiplier:g}"
+        draw_box_plots(self.box_axes, stats, title)
+        self.box_canvas.draw_idle()
 
-        if not self.results_tree.get_children():
-            messagebox.showwarning("⚠️ Aviso", "Nenhuma análise encontrada para exportar. Execute a análise primeiro.")
+        status = f"📦 {len(stats)} caixa(s) • ◆ média sem outliers"
+        if hidden:
+            status += f" • {hidden} item(ns) não exibido(s) (máx. {MAX_BOXES})"
+        if approximate:
+            status += " • ≈ bigodes limitados aos extremos (tempos não carregados na análise)"
+        self.chart_status.config(text=status, foreground=ModernColors.TEXT_SECONDARY)
+
+    def _build_analysis_export_table(self):
+        """Montar a tabela de análise para exportação a partir dos valores numéricos"""
+        results = self.analysis_results
+        kinds = results['kind'].to_numpy()
+        groups = results['group'].to_numpy()
+        activities = results['activity'].to_numpy(dtype=object)
+
+        child_prefix = "    📊 " if self.activity_groups else "📊 "
+        labels = np.where(kinds == 'group',
+                          "📁 " + groups.astype(object),
+                          np.where(groups == '', child_prefix, "    📊 ") + activities)
+
+        columns = {'Atividade/Grupo': labels}
+        for col in METRIC_COLUMNS:
+            heading = self.results_tree.heading(col)['text']
+            if col in SECONDS_COLUMNS:
+                heading = f"{heading} (s)"
+            columns[heading] = results[col].to_numpy()
+        if 'standard_time' in results.columns:
+            columns["⏱️ Ritmo (%)"] = results['rating'].to_numpy() * 100
+            columns["☕ Tolerâncias (%)"] = results['allowance'].to_numpy() * 100
+            columns["⏳ T. Padrão (min)"] = results['standard_time'].to_numpy()
+        if 'rank_error' in results.columns:
+            columns["≈ Erro de Posto (±)"] = results['rank_error'].to_numpy()
+        if 'median_ci_low' in results.columns:
+            columns["🎯 IC Mediana Inf. (s)"] = results['median_ci_low'].to_numpy()
+            columns["🎯 IC Mediana Sup. (s)"] = results['median_ci_high'].to_numpy()
+            columns["📏 IC T. Norm. Inf. (min)"] = results['time_norm_ci_low'].to_numpy()
+            columns["📏 IC T. Norm. Sup. (min)"] = results['time_norm_ci_high'].to_numpy()
+        if 'required_n' in results.columns:
+            columns["📐 N Necessário"] = results['required_n'].to_numpy()
+            columns["📐 Amostragem"] = np.where(results['n'] >= results['required_n'], "OK", "Insuficiente")
+        table = pd.DataFrame(columns)
+
+        # Linha separadora das atividades não agrupadas, como na árvore de resultados
+        ungrouped = np.flatnonzero((kinds == 'activity') & (groups == ''))
+        if self.activity_groups and len(ungrouped):
+            header = pd.DataFrame({'Atividade/Grupo': ["📋 Atividades Não Agrupadas"]})
+            table = pd.concat([table.iloc[:ungrouped[0]], header, table.iloc[ungrouped[0]:]],
+                              ignore_index=True)
+        return table
+
+    def _analysis_parameters_table(self, sample_layout=None):
+        """Parâmetros da última análise (método de outliers, multiplicador, erro) em formato de tabela"""
+        settings = self.analysis_settings
+        method = settings.get('outlier_method', DEFAULT_OUTLIER_METHOD)
+        rows = [
+            ("Método de outliers", OUTLIER_METHODS[method][0]),
+            ("Multiplicador (k)", settings.get('fence_multiplier', OUTLIER_METHODS[method][1])),
+        ]
+        if 'rank_error' in settings:
+            rows.append(("Erro de posto máximo (análise aproximada)", f"±{settings['rank_error']:.2%}"))
+        if 'sample_confidence' in settings:
+            rows.append(("N necessário: confiança", f"{settings['sample_confidence']:.0%}"))
+            rows.append(("N necessário: precisão", f"±{settings['sample_accuracy']:.1%}"))
+        if settings.get('backend') == 'sqlite':
+            rows.append(("Cálculo das métricas", "Banco SQLite (agregações e ROW_NUMBER por atividade/grupo)"))
+        if settings.get('bootstrap'):
+            rows.append(("IC bootstrap (percentis)", f"{BOOTSTRAP_CONFIDENCE:.0%} • semente {BOOTSTRAP_SEED}"))
+        
+        # Tempo padrão e fatores definidos (os demais itens usam os valores padrão)
+        rows.append(("T. Padrão", "T. Norm. × ritmo × (1 + tolerâncias); grupos = soma das atividades"))
+        rows.append(("Ritmo / tolerâncias padrão", f"{DEFAULT_RATING:.0%} • {DEFAULT_ALLOWANCE:.0%}"))
+        for group_name, group_data in self.activity_groups.items():
+            if self._describe_factors(group_data):
+                rows.append((f"⏳ Grupo: {group_name}", self._describe_factors(group_data)))
+        for activity, factors in sorted(self.activity_factors.items()):
+            rows.append((f"⏳ Atividade: {activity}", self._describe_factors(factors)))
+        if sample_layout is not None:
+            rows.append(("Layout das amostras", SAMPLE_LAYOUTS[sample_layout]))
+        return pd.DataFrame(rows, columns=["Parâmetro", "Valor"])
+
+    def export_to_excel(self):
+        """Exportar resultados para Excel com feedback melhorado"""
+        if self.analysis_results is None:
+            if self.processed_data is None:
+                messagebox.showwarning("⚠️ Aviso", "Nenhum dado para exportar. Execute a análise primeiro.")
+            else:
+                messagebox.showwarning("⚠️ Aviso", "Nenhuma análise encontrada para exportar. Execute a análise primeiro.")
             return
 
         try:
@@ -1627,92 +2574,40 @@ class TimeStudyAnalyzer:
             # Atualizar status
             self.export_status.config(text="🔄 Exportando para Excel...", foreground=ModernColors.WARNING)
 
-            # --- Parte 1: Preparar dados brutos pivotados ---
-            # Mapeamento de atividade para grupo
-            activity_to_group = {activity: group_name
-                                 for group_name, data in self.activity_groups.items()
-                                 for activity in data['activities']}
+            # --- Parte 1: Tempos por processo/atividade (colunas "Amostra N") ---
+            # Na análise aproximada os tempos não ficam em memória (e processed_data, se existir, é de
+            # outro processamento): a Parte 1 sai sem tempos
+            approximate = 'rank_error' in self.analysis_settings
+            samples = sample_rows(None if approximate else self.processed_data,
+                                  self.unified_activities, self.activity_groups)
 
-            df_part1_source = self.processed_data.copy()
-            df_part1_source['Processos'] = df_part1_source['Atividade'].map(activity_to_group).fillna('')
-            
-            # Agrupar tempos em listas por atividade
-            pivoted_times = df_part1_source.groupby(['Processos', 'Atividade'])['Tempo'].apply(list).reset_index(name='Tempos')
-            
-            # Expandir as listas de tempo em colunas "Amostra N"
-            max_samples = 0
-            if not pivoted_times.empty:
-                max_samples_val = pivoted_times['Tempos'].str.len().max()
-                if pd.notna(max_samples_val):
-                    max_samples = int(max_samples_val)
-
-            sample_cols = [f'Amostra {i+1}' for i in range(max_samples)]
-            
-            time_df = pd.DataFrame(pivoted_times['Tempos'].tolist(), index=pivoted_times.index, columns=sample_cols)
-            
-            # Juntar as informações com os tempos expandidos
-            part1_df = pd.concat([pivoted_times[['Processos', 'Atividade']], time_df], axis=1)
-            
-            # Garantir que todas as atividades definidas nos grupos apareçam
-            all_grouped_activities = {act for data in self.activity_groups.values() for act in data['activities']}
-            
-            exported_activities = set()
-            if not part1_df.empty:
-                exported_activities = set(part1_df['Atividade'])
-
-            missing_activities = all_grouped_activities - exported_activities
-            
-            if missing_activities:
-                missing_data = []
-                for activity in sorted(list(missing_activities)):
-                    group_name = activity_to_group.get(activity, '')
-                    row = {'Processos': group_name, 'Atividade': activity}
-                    missing_data.append(row)
-                
-                if missing_data:
-                    missing_df = pd.DataFrame(missing_data)
-                    part1_df = pd.concat([part1_df, missing_df], ignore_index=True)
+            # --- Parte 2: Preparar tabela de análise ---
+            # Valores numéricos lidos diretamente da tabela de resultados
+            part2_df = self._build_analysis_export_table()
             
-            # Ordenar para manter os grupos juntos
-            if not part1_df.empty:
-                 part1_df = part1_df.sort_values(by=['Processos', 'Atividade']).reset_index(drop=True)
+            # Sem espaço para o layout largo, as amostras vão para planilhas no layout longo
+            layout = resolve_sample_layout(list(SAMPLE_LAYOUTS)[self.sample_layout_combo.current()],
+                                           samples, part2_df)
 
-            part1_df.insert(1, 'COD', '') # Adicionar coluna COD em branco
-            part1_df.rename(columns={'Atividade': 'Atividades da Coleta'}, inplace=True)
+            # --- Escrever no arquivo Excel linha a linha (memória constante) ---
+            def report_progress(rows_written, total_rows):
+                self.export_status.config(text=f"🔄 Exportando para Excel... {rows_written:,}/{total_rows:,} linha(s)"
+                                               .replace(",", "."), foreground=ModernColors.WARNING)
+                self.root.update_idletasks()
 
-            # --- Parte 2: Preparar tabela de análise ---
-            analysis_data = []
-            headers = ['Atividade/Grupo'] + [self.results_tree.heading(col)['text'] for col in self.results_tree['columns']]
-
-            for item_id in self.results_tree.get_children():
-                # Item pai (Grupo ou categoria principal)
-                parent_text = self.results_tree.item(item_id, 'text').strip()
-                parent_values = list(self.results_tree.item(item_id, 'values'))
-                analysis_data.append([parent_text] + parent_values)
-
-                # Itens filhos (atividades dentro do grupo)
-                for child_id in self.results_tree.get_children(item_id):
-                    child_text = "    " + self.results_tree.item(child_id, 'text').strip()
-                    child_values = list(self.results_tree.item(child_id, 'values'))
-                    analysis_data.append([child_text] + child_values)
-            
-            part2_df = pd.DataFrame(analysis_data, columns=headers)
-
-            # --- Escrever no arquivo Excel ---
-            with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-                part1_df.to_excel(writer, sheet_name='Exportação Completa', index=False)
-                
-                # Calcular a coluna de início para a segunda tabela
-                start_col_part2 = part1_df.shape[1] + 1  # +1 para a coluna em branco
-                
-                part2_df.to_excel(writer, sheet_name='Exportação Completa', index=False, startrow=0, startcol=start_col_part2)
+            fences = self._activity_fences(samples) if self.highlight_outliers_var.get() else None
+            write_export_workbook(filename, samples, part2_df, self._analysis_parameters_table(layout),
+                                  layout, report_progress, fences)
 
             self.export_status.config(text=f"✅ Exportado com sucesso: {os.path.basename(filename)}", 
                                     foreground=ModernColors.SUCCESS)
-            messagebox.showinfo("✅ Sucesso", 
-                               f"Dados exportados com sucesso!\n\n"
-                               f"📊 Arquivo: {os.path.basename(filename)}\n"
-                               f"📁 Local: {os.path.dirname(filename)}")
+            message = (f"Dados exportados com sucesso!\n\n"
+                       f"📊 Arquivo: {os.path.basename(filename)}\n"
+                       f"📁 Local: {os.path.dirname(filename)}")
+            if layout == "long":
+                message += ("\n\n↕️ Amostras no layout longo (planilhas \"Amostras\"); "
+                            "a análise está na planilha \"Análise\".")
+            messagebox.showinfo("✅ Sucesso", message)
 
         except Exception as e:
             import traceback
@@ -1721,34 +2616,131 @@ class TimeStudyAnalyzer:
             self.export_status.config(text="❌ Erro na exportação", foreground=ModernColors.ERROR)
             messagebox.showerror("❌ Erro", f"Erro ao exportar para Excel:\n{str(e)}")
             
+    def _activity_fences(self, samples):
+        """Limites de outliers da última análise para cada atividade da Parte 1 (pelo nome unificado)"""
+        results = self.analysis_results
+        rows = results[results['kind'] == 'activity'].drop_duplicates('activity')
+        fences = dict(zip(rows['activity'], zip(rows['lower_fence'], rows['upper_fence'])))
+        return {activity: fences.get(self.unified_activities.get(activity, activity))
+                for activity in samples.keys['Atividade'].unique()}
+
     def export_to_csv(self):
-        """Exportar resultados para CSV com feedback melhorado"""
+        """Exportar os dados processados (com grupos e unificações) em CSV, em blocos e sem travar a janela"""
         if self.processed_data is None:
             messagebox.showwarning("⚠️ Aviso", "Nenhum dado para exportar")
             return
+        if self._csv_writer is not None:
+            messagebox.showwarning("⚠️ Aviso", "Já existe uma exportação CSV em andamento")
+            return
+        
+        compression = list(CSV_COMPRESSIONS)[self.csv_compression_combo.current()]
+        error = validate_csv_compression(compression)
+        if error:
+            messagebox.showerror("❌ Erro", error)
+            return
             
         try:
             filename = filedialog.asksaveasfilename(
                 title="💾 Salvar arquivo CSV",
                 defaultextension=".csv",
-                filetypes=[("Arquivos CSV", "*.csv"), ("Todos os Arquivos", "*.*")]
+                filetypes=[("Arquivos CSV", "*.csv *.csv.gz *.csv.zst"), ("Todos os Arquivos", "*.*")]
             )
+            if not filename:
+                return
             
-            if filename:
-                self.export_status.config(text="🔄 Exportando para CSV...", foreground=ModernColors.WARNING)
-                
-                # Exportação CSV mantém o formato simples dos dados processados
-                self.processed_data.to_csv(filename, index=False)
-                
-                self.export_status.config(text=f"✅ Exportado com sucesso: {os.path.basename(filename)}", 
-                                        foreground=ModernColors.SUCCESS)
-                messagebox.showinfo("✅ Sucesso", 
-                                   f"Dados brutos exportados com sucesso!\n\n"
-                                   f"📄 Arquivo: {os.path.basename(filename)}\n"
-                                   f"📁 Local: {os.path.dirname(filename)}")
+            # O mapeamento é fixado agora; os blocos são lidos e gravados nos ciclos seguintes da interface
+            blocks = processed_sample_blocks(self.processed_data, self.unified_activities, self.activity_groups)
+            self._csv_writer = ChunkedCsvWriter(csv_filename(filename, compression), blocks,
+                                                len(self.processed_data), compression)
+            self.export_csv_btn.configure(state='disabled')
+            self.export_status.config(text="🔄 Exportando para CSV...", foreground=ModernColors.WARNING)
+            self.root.after(1, self._export_csv_chunk)
                 
         except Exception as e:
+            self._finish_csv_export(e)
+
+    def _export_csv_chunk(self):
+        """Gravar um bloco do CSV e agendar o próximo"""
+        writer = self._csv_writer
+        try:
+            if writer.write_next():
+                self.export_status.config(text=f"🔄 Exportando para CSV... {writer.rows_written / len(writer):.0%} "
+                                               f"({writer.rows_written:,}/{len(writer):,} linha(s))".replace(",", "."),
+                                          foreground=ModernColors.WARNING)
+                self.root.after(1, self._export_csv_chunk)
+                return
+        except Exception as e:
+            writer.close()
+            self._finish_csv_export(e)
+            return
+        self._finish_csv_export()
+
+    def _finish_csv_export(self, error=None):
+        """Encerrar a exportação CSV, informando sucesso ou erro"""
+        writer = self._csv_writer
+        self._csv_writer = None
+        self.export_csv_btn.configure(state='normal')
+        if error is not None:
+            print(f"Erro detalhado na exportação: {error}")
+            self.export_status.config(text="❌ Erro na exportação", foreground=ModernColors.ERROR)
+            messagebox.showerror("❌ Erro", f"Erro ao exportar para CSV:\n{str(error)}")
+            return
+        
+        self.export_status.config(text=f"✅ Exportado com sucesso: {os.path.basename(writer.path)}", 
+                                foreground=ModernColors.SUCCESS)
+        messagebox.showinfo("✅ Sucesso", 
+                           f"Dados brutos exportados com sucesso!\n\n"
+                           f"📄 Arquivo: {os.path.basename(writer.path)}\n"
+                           f"📊 Registros: {len(writer):,}\n".replace(",", ".") +
+                           f"📁 Local: {os.path.dirname(writer.path)}")
+
+    def export_to_columnar(self):
+        """Exportar amostras processadas (com grupos e unificações) e métricas numéricas em Parquet/Arrow"""
+        if self.processed_data is None and self.analysis_results is None:
+            messagebox.showwarning("⚠️ Aviso", "Nenhum dado para exportar")
+            return
+        if not PYARROW_AVAILABLE:
+            messagebox.showerror("❌ Erro", "A exportação Parquet/Arrow requer o pacote pyarrow.\n\n"
+                                           "Instale com: pip install pyarrow")
+            return
+
+        try:
+            filename = filedialog.asksaveasfilename(
+                title="💾 Salvar Parquet/Arrow",
+                defaultextension=".parquet",
+                filetypes=[("Parquet", "*.parquet"), ("Arrow IPC / Feather", "*.arrow *.feather"),
+                           ("Todos os Arquivos", "*.*")]
+            )
+            if not filename:
+                return
+
+            self.export_status.config(text="🔄 Exportando Parquet/Arrow...", foreground=ModernColors.WARNING)
+            self.root.update_idletasks()
+
+            samples_path, metrics_path = columnar_paths(filename)
+            written = []
+            if self.processed_data is not None:
+                write_columnar(samples_path, processed_sample_blocks(self.processed_data, self.unified_activities,
+                                                                     self.activity_groups))
+                written.append(samples_path)
+            if self.analysis_results is not None:
+                write_columnar(metrics_path, [numeric_results_frame(self.analysis_results)])
+                written.append(metrics_path)
+
+            self.export_status.config(text=f"✅ Exportado com sucesso: {', '.join(map(os.path.basename, written))}",
+                                    foreground=ModernColors.SUCCESS)
+            messagebox.showinfo("✅ Sucesso",
+                               "Dados exportados com sucesso!\n\n"
+                               + "\n".join(f"🗃️ Arquivo: {os.path.basename(path)}" for path in written)
+                               + f"\n📁 Local: {os.path.dirname(filename)}")
+
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            print(f"Erro detalhado na exportação: {error_details}")
             self.export_status.config(text="❌ Erro na exportação", foreground=ModernColors.ERROR)
+            messagebox.showerror("❌ Erro", f"Erro ao exportar Parquet/Arrow:\n{str(e)}")
+
     def format_seconds_to_hms(self, seconds):
         """Converte segundos para o formato HH:MM:SS, lidando com valores negativos."""
         if pd.isna(seconds):
@@ -1768,57 +2760,86 @@ class TimeStudyAnalyzer:
         except (ValueError, TypeError):
             return "N/A"
 
-    def _calculate_metrics(self, times_series):
-        """Função auxiliar para calcular todas as métricas para uma série de tempos."""
-        if times_series.empty:
-            return None
+    def _error_suffix(self, metrics):
+        """Texto com o erro de posto de resultados aproximados (vazio se exatos)."""
+        rank_error = metrics.get('rank_error', 0)
+        if pd.isna(rank_error) or rank_error <= 0:
+            return ""
+        return f" (≈ ±{rank_error:.1%})"
 
-        # Métricas básicas
-        n = len(times_series)
-        std_dev = times_series.std()
-        min_time = times_series.min()
-        max_time = times_series.max()
-        q1 = times_series.quantile(0.25)
-        median = times_series.median()
-        q3 = times_series.quantile(0.75)
-        iqr = q3 - q1
-        mean_all = times_series.mean()
-
-        # Outliers
-        lower_bound = q1 - 1.5 * iqr
-        upper_bound = q3 + 1.5 * iqr
-        outliers = times_series[(times_series < lower_bound) | (times_series > upper_bound)]
-        clean_times = times_series[(times_series >= lower_bound) & (times_series <= upper_bound)]
-        
-        outlier_count = len(outliers)
-        non_outlier_count = len(clean_times)
-        mean_no_outliers = clean_times.mean() if non_outlier_count > 0 else 0
-
-        # Tempos em minutos
-        time_non_norm = mean_all / 60
-        time_norm = mean_no_outliers / 60
-        
+    def _format_metrics(self, metrics):
+        """Formata um conjunto de métricas numéricas para exibição na tabela de resultados."""
         # Formatação para exibição na nova ordem
         values = (
-            n,
-            self.format_seconds_to_hms(std_dev),
-            self.format_seconds_to_hms(min_time),
-            self.format_seconds_to_hms(max_time),
-            self.format_seconds_to_hms(median),
-            self.format_seconds_to_hms(q1),
-            self.format_seconds_to_hms(q3),
-            self.format_seconds_to_hms(iqr),
-            self.format_seconds_to_hms(lower_bound),
-            self.format_seconds_to_hms(upper_bound),
-            outlier_count,
-            non_outlier_count,
-            self.format_seconds_to_hms(mean_all),
-            self.format_seconds_to_hms(mean_no_outliers),
-            f"{time_non_norm:.2f} min",
-            f"{time_norm:.2f} min"
+            int(metrics["n"]),
+            self.format_seconds_to_hms(metrics["std_dev"]),
+            self.format_seconds_to_hms(metrics["min"]),
+            self.format_seconds_to_hms(metrics["max"]),
+            self.format_seconds_to_hms(metrics["median"]),
+            self.format_seconds_to_hms(metrics["q1"]),
+            self.format_seconds_to_hms(metrics["q3"]),
+            self.format_seconds_to_hms(metrics["iqr"]),
+            self.format_seconds_to_hms(metrics["lower_fence"]),
+            self.format_seconds_to_hms(metrics["upper_fence"]),
+            int(metrics["outlier_count"]),
+            int(metrics["non_outlier_count"]),
+            self.format_seconds_to_hms(metrics["mean_all"]),
+            self.format_seconds_to_hms(metrics["mean_no_outliers"]),
+            f"{metrics['time_non_norm']:.2f} min",
+            f"{metrics['time_norm']:.2f} min"
         )
+        
+        # Marcar valores estimados a partir de sketches
+        if self._error_suffix(metrics):
+            values = tuple(f"≈{value}" if col in APPROXIMATE_COLUMNS else value
+                           for col, value in zip(METRIC_COLUMNS, values))
+        
+        # Tempo padrão (nos grupos, soma das atividades) e intervalos bootstrap (vazios quando não calculados)
+        values += (self._format_standard_time(metrics),
+                   self._format_interval(metrics, "median_ci", self.format_seconds_to_hms),
+                   self._format_interval(metrics, "time_norm_ci", lambda value: f"{value:.2f}", " min"),
+                   self._format_required_n(metrics))
         return values
 
+    def _format_required_n(self, metrics):
+        """N necessário com a marcação de amostragem suficiente ou insuficiente."""
+        required = metrics.get("required_n")
+        if required is None:
+            return ""
+        if pd.isna(required):
+            return "⚠️ N/A"
+        return f"{'✅' if metrics['n'] >= required else '⚠️'} {int(required)}"
+
+    def _format_standard_time(self, metrics):
+        """Tempo padrão em minutos; nos grupos é marcado como soma das atividades."""
+        standard = metrics.get("standard_time", np.nan)
+        if pd.isna(standard):
+            return ""
+        prefix = "Σ " if metrics.get("kind") == "group" else ""
+        return f"{prefix}{standard:.2f} min"
+
+    def _describe_factors(self, factors):
+        """Ritmo e tolerâncias definidos para um grupo ou atividade (vazio se nenhum)."""
+        parts = []
+        if 'rating' in factors:
+            parts.append(f"ritmo {factors['rating']:.0%}")
+        if 'allowance' in factors:
+            parts.append(f"tol. {factors['allowance']:.0%}")
+        return " • ".join(parts)
+
+    def _factors_text(self, factors):
+        """Sufixo com os fatores para os rótulos da árvore de grupos."""
+        description = self._describe_factors(factors)
+        return f" • ⏳ {description}" if description else ""
+
+    def _format_interval(self, metrics, prefix, formatter, suffix=""):
+        """Formata um intervalo (colunas <prefix>_low/<prefix>_high) ou retorna vazio."""
+        low = metrics.get(f"{prefix}_low", np.nan)
+        high = metrics.get(f"{prefix}_high", np.nan)
+        if pd.isna(low) or pd.isna(high):
+            return ""
+        return f"{formatter(low)} – {formatter(high)}{suffix}"
+
     def create_new_group(self):
         """Criar novo grupo com interface modernizada"""
         # Janela para criar novo grupo
@@ -1902,8 +2923,10 @@ class TimeStudyAnalyzer:
             # Criar grupo
             self.activity_groups[name] = {
                 'color': color_var.get(),
-                'activities': []
+                'activities': [],
+                'rules': []
             }
+            self.metrics_cache.mark_groups_dirty([name])
             
             # Atualizar interface
             self.update_group_tree()
@@ -2019,6 +3042,7 @@ class TimeStudyAnalyzer:
             for activity in selected_activities:
                 if activity not in self.activity_groups[group_name]['activities']:
                     self.activity_groups[group_name]['activities'].append(activity)
+            self.metrics_cache.mark_groups_dirty([group_name])
             
             # Atualizar interface
             self.update_group_tree()
@@ -2045,6 +3069,384 @@ class TimeStudyAnalyzer:
         x = (self.root.winfo_screenwidth() // 2) - (select_window.winfo_width() // 2)
         y = (self.root.winfo_screenheight() // 2) - (select_window.winfo_height() // 2)
         select_window.geometry(f"+{x}+{y}")
+
+    def manage_group_rules(self):
+        """Gerenciar regras de agrupamento em massa com pré-visualização"""
+        if not self.activity_groups:
+            messagebox.showwarning("⚠️ Aviso", "Crie um grupo primeiro")
+            return
+
+        rules_window = tk.Toplevel(self.root)
+        rules_window.title("🧩 Regras de Agrupamento")
+        rules_window.geometry("700x600")
+        rules_window.configure(bg=ModernColors.SURFACE)
+        rules_window.transient(self.root)
+        rules_window.grab_set()
+
+        # Header
+        header_frame = ttk.Frame(rules_window)
+        header_frame.pack(fill=tk.X, padx=20, pady=(20, 10))
+
+        title_label = ttk.Label(header_frame, text="🧩 Regras de Agrupamento",
+                               font=('Segoe UI', 14, 'bold'),
+                               foreground=ModernColors.TEXT_PRIMARY)
+        title_label.pack()
+
+        subtitle_label = ttk.Label(header_frame,
+                                  text="Atribua atividades aos grupos por prefixo, conteúdo, regex ou palavras",
+                                  font=('Segoe UI', 10, 'normal'),
+                                  foreground=ModernColors.TEXT_SECONDARY)
+        subtitle_label.pack(pady=(5, 0))
+
+        separator = ttk.Separator(rules_window, orient='horizontal')
+        separator.pack(fill=tk.X, padx=20, pady=10)
+
+        content_frame = ttk.Frame(rules_window)
+        content_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        content_frame.grid_columnconfigure(1, weight=1)
+        content_frame.grid_rowconfigure(3, weight=1)
+        content_frame.grid_rowconfigure(5, weight=2)
+
+        # Seleção do grupo
+        ttk.Label(content_frame, text="📁 Grupo:",
+                 font=('Segoe UI', 11, 'bold'),
+                 foreground=ModernColors.TEXT_PRIMARY).grid(row=0, column=0, sticky="w", padx=(0, 10))
+        group_combo = ttk.Combobox(content_frame, state="readonly", style='Modern.TCombobox',
+                                   values=list(self.activity_groups.keys()))
+        group_combo.grid(row=0, column=1, columnspan=2, sticky="ew", pady=(0, 10))
+        group_combo.current(0)
+
+        # Nova regra
+        type_labels = list(RULE_TYPES.values())
+        type_keys = list(RULE_TYPES.keys())
+        type_combo = ttk.Combobox(content_frame, state="readonly", style='Modern.TCombobox',
+                                  values=type_labels, width=22)
+        type_combo.grid(row=1, column=0, sticky="w", padx=(0, 10))
+        type_combo.current(0)
+
+        pattern_entry = ttk.Entry(content_frame, style='Modern.TEntry')
+        pattern_entry.grid(row=1, column=1, sticky="ew", padx=(0, 10))
+
+        # Regras do grupo selecionado
+        ttk.Label(content_frame, text="📜 Regras do grupo:",
+                 font=('Segoe UI', 11, 'bold'),
+                 foreground=ModernColors.TEXT_PRIMARY).grid(row=2, column=0, sticky="w", pady=(10, 5))
+
+        rules_listbox = tk.Listbox(content_frame,
+                                  bg=ModernColors.SURFACE,
+                                  fg=ModernColors.TEXT_PRIMARY,
+                                  selectbackground=ModernColors.PRIMARY_LIGHT,
+                                  selectforeground=ModernColors.PRIMARY,
+                                  borderwidth=1,
+                                  relief='solid',
+                                  font=('Segoe UI', 10, 'normal'),
+                                  activestyle='none',
+                                  height=5)
+        rules_listbox.grid(row=3, column=0, columnspan=2, sticky="nsew")
+
+        # Pré-visualização
+        preview_label = ttk.Label(content_frame, text="👁️ Pré-visualização:",
+                                 font=('Segoe UI', 11, 'bold'),
+                                 foreground=ModernColors.TEXT_PRIMARY)
+        preview_label.grid(row=4, column=0, columnspan=3, sticky="w", pady=(10, 5))
+
+        preview_tree = ttk.Treeview(content_frame, style='Modern.Treeview')
+        preview_tree.heading("#0", text="📁 Grupo / 📊 Atividade")
+        preview_tree.grid(row=5, column=0, columnspan=2, sticky="nsew")
+
+        preview_scroll = ttk.Scrollbar(content_frame, orient="vertical", command=preview_tree.yview)
+        preview_scroll.grid(row=5, column=2, sticky="nsw")
+        preview_tree.configure(yscrollcommand=preview_scroll.set)
+
+        pending_matches = {}
+
+        def refresh_rules(event=None):
+            rules_listbox.delete(0, tk.END)
+            for rule in self.activity_groups[group_combo.get()].setdefault('rules', []):
+                rules_listbox.insert(tk.END, f"🧩 {describe_rule(rule)}")
+
+        def add_rule():
+            rule_type = type_keys[type_combo.current()]
+            pattern = pattern_entry.get().strip()
+            error = validate_rule(rule_type, pattern)
+            if error:
+                messagebox.showerror("❌ Erro", error, parent=rules_window)
+                return
+            self.activity_groups[group_combo.get()].setdefault('rules', []).append(
+                {'type': rule_type, 'pattern': pattern})
+            pattern_entry.delete(0, tk.END)
+            refresh_rules()
+
+        def remove_rule():
+            selection = rules_listbox.curselection()
+            if not selection:
+                return
+            del self.activity_groups[group_combo.get()]['rules'][selection[0]]
+            refresh_rules()
+
+        def preview_rules():
+            for item in preview_tree.get_children():
+                preview_tree.delete(item)
+            pending_matches.clear()
+
+            if self.processed_data is None:
+                messagebox.showwarning("⚠️ Aviso", "Processe os dados primeiro", parent=rules_window)
+                return
+
+            grouped_activities = {act for data in self.activity_groups.values() for act in data['activities']}
+            pending_matches.update(match_group_rules(self._activity_counts().index,
+                                                     self.activity_groups,
+                                                     exclude=grouped_activities))
+
+            total = 0
+            for group_name, activities in pending_matches.items():
+                group_item = preview_tree.insert("", tk.END,
+                                                 text=f"📁 {group_name} (+{len(activities)})", open=False)
+                for activity in activities:
+                    preview_tree.insert(group_item, tk.END, text=f"  📊 {activity}")
+                total += len(activities)
+
+            preview_label.config(text=f"👁️ Pré-visualização: {total} atividade(s) correspondente(s)")
+
+        def apply_rules():
+            # Recalcular as correspondências: as regras podem ter mudado desde a pré-visualização
+            preview_rules()
+            if not pending_matches:
+                messagebox.showinfo("ℹ️ Informação", "Nenhuma atividade corresponde às regras",
+                                    parent=rules_window)
+                return
+
+            total = 0
+            for group_name, activities in pending_matches.items():
+                group_activities = self.activity_groups[group_name]['activities']
+                for activity in activities:
+                    if activity not in group_activities:
+                        group_activities.append(activity)
+                        total += 1
+            self.metrics_cache.mark_groups_dirty(pending_matches.keys())
+            pending_matches.clear()
+
+            self.update_group_tree()
+            rules_window.destroy()
+            messagebox.showinfo("✅ Sucesso", f"{total} atividade(s) agrupada(s) pelas regras 🎉")
+
+        group_combo.bind("<<ComboboxSelected>>", refresh_rules)
+        pattern_entry.bind('<Return>', lambda e: add_rule())
+
+        add_rule_btn = ttk.Button(content_frame, text="➕ Adicionar Regra",
+                                 command=add_rule, style='Primary.TButton')
+        add_rule_btn.grid(row=1, column=2, sticky="e")
+
+        remove_rule_btn = ttk.Button(content_frame, text="🗑️ Remover Regra",
+                                    command=remove_rule, style='Secondary.TButton')
+        remove_rule_btn.grid(row=3, column=2, sticky="n", padx=(10, 0))
+
+        # Botões
+        button_frame = ttk.Frame(rules_window)
+        button_frame.pack(fill=tk.X, padx=20, pady=(0, 20))
+
+        close_btn = ttk.Button(button_frame, text="❌ Fechar",
+                              command=rules_window.destroy, style='Secondary.TButton')
+        close_btn.pack(side=tk.RIGHT, padx=(10, 0))
+
+        apply_btn = ttk.Button(button_frame, text="✅ Aplicar Regras",
+                              command=apply_rules, style='Primary.TButton')
+        apply_btn.pack(side=tk.RIGHT, padx=(10, 0))
+
+        preview_btn = ttk.Button(button_frame, text="👁️ Pré-visualizar",
+                                command=preview_rules, style='Secondary.TButton')
+        preview_btn.pack(side=tk.RIGHT)
+
+        refresh_rules()
+
+        # Centralizar janela
+        rules_window.update_idletasks()
+        x = (self.root.winfo_screenwidth() // 2) - (rules_window.winfo_width() // 2)
+        y = (self.root.winfo_screenheight() // 2) - (rules_window.winfo_height() // 2)
+        rules_window.geometry(f"+{x}+{y}")
+
+    def _factor_targets(self):
+        """Grupos e atividades (nomes unificados) que podem receber ritmo e tolerâncias"""
+        activities = set(self.activity_factors)
+        if self.processed_data is not None:
+            activities.update(self._activity_counts().index)
+        for group_data in self.activity_groups.values():
+            activities.update(self.unified_activities.get(act, act) for act in group_data['activities'])
+        return ([('group', name) for name in self.activity_groups]
+                + [('activity', name) for name in sorted(activities)])
+
+    def _apply_time_factors(self):
+        """Recalcular o tempo padrão da última análise após mudar os fatores"""
+        self.update_group_tree()
+        results = self.analysis_results
+        if results is None or results.empty:
+            return
+        add_standard_times(results, self.activity_groups, self.activity_factors)
+        self._refresh_result_items()
+
+    def manage_time_factors(self):
+        """Definir ritmo e tolerâncias (PF&D) de grupos e atividades para o tempo padrão"""
+        targets = self._factor_targets()
+        if not targets:
+            messagebox.showwarning("⚠️ Aviso", "Processe os dados ou crie um grupo primeiro")
+            return
+
+        factors_window = tk.Toplevel(self.root)
+        factors_window.title("⏳ Ritmo e Tolerâncias")
+        factors_window.geometry("600x500")
+        factors_window.configure(bg=ModernColors.SURFACE)
+        factors_window.transient(self.root)
+        factors_window.grab_set()
+
+        # Header
+        header_frame = ttk.Frame(factors_window)
+        header_frame.pack(fill=tk.X, padx=20, pady=(20, 10))
+
+        title_label = ttk.Label(header_frame, text="⏳ Ritmo e Tolerâncias",
+                               font=('Segoe UI', 14, 'bold'),
+                               foreground=ModernColors.TEXT_PRIMARY)
+        title_label.pack()
+
+        subtitle_label = ttk.Label(header_frame,
+                                  text="T. Padrão = T. Norm. × ritmo × (1 + tolerâncias) • "
+                                       "atividades herdam os fatores do grupo",
+                                  font=('Segoe UI', 10, 'normal'),
+                                  foreground=ModernColors.TEXT_SECONDARY)
+        subtitle_label.pack(pady=(5, 0))
+
+        separator = ttk.Separator(factors_window, orient='horizontal')
+        separator.pack(fill=tk.X, padx=20, pady=10)
+
+        content_frame = ttk.Frame(factors_window)
+        content_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        content_frame.grid_columnconfigure(1, weight=1)
+        content_frame.grid_rowconfigure(4, weight=1)
+
+        # Grupo ou atividade
+        ttk.Label(content_frame, text="🏷️ Grupo/Atividade:",
+                 font=('Segoe UI', 11, 'bold'),
+                 foreground=ModernColors.TEXT_PRIMARY).grid(row=0, column=0, sticky="w", padx=(0, 10))
+        target_combo = ttk.Combobox(content_frame, state="readonly", style='Modern.TCombobox',
+                                    values=[f"{'📁' if kind == 'group' else '📊'} {name}"
+                                            for kind, name in targets])
+        target_combo.grid(row=0, column=1, sticky="ew", pady=(0, 10))
+        target_combo.current(0)
+
+        # Fatores em % (em branco = herdar do grupo ou usar o padrão)
+        rating_var = tk.StringVar()
+        allowance_var = tk.StringVar()
+        ttk.Label(content_frame, text=f"⏱️ Ritmo (%) • padrão {DEFAULT_RATING:.0%}:",
+                 font=('Segoe UI', 11, 'normal'),
+                 foreground=ModernColors.TEXT_PRIMARY).grid(row=1, column=0, sticky="w", padx=(0, 10))
+        ttk.Entry(content_frame, textvariable=rating_var, width=10,
+                 style='Modern.TEntry').grid(row=1, column=1, sticky="w", pady=(0, 5))
+        ttk.Label(content_frame, text=f"☕ Tolerâncias (%) • padrão {DEFAULT_ALLOWANCE:.0%}:",
+                 font=('Segoe UI', 11, 'normal'),
+                 foreground=ModernColors.TEXT_PRIMARY).grid(row=2, column=0, sticky="w", padx=(0, 10))
+        ttk.Entry(content_frame, textvariable=allowance_var, width=10,
+                 style='Modern.TEntry').grid(row=2, column=1, sticky="w", pady=(0, 5))
+
+        # Fatores já definidos
+        ttk.Label(content_frame, text="📜 Fatores definidos:",
+                 font=('Segoe UI', 11, 'bold'),
+                 foreground=ModernColors.TEXT_PRIMARY).grid(row=3, column=0, sticky="w", pady=(10, 5))
+
+        defined_listbox = tk.Listbox(content_frame,
+                                    bg=ModernColors.SURFACE,
+                                    fg=ModernColors.TEXT_PRIMARY,
+                                    selectbackground=ModernColors.PRIMARY_LIGHT,
+                                    selectforeground=ModernColors.PRIMARY,
+                                    borderwidth=1,
+                                    relief='solid',
+                                    font=('Segoe UI', 10, 'normal'),
+                                    activestyle='none')
+        defined_listbox.grid(row=4, column=0, columnspan=2, sticky="nsew")
+
+        def target_factors(create=False):
+            kind, name = targets[target_combo.current()]
+            if kind == 'group':
+                return self.activity_groups[name]
+            if create:
+                return self.activity_factors.setdefault(name, {})
+            return self.activity_factors.get(name, {})
+
+        def refresh_factors(event=None):
+            factors = target_factors()
+            rating_var.set(f"{factors['rating'] * 100:g}" if 'rating' in factors else "")
+            allowance_var.set(f"{factors['allowance'] * 100:g}" if 'allowance' in factors else "")
+
+            defined_listbox.delete(0, tk.END)
+            for group_name, group_data in self.activity_groups.items():
+                if self._describe_factors(group_data):
+                    defined_listbox.insert(tk.END, f"📁 {group_name}: {self._describe_factors(group_data)}")
+            for activity, factors in sorted(self.activity_factors.items()):
+                if self._describe_factors(factors):
+                    defined_listbox.insert(tk.END, f"📊 {activity}: {self._describe_factors(factors)}")
+
+        def save_factors():
+            try:
+                rating = float(rating_var.get().replace(',', '.')) / 100 if rating_var.get().strip() else None
+                allowance = (float(allowance_var.get().replace(',', '.')) / 100
+                             if allowance_var.get().strip() else None)
+            except ValueError:
+                messagebox.showerror("❌ Erro", "Informe ritmo e tolerâncias numéricos (em %)",
+                                     parent=factors_window)
+                return
+            error = validate_time_factors(DEFAULT_RATING if rating is None else rating,
+                                          DEFAULT_ALLOWANCE if allowance is None else allowance)
+            if error:
+                messagebox.showerror("❌ Erro", error, parent=factors_window)
+                return
+
+            factors = target_factors(create=True)
+            for key, value in (('rating', rating), ('allowance', allowance)):
+                if value is None:
+                    factors.pop(key, None)
+                else:
+                    factors[key] = value
+            self._clean_activity_factors()
+            self._apply_time_factors()
+            refresh_factors()
+
+        def clear_factors():
+            factors = target_factors(create=True)
+            factors.pop('rating', None)
+            factors.pop('allowance', None)
+            self._clean_activity_factors()
+            self._apply_time_factors()
+            refresh_factors()
+
+        target_combo.bind("<<ComboboxSelected>>", refresh_factors)
+
+        # Botões
+        button_frame = ttk.Frame(factors_window)
+        button_frame.pack(fill=tk.X, padx=20, pady=(0, 20))
+
+        close_btn = ttk.Button(button_frame, text="❌ Fechar",
+                              command=factors_window.destroy, style='Secondary.TButton')
+        close_btn.pack(side=tk.RIGHT, padx=(10, 0))
+
+        save_btn = ttk.Button(button_frame, text="💾 Salvar Fatores",
+                             command=save_factors, style='Primary.TButton')
+        save_btn.pack(side=tk.RIGHT, padx=(10, 0))
+
+        clear_btn = ttk.Button(button_frame, text="🗑️ Usar Herdados",
+                              command=clear_factors, style='Secondary.TButton')
+        clear_btn.pack(side=tk.RIGHT)
+
+        factors_window.bind('<Return>', lambda e: save_factors())
+        refresh_factors()
+
+        # Centralizar janela
+        factors_window.update_idletasks()
+        x = (self.root.winfo_screenwidth() // 2) - (factors_window.winfo_width() // 2)
+        y = (self.root.winfo_screenheight() // 2) - (factors_window.winfo_height() // 2)
+        factors_window.geometry(f"+{x}+{y}")
+
+    def _clean_activity_factors(self):
+        """Descartar atividades sem fatores próprios"""
+        self.activity_factors = {name: factors for name, factors in self.activity_factors.items() if factors}
+
     def debug_data(self):
         """Função de debug para analisar os dados dos arquivos com interface melhorada"""
         if not self.uploaded_files:
@@ -0,0 +1,73 @@
+"""Benchmark de quartis por atividade: pandas (groupby quantile/median) x segmentos ordenados (metricsEngine)."""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metricsEngine import segment_medians, segment_quantiles, sort_by_activity
+
+
+def pandas_quartiles(data):
+    """Q1, mediana e Q3 de cada atividade com pandas."""
+    grouped = data.groupby('Atividade', observed=True, sort=True)['Tempo']
+    return grouped.quantile(0.25).to_numpy(), grouped.median().to_numpy(), grouped.quantile(0.75).to_numpy()
+
+
+def segment_quartiles(segments):
+    """Q1, mediana e Q3 lidos por índice dos segmentos já ordenados (como na análise)."""
+    return segment_quantiles(segments, 0.25), segment_medians(segments), segment_quantiles(segments, 0.75)
+
+
+def sorted_quartiles(data):
+    """Ordenação única por (atividade, tempo) seguida da leitura por índice."""
+    return segment_quartiles(sort_by_activity(data['Atividade'], data['Tempo']))
+
+
+def best_of(func, arg, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--activities', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    names = np.array([f"Atividade {i:04d}" for i in range(args.activities)], dtype=object)
+    print(f"{'amostras':>12} {'pandas (s)':>12} {'ordenar+ler (s)':>16} {'ganho':>7} "
+          f"{'só leitura (s)':>15} {'ganho':>9}")
+    for size in args.sizes:
+        # Tempos de ciclo assimétricos, como em atividades registradas por máquina
+        data = pd.DataFrame({'Atividade': pd.Categorical(names[rng.integers(0, args.activities, size)]),
+                             'Tempo': rng.lognormal(mean=3.0, sigma=0.8, size=size)})
+
+        pandas_time, expected = best_of(pandas_quartiles, data, args.repeat)
+        sorted_time, result = best_of(sorted_quartiles, data, args.repeat)
+        # Análises seguintes reaproveitam os segmentos do cache: só a leitura por índice
+        segments = sort_by_activity(data['Atividade'], data['Tempo'])
+        lookup_time, cached = best_of(segment_quartiles, segments, args.repeat)
+
+        for values in (result, cached):
+            if not all(np.allclose(a, b, rtol=0, atol=1e-9) for a, b in zip(expected, values)):
+                raise SystemExit(f"Resultados diferentes para {size} amostras")
+
+        print(f"{size:>12,} {pandas_time:>12.4f} {sorted_time:>16.4f} {pandas_time / sorted_time:>6.1f}x "
+              f"{lookup_time:>15.6f} {pandas_time / lookup_time:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+
+from metricsEngine import (DEFAULT_FENCE_MULTIPLIER, DEFAULT_OUTLIER_METHOD, MAD_SCALE, _lerp,
+                           search_ranges)
+
+BOOTSTRAP_RESAMPLES = 1000
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_SEED = 12345
+
+# Limite do total de sorteios (reamostragens × sorteios por reamostragem);
+# atividades grandes recebem menos reamostragens, até BOOTSTRAP_MIN_RESAMPLES,
+# e acima disso passam a sortear menos tempos que possuem (m de n)
+BOOTSTRAP_MAX_DRAWS = 20_000_000
+BOOTSTRAP_MIN_RESAMPLES = 32
+
+# Sorteios processados por matriz (limita a memória de cada lote)
+BOOTSTRAP_BATCH_DRAWS = 4_000_000
+
+# Colunas produzidas, na ordem da tabela de resultados
+BOOTSTRAP_COLUMNS = ("median_ci_low", "median_ci_high", "time_norm_ci_low", "time_norm_ci_high")
+
+
+def resample_budget(counts, resamples=BOOTSTRAP_RESAMPLES, max_draws=BOOTSTRAP_MAX_DRAWS):
+    """
+    Reamostragens e sorteios por reamostragem de cada segmento.
+
+    O orçamento é dividido igualmente entre os segmentos e as reamostragens
+    são arredondadas para potências de 2, formando poucas faixas. Um segmento
+    grande demais para BOOTSTRAP_MIN_RESAMPLES reamostragens completas sorteia
+    só max_draws / (segmentos × BOOTSTRAP_MIN_RESAMPLES) tempos em cada uma
+    (bootstrap m de n), de modo que o total nunca passa de `max_draws`.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    share = max_draws // max(len(counts), 1)
+    floor = min(BOOTSTRAP_MIN_RESAMPLES, max(share, 1))
+    budget = np.clip(share // np.maximum(counts, 1), floor, resamples)
+    budget = np.where(budget >= resamples, resamples, 2 ** np.floor(np.log2(budget))).astype(np.int64)
+    sizes = np.minimum(counts, np.maximum(share // budget, 1))
+    return budget, sizes
+
+
+def _order_statistics(values, cumulative, low, ranks):
+    """
+    Elemento de posição `ranks` (0-based) da faixa que começa em `low`, com
+    cada elemento repetido conforme seu peso (cumulative[i] = soma dos pesos
+    antes da posição i). Como a soma acumulada é crescente no array inteiro,
+    uma única busca global encontra todas as posições.
+    """
+    position = np.searchsorted(cumulative, ranks + cumulative[low], side='right')
+    return values[position - 1]
+
+
+def _batch_statistics(times, counts, rows, rng, outlier_method, fence_multiplier):
+    """
+    Mediana e tempo normalizado de `rows` reamostragens de todos os segmentos.
+
+    Cada reamostragem é uma linha de pesos (quantas vezes cada tempo foi
+    sorteado); como os tempos já estão ordenados, quantis e somas dentro dos
+    limites saem de somas acumuladas e buscas binárias, sem reordenar nada.
+    As linhas ficam lado a lado em arrays planos de `rows × (total + 1)`.
+    """
+    total = len(times)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    codes = np.repeat(np.arange(len(counts)), counts)
+
+    # Sorteio com reposição dentro de cada segmento, convertido em pesos
+    padded = total + 1
+    draws = (rng.random((rows, total)) * counts[codes]).astype(np.int64) + starts[codes]
+    draws += (np.arange(rows, dtype=np.int64) * padded)[:, None]
+    weights = np.bincount(draws.ravel(), minlength=rows * padded)
+    return _weighted_statistics(times, counts, weights, rows, outlier_method, fence_multiplier)
+
+
+def _weighted_statistics(times, counts, weights, rows, outlier_method, fence_multiplier):
+    """
+    Mediana e tempo normalizado de segmentos ordenados em que cada tempo vale
+    `weights` vezes (`rows` linhas de pesos de tamanho total + 1, a última
+    posição de cada linha com peso zero). Com pesos 1 são as estatísticas da
+    própria amostra.
+    """
+    total = len(times)
+    segments = len(counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    codes = np.repeat(np.arange(segments), counts)
+    padded = total + 1
+
+    row_base = np.repeat(np.arange(rows, dtype=np.int64) * padded, segments)
+    low = row_base + np.tile(starts, rows)
+    high = low + np.tile(counts, rows)
+    values = np.tile(np.append(times, 0.0), rows)
+
+    cum_weights = np.concatenate(([0], np.cumsum(weights)))
+    n = cum_weights[high] - cum_weights[low]  # Tempos sorteados em cada segmento
+
+    def order_statistic(ranks):
+        return _order_statistics(values, cum_weights, low, ranks)
+
+    def quantile(q):
+        position = (n - 1) * q
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, n - 1)
+        return _lerp(order_statistic(lower), order_statistic(upper), position - lower)
+
+    median = (order_statistic((n - 1) // 2) + order_statistic(n // 2)) / 2
+    weighted = weights * values
+    mean_all = np.add.reduceat(weighted, low) / n
+
+    if outlier_method == "tukey":
+        q1, q3 = quantile(0.25), quantile(0.75)
+        iqr = q3 - q1
+        lower_fence, upper_fence = q1 - fence_multiplier * iqr, q3 + fence_multiplier * iqr
+    elif outlier_method == "percentile":
+        lower_fence, upper_fence = quantile(fence_multiplier / 100), quantile(1 - fence_multiplier / 100)
+    elif outlier_method == "zscore":
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = (np.add.reduceat(weighted * values, low) - n * mean_all * mean_all) / (n - 1)
+        spread = fence_multiplier * np.sqrt(np.nan_to_num(np.maximum(variance, 0)))
+        lower_fence, upper_fence = mean_all - spread, mean_all + spread
+    elif outlier_method == "mad":
+        # Desvios em relação à mediana da reamostragem, reordenados dentro de cada segmento
+        range_of = (np.repeat(np.arange(rows) * segments, padded)
+                    + np.tile(np.append(codes, segments - 1), rows))
+        deviations = np.abs(values - median[range_of])
+        deviations[padded - 1::padded] = np.inf
+        order = np.lexsort((deviations, range_of))
+        cum_deviation_weights = np.concatenate(([0], np.cumsum(weights[order])))
+        sorted_deviations = deviations[order]
+        mad = MAD_SCALE * (_order_statistics(sorted_deviations, cum_deviation_weights, low, (n - 1) // 2)
+                           + _order_statistics(sorted_deviations, cum_deviation_weights, low, n // 2)) / 2
+        lower_fence, upper_fence = median - fence_multiplier * mad, median + fence_multiplier * mad
+    else:
+        raise ValueError(f"Método de outliers desconhecido: {outlier_method}")
+
+    # Pesos e somas dentro dos limites, localizados nos tempos ordenados de cada segmento
+    cum_sums = np.concatenate(([0.0], np.cumsum(weighted)))
+    first = search_ranges(values, low, high, lower_fence, side='left')
+    last = search_ranges(values, low, high, upper_fence, side='right')
+    clean_count = cum_weights[last] - cum_weights[first]
+    clean_sum = cum_sums[last] - cum_sums[first]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        time_norm = np.where(clean_count > 0, clean_sum / clean_count, 0.0) / 60
+
+    return median.reshape(rows, segments), time_norm.reshape(rows, segments)
+
+
+def _sample_statistics(times, counts, outlier_method, fence_multiplier):
+    """Mediana e tempo normalizado de cada segmento ordenado, sem reamostrar."""
+    weights = np.append(np.ones(len(times), dtype=np.int64), 0)
+    median, time_norm = _weighted_statistics(times, counts, weights, 1, outlier_method, fence_multiplier)
+    return median[0], time_norm[0]
+
+
+def _subsample_statistics(times, resamples, size, rng, outlier_method, fence_multiplier):
+    """
+    Mediana e tempo normalizado de `resamples` reamostragens de `size` tempos
+    (m de n) de um segmento ordenado. Os índices sorteados são ordenados, então
+    cada reamostragem já sai ordenada e é tratada como um segmento próprio.
+    """
+    rows_per_batch = max(1, BOOTSTRAP_BATCH_DRAWS // size)
+    medians, norms = [], []
+    for done in range(0, resamples, rows_per_batch):
+        rows = min(rows_per_batch, resamples - done)
+        sample = times[np.sort(rng.integers(0, len(times), (rows, size)), axis=1)]
+        median, time_norm = _sample_statistics(sample.ravel(), np.full(rows, size, dtype=np.int64),
+                                               outlier_method, fence_multiplier)
+        medians.append(median)
+        norms.append(time_norm)
+    return np.concatenate(medians), np.concatenate(norms)
+
+
+def bootstrap_intervals(segments, fence_multiplier=DEFAULT_FENCE_MULTIPLIER, outlier_method=DEFAULT_OUTLIER_METHOD,
+                        confidence=BOOTSTRAP_CONFIDENCE, resamples=BOOTSTRAP_RESAMPLES,
+                        max_draws=BOOTSTRAP_MAX_DRAWS, seed=BOOTSTRAP_SEED):
+    """
+    Intervalos de confiança bootstrap (percentis) da mediana e do tempo
+    normalizado de cada segmento, com as colunas de BOOTSTRAP_COLUMNS.
+
+    Todos os segmentos são reamostrados juntos, em lotes de matrizes; o mesmo
+    `seed` reproduz os mesmos intervalos. Segmentos grandes recebem menos
+    reamostragens e, acima do piso, sorteiam m < n tempos por reamostragem,
+    para respeitar `max_draws` (ver resample_budget). Nesses, o desvio de
+    cada percentil em relação à estimativa da amostra completa é reduzido
+    por sqrt(m / n), a escala do bootstrap m de n.
+    """
+    rng = np.random.default_rng(seed)
+    counts = segments.counts
+    budget, sizes = resample_budget(counts, resamples, max_draws)
+    tail = (1 - confidence) / 2
+    result = np.full((len(segments), len(BOOTSTRAP_COLUMNS)), np.nan)
+
+    # Segmentos sorteados m de n: lidos um por vez
+    for i in np.flatnonzero(sizes < counts):
+        times = np.asarray(segments.segment(i))
+        estimates = _sample_statistics(times, counts[i:i + 1], outlier_method, fence_multiplier)
+        scale = np.sqrt(sizes[i] / counts[i])
+        for column, statistic in enumerate(_subsample_statistics(times, budget[i], sizes[i],
+                                                                 rng, outlier_method, fence_multiplier)):
+            estimate = estimates[column][0]
+            result[i, 2 * column:2 * column + 2] = estimate + scale * (
+                np.quantile(statistic, [tail, 1 - tail]) - estimate)
+
+    full = sizes == counts
+    for tier in np.unique(budget[full])[::-1]:
+        members = np.flatnonzero(full & (budget == tier))
+        tier_counts = counts[members]
+        times = np.concatenate([segments.segment(i) for i in members])
+        rows_per_batch = max(1, BOOTSTRAP_BATCH_DRAWS // len(times))
+
+        medians, norms = [], []
+        for done in range(0, tier, rows_per_batch):
+            median, time_norm = _batch_statistics(times, tier_counts, min(rows_per_batch, tier - done), rng,
+                                                  outlier_method, fence_multiplier)
+            medians.append(median)
+            norms.append(time_norm)
+
+        result[members, 0:2] = np.quantile(np.vstack(medians), [tail, 1 - tail], axis=0).T
+        result[members, 2:4] = np.quantile(np.vstack(norms), [tail, 1 - tail], axis=0).T
+
+    return pd.DataFrame(result, columns=list(BOOTSTRAP_COLUMNS), index=pd.Index(segments.keys))
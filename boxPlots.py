@@ -0,0 +1,79 @@
+import numpy as np
+
+# Pontos de outliers desenhados por caixa (os extremos sempre entram)
+MAX_FLIERS = 200
+
+# Caixas desenhadas por gráfico
+MAX_BOXES = 40
+
+
+def capped_sample(values, limit=MAX_FLIERS):
+    """Até `limit` valores igualmente espaçados de um array ordenado, incluindo o primeiro e o último."""
+    if len(values) <= limit:
+        return values
+    return values[np.unique(np.linspace(0, len(values) - 1, limit).round().astype(np.int64))]
+
+
+def box_stats(metrics, parts=None, label="", max_fliers=MAX_FLIERS):
+    """
+    Estatísticas de uma caixa no formato de Axes.bxp, a partir das métricas já
+    calculadas (quartis, mediana e limites de outliers).
+
+    `parts` são os arrays ordenados que compõem a linha (os membros, no caso
+    dos grupos): bigodes e outliers saem de buscas binárias em cada um, sem
+    intercalar nem reordenar os tempos. Sem `parts` (análise aproximada), os
+    bigodes são os limites restritos ao mínimo/máximo e só os extremos
+    aparecem como outliers.
+    """
+    lower, upper = metrics['lower_fence'], metrics['upper_fence']
+    median = metrics['median']
+
+    if parts is None:
+        whislo = min(max(lower, metrics['min']), median)
+        whishi = max(min(upper, metrics['max']), median)
+        fliers = np.array([value for value in (metrics['min'], metrics['max']) if not lower <= value <= upper])
+    else:
+        whislo, whishi = np.inf, -np.inf
+        outliers = []
+        for values in parts:
+            first = np.searchsorted(values, lower, side='left')
+            last = np.searchsorted(values, upper, side='right')
+            if last > first:
+                whislo = min(whislo, values[first])
+                whishi = max(whishi, values[last - 1])
+            outliers.append(capped_sample(values[:first], max_fliers))
+            outliers.append(capped_sample(values[last:], max_fliers))
+        if whislo > whishi:
+            whislo = whishi = median
+        fliers = capped_sample(np.sort(np.concatenate(outliers)), max_fliers) if outliers else np.zeros(0)
+
+    return {
+        'label': label,
+        'med': median,
+        'q1': metrics['q1'],
+        'q3': metrics['q3'],
+        'whislo': whislo,
+        'whishi': whishi,
+        'mean': metrics['mean_no_outliers'],
+        'fliers': fliers,
+    }
+
+
+def draw_box_plots(ax, stats, title=""):
+    """Desenha as caixas com Axes.bxp (média sem outliers marcada) e formata o eixo."""
+    ax.clear()
+    if not stats:
+        ax.set_axis_off()
+        return
+    ax.bxp(stats, showmeans=True, patch_artist=True,
+           boxprops={'facecolor': '#DBEAFE', 'edgecolor': '#2563EB'},
+           medianprops={'color': '#1D4ED8', 'linewidth': 2},
+           meanprops={'marker': 'D', 'markerfacecolor': '#059669', 'markeredgecolor': '#059669', 'markersize': 5},
+           flierprops={'marker': 'o', 'markerfacecolor': '#DC2626', 'markeredgecolor': 'none',
+                       'markersize': 3, 'alpha': 0.6})
+    ax.set_ylabel("Tempo (s)")
+    ax.set_title(title, fontsize=10)
+    ax.grid(axis='y', alpha=0.3)
+    ax.tick_params(axis='x', labelrotation=30, labelsize=8)
+    for tick in ax.get_xticklabels():
+        tick.set_horizontalalignment('right')
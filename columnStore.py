@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from metricsEngine import SortedSegments
+
+# Arquivos de cada coluna dentro do diretório de um arquivo processado
+TIMES_FILE = "times.npy"
+CODES_FILE = "codes.npy"
+SORTED_TIMES_FILE = "sorted_times.npy"
+
+# Registros por bloco nas passadas sobre as colunas (contagens, exportações)
+CHUNK_ROWS = 1 << 20
+
+
+class ColumnFiles:
+    """
+    Diretório temporário com colunas .npy abertas com memmap. Cada coluna
+    aberta guarda uma referência ao diretório, que só é apagado quando nenhuma
+    coluna (nem visão dela) estiver mais em uso.
+    """
+
+    def __init__(self, prefix="time_study_columns_"):
+        self.directory = tempfile.mkdtemp(prefix=prefix)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def save(self, filename, values):
+        """Grava `values` de uma vez e retorna a coluna aberta para leitura."""
+        np.save(os.path.join(self.directory, filename), values)
+        return self.open(filename)
+
+    def create(self, filename, dtype, length):
+        """Coluna vazia para ser preenchida por partes (chame open() depois de gravar)."""
+        return np.lib.format.open_memmap(os.path.join(self.directory, filename), mode='w+',
+                                         dtype=dtype, shape=(length,))
+
+    def open(self, filename):
+        column = np.load(os.path.join(self.directory, filename), mmap_mode='r')
+        column.files = self
+        return column
+
+
+def segments_on_disk(keys, counts, arrays, prefix="time_study_segments_"):
+    """
+    Cria um SortedSegments a partir de arrays já ordenados (um por chave, com
+    `counts` tempos cada), copiados um por vez para uma coluna .npy aberta com
+    memmap: `arrays` pode ser um gerador, e cada array só precisa existir
+    enquanto é copiado.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    files = ColumnFiles(prefix)
+    times = files.create(SORTED_TIMES_FILE, np.float64, int(offsets[-1]))
+    for start, values in zip(offsets[:-1], arrays):
+        times[start:start + len(values)] = values
+    times.flush()
+    del times
+    return SortedSegments(np.asarray(keys, dtype=object), files.open(SORTED_TIMES_FILE), offsets)
+
+
+def cumulative_sums(values, block_rows=CHUNK_ROWS, prefix="time_study_segments_"):
+    """
+    np.concatenate(([0], np.cumsum(values))) gravado em uma coluna .npy, um
+    bloco por vez. O total acumulado entra no primeiro valor de cada bloco, de
+    modo que as somas saem na mesma sequência (e com os mesmos arredondamentos)
+    da soma acumulada de uma vez.
+    """
+    files = ColumnFiles(prefix)
+    sums = files.create("cumsum.npy", np.float64, len(values) + 1)
+    sums[0] = 0.0
+    for start in range(0, len(values), block_rows):
+        block = np.array(values[start:start + block_rows], dtype=np.float64)
+        block[0] += sums[start]
+        sums[start + 1:start + 1 + len(block)] = np.cumsum(block)
+    sums.flush()
+    del sums
+    return files.open("cumsum.npy")
+
+
+class FileColumns:
+    """
+    Colunas de um arquivo processado, gravadas uma única vez em .npy e abertas
+    com memmap: tempo (float64) e código da atividade (int32, índice em
+    `names`) na ordem do arquivo, e os tempos ordenados por (atividade, tempo)
+    dos segmentos. O diretório é apagado quando as colunas são descartadas.
+    """
+
+    def __init__(self, activities, times, segments):
+        self.files = ColumnFiles()
+        self.directory = self.files.directory
+        self.names = pd.Index(segments.keys, dtype=object)
+        codes = self.names.get_indexer(pd.Series(activities, dtype=object)).astype(np.int32)
+        self.times = self.files.save(TIMES_FILE, np.asarray(times, dtype=np.float64))
+        self.codes = self.files.save(CODES_FILE, codes)
+        self.segments = SortedSegments(segments.keys, self.files.save(SORTED_TIMES_FILE, segments.times),
+                                       segments.offsets)
+
+    def __len__(self):
+        return len(self.times)
+
+    def activities(self):
+        """Atividade de cada registro como categórico (códigos inteiros + nomes)."""
+        return pd.Categorical.from_codes(self.codes, categories=self.names)
+
+
+class ColumnStore:
+    """
+    Registros processados dos arquivos ativos, na ordem de upload, lidos das
+    colunas em disco de cada arquivo (FileColumns): adicionar, remover ou
+    alternar arquivos não regrava nada, e contar, pré-visualizar ou exportar
+    lê um bloco de um arquivo por vez (blocks), sem montar as colunas completas.
+    """
+
+    def __init__(self, summaries):
+        self.source_paths = [summary.path for summary in summaries]
+        self._columns = [summary.columns for summary in summaries]
+        self._lengths = np.array([len(columns) for columns in self._columns], dtype=np.int64)
+        self.names = pd.Index(sorted(set().union(*(columns.names for columns in self._columns))), dtype=object)
+        # Código de cada arquivo -> código global (o último elemento leva -1 a -1)
+        self._translations = [np.append(self.names.get_indexer(columns.names), -1).astype(np.int32)
+                              for columns in self._columns]
+
+    def __len__(self):
+        return int(self._lengths.sum())
+
+    def blocks(self, block_rows=CHUNK_ROWS):
+        """
+        Registros em blocos, arquivo a arquivo na ordem de upload: (índice do
+        arquivo, código global da atividade, tempos). Só o bloco atual é lido
+        do disco.
+        """
+        for index, (columns, translation) in enumerate(zip(self._columns, self._translations)):
+            for start in range(0, len(columns), block_rows):
+                stop = start + block_rows
+                yield (index, translation[np.asarray(columns.codes[start:stop])],
+                       np.asarray(columns.times[start:stop], dtype=np.float64))
+
+    def head(self, n=5):
+        """Primeiros registros como DataFrame (Atividade, Tempo)."""
+        activities, times = [], []
+        for columns in self._columns:
+            take = n - len(times)
+            if take <= 0:
+                break
+            codes = np.asarray(columns.codes[:take])
+            activities.extend(np.where(codes >= 0, columns.names.to_numpy()[codes], None))
+            times.extend(np.asarray(columns.times[:take], dtype=np.float64))
+        return pd.DataFrame({'Atividade': pd.Series(activities, dtype=object),
+                             'Tempo': pd.Series(times, dtype=np.float64)})
+
+    def activity_counts(self):
+        """Registros por atividade (nomes originais), contados em blocos sobre os códigos de cada arquivo."""
+        counts = np.zeros(len(self.names), dtype=np.int64)
+        for columns, translation in zip(self._columns, self._translations):
+            file_counts = np.zeros(len(columns.names), dtype=np.int64)
+            for start in range(0, len(columns), CHUNK_ROWS):
+                block = np.asarray(columns.codes[start:start + CHUNK_ROWS])
+                file_counts += np.bincount(block[block >= 0], minlength=len(columns.names))
+            np.add.at(counts, translation[:-1], file_counts)
+        counts = pd.Series(counts, index=self.names.rename('Atividade'), name='count')
+        return counts[counts > 0]
+
+    def source_names(self):
+        """
+        Arquivo de origem como categórico compartilhado: (código de cada
+        arquivo, nomes). Arquivos de pastas diferentes podem ter o mesmo nome,
+        que recebe um único código.
+        """
+        codes, names = pd.factorize(pd.Series([os.path.basename(path) for path in self.source_paths], dtype=object))
+        return codes, pd.Index(names, dtype=object)
@@ -0,0 +1,505 @@
+import gzip
+import io
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from columnStore import CHUNK_ROWS, ColumnFiles
+from metricsEngine import RESULT_KEY_COLUMNS, MetricsCache
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Opcional: só a exportação Parquet/Arrow depende do pyarrow
+    pa = None
+
+try:
+    import zstandard
+except ImportError:  # Opcional: só a compressão zstd do CSV depende dele
+    zstandard = None
+
+# Colunas de identificação da tabela de amostras (Parte 1 da exportação)
+SAMPLE_KEY_COLUMNS = ("Processos", "Atividade")
+
+# Linhas gravadas entre duas chamadas do callback de progresso
+PROGRESS_ROWS = 2_000
+
+# Arquivo (no diretório temporário da Parte 1) com os tempos contíguos por linha
+SAMPLE_TIMES_FILE = "sample_times.npy"
+
+# Limites de uma planilha do Excel
+EXCEL_MAX_COLUMNS = 16_384
+EXCEL_MAX_ROWS = 1_048_576
+
+# Layouts das amostras no Excel: chave -> rótulo exibido
+SAMPLE_LAYOUTS = {
+    "auto": "🤖 Automático (longo se não couber)",
+    "wide": "↔️ Largo (Amostra 1..N)",
+    "long": "↕️ Longo (uma linha por amostra)",
+}
+DEFAULT_SAMPLE_LAYOUT = "auto"
+
+# Cabeçalho do layout longo
+LONG_SAMPLE_HEADER = ['Processos', 'Atividades da Coleta', 'Amostra', 'Tempo']
+
+# Exportação colunar (Parquet ou Arrow IPC/Feather)
+PYARROW_AVAILABLE = pa is not None
+COLUMNAR_COMPRESSION = "zstd"
+
+# Colunas de contagem da tabela de resultados, gravadas como inteiros
+COUNT_COLUMNS = ("n", "outlier_count", "non_outlier_count")
+
+# Exportação CSV em blocos: linhas por bloco e compressões (chave -> (rótulo, extensão))
+CSV_CHUNK_ROWS = 100_000
+CSV_COMPRESSIONS = {
+    "none": ("Sem compressão", ""),
+    "gzip": ("gzip (.gz)", ".gz"),
+    "zstd": ("zstd (.zst)", ".zst"),
+}
+DEFAULT_CSV_COMPRESSION = "none"
+
+# Cabeçalho no mesmo estilo do DataFrame.to_excel
+_HEADER_FONT = Font(bold=True)
+_HEADER_BORDER = Border(*(Side(style='thin'),) * 4)
+_HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='top')
+
+# Destaque de outliers (um único estilo diferencial compartilhado por todas as regras)
+_OUTLIER_FILL = PatternFill(start_color='FEE2E2', end_color='FEE2E2', fill_type='solid')
+_OUTLIER_FONT = Font(color='DC2626', bold=True)
+
+
+def sample_keys(activities, activity_to_group):
+    """
+    Chaves (processo, atividade) da Parte 1, ordenadas por processo e atividade.
+
+    `activities` são os nomes (unificados) presentes nos dados; as atividades
+    de `activity_to_group` que não aparecem neles ganham uma linha sem tempos.
+    Retorna (chaves, linha de cada nome de `activities`).
+    """
+    activities = pd.Index(activities, dtype=object)
+    names = activities.append(pd.Index(sorted(set(activity_to_group) - set(activities)), dtype=object))
+    keys = pd.DataFrame({SAMPLE_KEY_COLUMNS[0]: [activity_to_group.get(name, '') for name in names],
+                         SAMPLE_KEY_COLUMNS[1]: names})
+    order = keys.sort_values(list(SAMPLE_KEY_COLUMNS)).index.to_numpy()
+    rows = np.empty(len(order), dtype=np.int64)
+    rows[order] = np.arange(len(order))
+    return keys.iloc[order].reset_index(drop=True), rows[:len(activities)]
+
+
+class SampleRows:
+    """
+    Tempos da Parte 1 por (processo, atividade), sem a matriz larga: os tempos
+    de cada linha ficam contíguos, na ordem original dos dados, em uma coluna
+    .npy no disco aberta com memmap (o diretório é apagado com o objeto).
+
+    `blocks()` devolve um iterador de blocos (linha em `keys` ou -1, tempo) e
+    é percorrido duas vezes: contagem por linha e distribuição dos tempos. A
+    memória usada depende do tamanho dos blocos e do número de linhas, não do
+    número de amostras.
+    """
+
+    def __init__(self, keys, blocks):
+        self.keys = keys.reset_index(drop=True)
+        self.counts = np.zeros(len(self.keys), dtype=np.int64)
+        for rows, _ in blocks():
+            rows = np.asarray(rows)
+            self.counts += np.bincount(rows[rows >= 0], minlength=len(self.keys))
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1])).astype(np.int64)
+
+        total = int(self.counts.sum())
+        if total == 0:
+            self.times = np.zeros(0, dtype=np.float64)
+            return
+        files = ColumnFiles("time_study_samples_")
+        times = files.create(SAMPLE_TIMES_FILE, np.float64, total)
+        cursor = self.starts.copy()
+        for rows, values in blocks():
+            rows = np.asarray(rows)
+            valid = rows >= 0
+            rows = rows[valid]
+            order = np.argsort(rows, kind='stable')
+            block_counts = np.bincount(rows, minlength=len(self.keys))
+            # Posição de cada tempo dentro da sua linha no bloco, somada ao que as linhas já receberam
+            block_starts = np.cumsum(block_counts) - block_counts
+            sorted_rows = rows[order]
+            rank = np.arange(len(rows)) - block_starts[sorted_rows]
+            times[cursor[sorted_rows] + rank] = np.asarray(values, dtype=np.float64)[valid][order]
+            cursor += block_counts
+        times.flush()
+        del times
+        self.times = files.open(SAMPLE_TIMES_FILE)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def width(self):
+        """Maior número de amostras de uma linha (colunas "Amostra N")."""
+        return int(self.counts.max()) if len(self.counts) else 0
+
+    def row(self, index):
+        """Tempos de uma linha, na ordem original."""
+        return self.times[self.starts[index]:self.starts[index] + self.counts[index]]
+
+
+def _lookup(names):
+    """Código de cada posição de `names` no dicionário de nomes distintos (com -1 -> -1 no fim) e o dicionário."""
+    codes, uniques = pd.factorize(pd.Series(names, dtype=object))
+    return np.append(codes, -1), pd.Index(uniques, dtype=object)
+
+
+class SampleMapping:
+    """
+    Mapeamento das atividades originais (`names`, na ordem dos códigos dos
+    registros) para as exportações, resolvido uma vez por atividade distinta:
+    nome unificado e grupo (vazio se não agrupada) de cada código, em
+    dicionários fixos que valem para todos os blocos de registros.
+    """
+
+    def __init__(self, names, unified_activities, activity_groups):
+        self.activities = pd.Index(names, dtype=object)
+        self.unified_codes, self.unified = _lookup([unified_activities.get(name, name) for name in self.activities])
+        resolved_groups = MetricsCache.resolve_groups(activity_groups, unified_activities)
+        self.activity_to_group = {activity: group_name
+                                  for group_name, data in resolved_groups.items()
+                                  for activity in data['activities']}
+        group_codes, self.groups = _lookup([self.activity_to_group.get(name, '') for name in self.unified])
+        self.group_codes = group_codes[self.unified_codes]
+
+
+def sample_rows(processed_data, unified_activities, activity_groups, block_rows=CHUNK_ROWS):
+    """
+    Tempos da Parte 1 por (processo, atividade unificada), lidos de
+    `processed_data` (ColumnStore) um bloco de um arquivo por vez. Sem
+    `processed_data` (análise aproximada) só as atividades dos grupos
+    aparecem, sem tempos.
+    """
+    names = [] if processed_data is None else processed_data.names
+    mapping = SampleMapping(names, unified_activities, activity_groups)
+    # Linhas (processo, atividade) pelo nome unificado, incluindo as atividades dos grupos que não aparecem nos dados
+    unified = sorted(mapping.unified)
+    keys, rows = sample_keys(unified, mapping.activity_to_group)
+    row_lookup = np.append(rows[pd.Index(unified, dtype=object).get_indexer(mapping.unified)], -1)
+    row_lookup = row_lookup[mapping.unified_codes]
+
+    def blocks():
+        if processed_data is None:
+            return
+        for _, codes, times in processed_data.blocks(block_rows):
+            yield row_lookup[codes], times
+
+    return SampleRows(keys, blocks)
+
+
+def _cell_value(value):
+    """Valor gravável pelo openpyxl (NaN/NA viram célula vazia)."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value
+
+
+def _header_cells(sheet, names):
+    cells = []
+    for name in names:
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = _HEADER_FONT
+        cell.border = _HEADER_BORDER
+        cell.alignment = _HEADER_ALIGNMENT
+        cells.append(cell)
+    return cells
+
+
+def _frame_rows(frame):
+    """Linhas de um DataFrame como listas de valores graváveis."""
+    for row in frame.itertuples(index=False, name=None):
+        yield [_cell_value(value) for value in row]
+
+
+def _highlight_outliers(sheet, cell_range, fence):
+    """
+    Regra de formatação condicional que destaca os tempos fora de `fence`
+    (inferior, superior) em `cell_range`: o custo é uma regra por faixa,
+    independente do número de amostras.
+    """
+    if fence is None or not np.all(np.isfinite(fence)):
+        return
+    lower, upper = (repr(float(value)) for value in fence)
+    sheet.conditional_formatting.add(cell_range, CellIsRule(operator='notBetween', formula=[lower, upper],
+                                                            fill=_OUTLIER_FILL, font=_OUTLIER_FONT))
+
+
+def write_frame(sheet, frame):
+    """Grava um DataFrame (cabeçalho e linhas) em uma planilha write-only."""
+    sheet.append(_header_cells(sheet, list(frame.columns)))
+    for row in _frame_rows(frame):
+        sheet.append(row)
+
+
+def sample_header(width):
+    """Cabeçalho da Parte 1 para `width` colunas de amostras."""
+    return ['Processos', 'COD', 'Atividades da Coleta'] + [f'Amostra {i + 1}' for i in range(width)]
+
+
+def write_side_by_side(sheet, samples, analysis, progress=None, fences=None):
+    """
+    Grava a Parte 1 (amostras, uma linha por atividade) e, após uma coluna em
+    branco, a Parte 2 (tabela de análise) na mesma planilha, linha a linha.
+
+    `fences` ({atividade: (inferior, superior)}) destaca os outliers de cada
+    linha com uma regra de formatação condicional.
+    """
+    width = samples.width
+    left_header = sample_header(width)
+    sheet.append(_header_cells(sheet, left_header) + [None] + _header_cells(sheet, list(analysis.columns)))
+
+    right_rows = _frame_rows(analysis)
+    processes = samples.keys[SAMPLE_KEY_COLUMNS[0]].tolist()
+    activities = samples.keys[SAMPLE_KEY_COLUMNS[1]].tolist()
+    total = max(len(samples), len(analysis))
+    for index in range(total):
+        if index < len(samples):
+            times = samples.row(index).tolist()
+            left = [processes[index] or None, None, activities[index]] + times + [None] * (width - len(times))
+            if fences is not None and times:
+                first = len(left_header) - width + 1
+                _highlight_outliers(sheet, f"{get_column_letter(first)}{index + 2}:"
+                                           f"{get_column_letter(first + len(times) - 1)}{index + 2}",
+                                    fences.get(activities[index]))
+        else:
+            left = [None] * len(left_header)
+        sheet.append(left + [None] + next(right_rows, []))
+        if progress is not None and index % PROGRESS_ROWS == 0:
+            progress(index, total)
+    if progress is not None:
+        progress(total, total)
+
+
+def write_long_samples(workbook, samples, progress=None, max_rows=EXCEL_MAX_ROWS, fences=None):
+    """
+    Grava as amostras no layout longo (processo, atividade, nº da amostra,
+    tempo), abrindo "Amostras (2)", "Amostras (3)"... ao atingir `max_rows`.
+    Atividades sem tempos aparecem em uma linha com amostra e tempo vazios.
+    Com `fences`, cada bloco contínuo de uma atividade recebe uma regra de
+    destaque dos outliers.
+    """
+    processes = samples.keys[SAMPLE_KEY_COLUMNS[0]].tolist()
+    activities = samples.keys[SAMPLE_KEY_COLUMNS[1]].tolist()
+    total = int(np.maximum(samples.counts, 1).sum())  # Atividades sem tempos ocupam uma linha
+    sheet, sheet_rows, sheet_count, written = None, max_rows, 0, 0
+
+    time_column = get_column_letter(LONG_SAMPLE_HEADER.index('Tempo') + 1)
+
+    def highlight_block(first_row, activity):
+        # Linhas first_row + 1 .. sheet_rows da planilha atual pertencem à atividade
+        if fences is not None and sheet_rows > first_row:
+            _highlight_outliers(sheet, f"{time_column}{first_row + 1}:{time_column}{sheet_rows}",
+                                fences.get(activity))
+
+    def sample_values(row):
+        # Tempos da linha lidos do disco em fatias (uma atividade pode ter milhões de amostras)
+        for start in range(0, len(row), PROGRESS_ROWS):
+            yield from row[start:start + PROGRESS_ROWS].tolist()
+
+    for index in range(len(samples)):
+        process = processes[index] or None
+        row = samples.row(index)
+        has_times = len(row) > 0
+        block_start = sheet_rows
+        for number, value in enumerate(sample_values(row) if has_times else [None], start=1):
+            if sheet_rows >= max_rows:
+                if sheet is not None and has_times:
+                    highlight_block(block_start, activities[index])
+                sheet_count += 1
+                sheet = workbook.create_sheet('Amostras' if sheet_count == 1 else f'Amostras ({sheet_count})')
+                sheet.append(_header_cells(sheet, LONG_SAMPLE_HEADER))
+                sheet_rows = block_start = 1
+            sheet.append([process, activities[index], number if has_times else None, value])
+            sheet_rows += 1
+            written += 1
+            if progress is not None and written % PROGRESS_ROWS == 0:
+                progress(written, total)
+        if has_times:
+            highlight_block(block_start, activities[index])
+    if progress is not None:
+        progress(total, total)
+
+    if sheet is None:
+        sheet = workbook.create_sheet('Amostras')
+        sheet.append(_header_cells(sheet, LONG_SAMPLE_HEADER))
+
+
+def wide_layout_fits(samples, analysis):
+    """Indica se Parte 1 e Parte 2 cabem lado a lado em uma planilha do Excel."""
+    columns = len(sample_header(samples.width)) + 1 + analysis.shape[1]
+    rows = max(len(samples), len(analysis)) + 1
+    return columns <= EXCEL_MAX_COLUMNS and rows <= EXCEL_MAX_ROWS
+
+
+def resolve_sample_layout(layout, samples, analysis):
+    """Layout efetivo ("wide" ou "long"); no automático, o largo só é usado se couber."""
+    if layout == "auto":
+        return "wide" if wide_layout_fits(samples, analysis) else "long"
+    if layout == "wide" and not wide_layout_fits(samples, analysis):
+        width, limit = (f"{value:,}".replace(",", ".") for value in (samples.width, EXCEL_MAX_COLUMNS))
+        raise ValueError(f"O layout largo precisa de {width} colunas de amostras, além do limite "
+                         f"de {limit} colunas do Excel. Use o layout longo ou automático.")
+    return layout
+
+
+def write_export_workbook(filename, samples, analysis, parameters, layout="wide", progress=None, fences=None):
+    """
+    Grava a exportação completa com o openpyxl em modo write-only: cada linha
+    é descarregada no arquivo assim que gerada e os tempos da Parte 1 são
+    lidos do disco (SampleRows), então a memória usada não cresce com o
+    número de amostras.
+
+    No layout "wide" Parte 1 e Parte 2 ficam lado a lado em "Exportação
+    Completa"; no "long" a análise vai para "Análise" e as amostras para
+    planilhas "Amostras". `progress(linhas_gravadas, total)` é chamado
+    periodicamente; `fences` ({atividade: (inferior, superior)}) destaca os
+    outliers com formatação condicional.
+    """
+    workbook = Workbook(write_only=True)
+    if layout == "long":
+        write_frame(workbook.create_sheet('Análise'), analysis)
+        write_long_samples(workbook, samples, progress, fences=fences)
+    else:
+        write_side_by_side(workbook.create_sheet('Exportação Completa'), samples, analysis, progress, fences)
+    write_frame(workbook.create_sheet('Parâmetros'), parameters)
+    workbook.save(filename)
+
+
+def processed_sample_blocks(processed_data, unified_activities, activity_groups, block_rows=CSV_CHUNK_ROWS):
+    """
+    Amostras processadas com o mapeamento aplicado, em blocos de até
+    `block_rows` registros lidos arquivo a arquivo de `processed_data`
+    (ColumnStore): arquivo de origem, atividade original, nome unificado,
+    grupo (vazio se não agrupada) e tempo em segundos.
+
+    As colunas de texto são categóricas (códigos inteiros + dicionário), com os
+    mesmos dicionários em todos os blocos (SampleMapping). Sem registros, é
+    gerado um único bloco vazio (só o cabeçalho/esquema).
+    """
+    mapping = SampleMapping(processed_data.names, unified_activities, activity_groups)
+    source_codes, source_names = processed_data.source_names()
+
+    def frame(source, codes, times):
+        return pd.DataFrame({
+            'Arquivo': pd.Categorical.from_codes(np.full(len(codes), source), categories=source_names),
+            'Atividade': pd.Categorical.from_codes(codes, categories=mapping.activities),
+            'Atividade Unificada': pd.Categorical.from_codes(mapping.unified_codes[codes], categories=mapping.unified),
+            'Grupo': pd.Categorical.from_codes(mapping.group_codes[codes], categories=mapping.groups),
+            'Tempo': times,
+        })
+
+    if not len(processed_data):
+        yield frame(-1, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64))
+    for index, codes, times in processed_data.blocks(block_rows):
+        yield frame(source_codes[index], codes, times)
+
+
+def numeric_results_frame(results):
+    """Tabela de resultados tipada: chaves categóricas, contagens inteiras, demais colunas float."""
+    frame = results.copy()
+    for col in RESULT_KEY_COLUMNS:
+        frame[col] = frame[col].astype('category')
+    return frame.astype({col: np.int64 for col in COUNT_COLUMNS})
+
+
+def columnar_paths(filename):
+    """Arquivos gravados a partir do nome escolhido: <nome>_amostras<ext> e <nome>_metricas<ext>."""
+    base, extension = os.path.splitext(filename)
+    return f"{base}_amostras{extension}", f"{base}_metricas{extension}"
+
+
+def write_columnar(path, frames):
+    """
+    Grava DataFrames com as mesmas colunas (ex.: os blocos de
+    processed_sample_blocks) em Parquet (.parquet) ou Arrow IPC/Feather
+    (demais extensões), com compressão zstd, um bloco por vez: o esquema vem
+    do primeiro. Colunas categóricas viram colunas de dicionário do Arrow.
+    """
+    if not PYARROW_AVAILABLE:
+        raise ImportError("A exportação Parquet/Arrow requer o pacote pyarrow (pip install pyarrow)")
+    frames = iter(frames)
+    table = pa.Table.from_pandas(next(frames), preserve_index=False)
+    if path.lower().endswith('.parquet'):
+        writer = pq.ParquetWriter(path, table.schema, compression=COLUMNAR_COMPRESSION)
+    else:
+        writer = pa.ipc.new_file(path, table.schema,
+                                 options=pa.ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION))
+    with writer:
+        writer.write_table(table)
+        for frame in frames:
+            writer.write_table(pa.Table.from_pandas(frame, schema=table.schema, preserve_index=False))
+
+
+def validate_csv_compression(compression):
+    """Mensagem de erro se a compressão não puder ser usada (ou None)."""
+    if compression not in CSV_COMPRESSIONS:
+        return f"Compressão desconhecida: {compression}"
+    if compression == "zstd" and zstandard is None:
+        return "A compressão zstd requer o pacote zstandard (pip install zstandard)"
+    return None
+
+
+def csv_filename(filename, compression):
+    """Acrescenta a extensão da compressão ao nome escolhido, se ainda não estiver lá."""
+    extension = CSV_COMPRESSIONS[compression][1]
+    return filename if filename.lower().endswith(extension) else filename + extension
+
+
+def open_csv_output(path, compression="none"):
+    """Arquivo de texto UTF-8 para o CSV, comprimido conforme `compression`."""
+    if compression == "gzip":
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    if compression == "zstd":
+        raw = open(path, 'wb')
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(raw, closefd=True),
+                                encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+class ChunkedCsvWriter:
+    """
+    Grava em CSV blocos de linhas (DataFrames com as mesmas colunas, ex.: de
+    processed_sample_blocks) um por vez, para que a interface possa agendar os
+    blocos sem travar a janela; só o bloco atual fica em memória. `total` é o
+    número de linhas esperado (progresso).
+    """
+
+    def __init__(self, path, blocks, total, compression="none"):
+        self.path = path
+        self.total = total
+        self.rows_written = 0
+        self._blocks = iter(blocks)
+        self._next = next(self._blocks, None)
+        self._handle = open_csv_output(path, compression)
+
+    def __len__(self):
+        return self.total
+
+    @property
+    def done(self):
+        return self._handle is None
+
+    def write_next(self):
+        """Grava o próximo bloco; fecha o arquivo ao terminar e retorna se ainda há blocos."""
+        if self._next is not None:
+            self._next.to_csv(self._handle, header=self.rows_written == 0, index=False)
+            self.rows_written += len(self._next)
+            self._next = next(self._blocks, None)
+        if self._next is None:
+            self.close()
+        return not self.done
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
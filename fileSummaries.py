@@ -0,0 +1,99 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from columnStore import FileColumns, segments_on_disk
+from metricsEngine import SortedSegments, sort_by_activity
+
+# Bytes lidos por vez ao calcular o hash do conteúdo de um arquivo
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def file_content_hash(path, chunk_size=HASH_CHUNK_BYTES):
+    """Hash SHA-256 do conteúdo do arquivo, lido em blocos (identifica cópias em outras pastas)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileSummary:
+    """
+    Contribuição de um arquivo: dados limpos e tempos ordenados por atividade,
+    além das estatísticas de leitura.
+
+    Os dados são gravados uma única vez em colunas no disco (FileColumns) e o
+    DataFrame recebido não é mantido: registros e segmentos ordenados são lidos
+    por memmap. Os resumos são mescláveis: o conjunto completo é obtido juntando
+    os resumos dos arquivos ativos, sem reler nem reordenar os demais arquivos.
+    """
+
+    def __init__(self, path, data, rows_read=0, rework_filtered=0, invalid_removed=0):
+        self.path = path
+        self.columns = FileColumns(data['Atividade'], data['Tempo'],
+                                   sort_by_activity(data['Atividade'], data['Tempo']))
+        self.segments = self.columns.segments
+        self.rows_read = rows_read
+        self.rework_filtered = rework_filtered
+        self.invalid_removed = invalid_removed
+
+    def __len__(self):
+        return len(self.segments.times)
+
+    @property
+    def data(self):
+        """DataFrame (Atividade, Tempo) na ordem do arquivo, montado a partir das colunas em disco."""
+        return pd.DataFrame({'Atividade': self.columns.activities(), 'Tempo': self.columns.times})
+
+    @property
+    def activities(self):
+        """Atividades (nomes originais) presentes no arquivo."""
+        return list(self.segments.keys)
+
+
+def _activity_parts(summaries, only=None):
+    """Segmentos ordenados de cada atividade, um por resumo (apenas as atividades de `only`, se informado)."""
+    parts = {}
+    for summary in summaries:
+        for i, key in enumerate(summary.segments.keys):
+            if only is None or key in only:
+                parts.setdefault(key, []).append(summary.segments.segment(i))
+    return parts
+
+
+def _merged(parts):
+    """Intercalação das sequências ordenadas (ordenação estável/timsort), ou a própria sequência se for única."""
+    return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts), kind='stable')
+
+
+def merge_file_summaries(summaries, previous=None, changed_activities=None):
+    """
+    Junta os resumos (já ordenados por atividade) em um único SortedSegments.
+
+    Cada atividade recebe a intercalação das sequências ordenadas dos arquivos
+    (ordenação estável/timsort), como merge_segments faz com os grupos. A
+    junção é gravada atividade a atividade em uma coluna .npy aberta com
+    memmap (segments_on_disk): só a atividade sendo intercalada fica em memória.
+
+    Com `previous` (a junção anterior) e `changed_activities`, só essas
+    atividades são intercaladas de novo; as demais reaproveitam os segmentos
+    de `previous` sem reler os resumos.
+    """
+    summaries = [summary for summary in summaries if len(summary)]
+    if not summaries:
+        return SortedSegments(np.zeros(0, dtype=object), np.zeros(0, dtype=np.float64),
+                              np.zeros(1, dtype=np.int64))
+    if previous is None or changed_activities is None:
+        parts = _activity_parts(summaries)
+    else:
+        changed = set(changed_activities)
+        parts = _activity_parts(summaries, changed)
+        for i, key in enumerate(previous.keys):
+            if key not in changed:
+                parts[key] = [previous.segment(i)]
+
+    names = sorted(parts)
+    counts = [sum(len(part) for part in parts[name]) for name in names]
+    return segments_on_disk(names, counts, (_merged(parts[name]) for name in names))
@@ -0,0 +1,104 @@
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Tipos de regra suportados (chave interna -> rótulo exibido na interface)
+RULE_TYPES = {
+    "prefix": "Começa com",
+    "contains": "Contém",
+    "regex": "Expressão regular",
+    "tokens": "Palavras normalizadas",
+}
+
+
+def normalize_text(text):
+    """Normaliza um texto: minúsculas, sem acentos e apenas tokens alfanuméricos."""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(re.findall(r'[0-9a-z]+', text.lower()))
+
+
+def normalize_names(names):
+    """Versão vetorizada de normalize_text para uma Series de nomes."""
+    normalized = names.astype(str).str.normalize('NFKD')
+    normalized = normalized.str.encode('ascii', errors='ignore').str.decode('ascii')
+    normalized = normalized.str.lower().str.replace(r'[^0-9a-z]+', ' ', regex=True)
+    return normalized.str.strip()
+
+
+def validate_rule(rule_type, pattern):
+    """Valida uma regra e retorna uma mensagem de erro (ou None se válida)."""
+    if rule_type not in RULE_TYPES:
+        return f"Tipo de regra desconhecido: {rule_type}"
+    if not str(pattern).strip():
+        return "Informe o padrão da regra"
+    if rule_type == "regex":
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            return f"Expressão regular inválida: {e}"
+    elif rule_type == "tokens" and not normalize_text(pattern):
+        return "O padrão não contém palavras válidas"
+    return None
+
+
+def evaluate_rule(names, normalized, rule):
+    """Avalia uma regra sobre todos os nomes de uma vez e retorna uma máscara booleana."""
+    pattern = str(rule['pattern'])
+    rule_type = rule['type']
+
+    if rule_type == "prefix":
+        return names.str.lower().str.startswith(pattern.strip().lower()).to_numpy(dtype=bool)
+    if rule_type == "contains":
+        return names.str.lower().str.contains(pattern.strip().lower(), regex=False).to_numpy(dtype=bool)
+    if rule_type == "regex":
+        return names.str.contains(pattern, regex=True, flags=re.IGNORECASE).to_numpy(dtype=bool)
+    if rule_type == "tokens":
+        # Todas as palavras do padrão precisam aparecer como tokens inteiros no nome
+        padded = ' ' + normalized + ' '
+        mask = np.ones(len(names), dtype=bool)
+        for token in normalize_text(pattern).split():
+            mask &= padded.str.contains(f' {token} ', regex=False).to_numpy(dtype=bool)
+        return mask
+    raise ValueError(f"Tipo de regra desconhecido: {rule_type}")
+
+
+def match_group_rules(activity_names, activity_groups, exclude=()):
+    """
+    Avalia as regras de todos os grupos sobre o vocabulário distinto de atividades.
+
+    Cada atividade é atribuída ao primeiro grupo (na ordem de criação) cujas
+    regras ela satisfaz. Atividades em `exclude` (já agrupadas) são ignoradas.
+    Retorna um dicionário {grupo: [atividades]} apenas com grupos que tiveram
+    correspondências.
+    """
+    names = pd.Series(pd.unique(pd.Series(activity_names, dtype=object).astype(str)), dtype=object)
+    if names.empty:
+        return {}
+
+    normalized = normalize_names(names)
+    unassigned = ~names.isin(set(exclude)).to_numpy(dtype=bool)
+
+    matches = {}
+    for group_name, group_data in activity_groups.items():
+        rules = group_data.get('rules', [])
+        if not rules:
+            continue
+
+        group_mask = np.zeros(len(names), dtype=bool)
+        for rule in rules:
+            group_mask |= evaluate_rule(names, normalized, rule)
+
+        group_mask &= unassigned
+        if group_mask.any():
+            matches[group_name] = sorted(names[group_mask].tolist())
+            unassigned &= ~group_mask
+
+    return matches
+
+
+def describe_rule(rule):
+    """Texto curto para exibir uma regra na interface."""
+    return f"{RULE_TYPES.get(rule['type'], rule['type'])}: {rule['pattern']}"
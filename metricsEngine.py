@@ -0,0 +1,785 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# Colunas numéricas produzidas pelo motor, na mesma ordem da tabela de resultados
+METRIC_COLUMNS = (
+    "n", "std_dev", "min", "max", "median", "q1", "q3", "iqr",
+    "lower_fence", "upper_fence", "outlier_count", "non_outlier_count",
+    "mean_all", "mean_no_outliers", "time_non_norm", "time_norm"
+)
+
+# Colunas expressas em segundos (as demais são contagens ou minutos)
+SECONDS_COLUMNS = (
+    "std_dev", "min", "max", "median", "q1", "q3", "iqr",
+    "lower_fence", "upper_fence", "mean_all", "mean_no_outliers"
+)
+
+# Colunas de identificação da tabela de resultados
+RESULT_KEY_COLUMNS = ("kind", "group", "activity")
+
+DEFAULT_FENCE_MULTIPLIER = 1.5
+
+# Métodos de detecção de outliers: chave -> (rótulo exibido, multiplicador padrão)
+OUTLIER_METHODS = {
+    "tukey": ("Tukey (Q1/Q3 ± k × IQR)", 1.5),
+    "mad": ("MAD (mediana ± k × MAD)", 3.0),
+    "percentile": ("Corte por percentil (k% em cada cauda)", 5.0),
+    "zscore": ("Z-score (média ± k × desvio)", 3.0),
+}
+DEFAULT_OUTLIER_METHOD = "tukey"
+
+# Fator que torna o MAD comparável ao desvio padrão em dados normais
+MAD_SCALE = 1.4826
+
+# Confiança e precisão padrão do cálculo do número de observações necessárias
+SAMPLE_SIZE_CONFIDENCE = 0.95
+SAMPLE_SIZE_ACCURACY = 0.05
+
+# Fatores padrão do tempo padrão: ritmo (1.0 = 100%) e tolerâncias PF&D (fração do tempo normal)
+DEFAULT_RATING = 1.0
+DEFAULT_ALLOWANCE = 0.0
+
+# Tempos por bloco nas passadas vetorizadas sobre os segmentos (um segmento maior forma um bloco sozinho)
+SEGMENT_BLOCK_ROWS = 1 << 20
+
+
+class SortedSegments:
+    """Tempos ordenados por (atividade, tempo) com os limites de cada atividade."""
+
+    def __init__(self, keys, times, offsets):
+        self.keys = keys          # Nome de cada segmento (atividade)
+        self.times = times        # float64, ordenado dentro de cada segmento
+        self.offsets = offsets    # int64, len(keys) + 1; segmento i = times[offsets[i]:offsets[i+1]]
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def segment(self, index):
+        """Retorna os tempos ordenados de um segmento."""
+        return self.times[self.offsets[index]:self.offsets[index + 1]]
+
+    def slice(self, first, last):
+        """Segmentos [first, last) como um novo SortedSegments, lendo os tempos só dessa faixa."""
+        start, stop = self.offsets[first], self.offsets[last]
+        return SortedSegments(self.keys[first:last], np.asarray(self.times[start:stop]),
+                              self.offsets[first:last + 1] - start)
+
+
+class SegmentList:
+    """
+    Segmentos ordenados mantidos em arrays separados (ex.: visões de colunas
+    em disco), sem juntá-los: basta para ler segmento a segmento, como faz
+    merge_segments.
+    """
+
+    def __init__(self, keys, arrays):
+        self.keys = np.asarray(keys, dtype=object)
+        self.arrays = list(arrays)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def counts(self):
+        return np.array([len(values) for values in self.arrays], dtype=np.int64)
+
+    def segment(self, index):
+        return self.arrays[index]
+
+
+def segment_blocks(segments, block_rows=SEGMENT_BLOCK_ROWS):
+    """
+    Faixas [primeiro, último) de segmentos consecutivos com até `block_rows`
+    tempos no total (ou um único segmento, se ele for maior). Os cálculos por
+    segmento são feitos bloco a bloco, então os arrays temporários crescem com
+    o bloco e com o maior segmento, não com o estudo.
+    """
+    offsets = segments.offsets
+    bounds = [0]
+    while bounds[-1] < len(segments):
+        first = bounds[-1]
+        last = int(np.searchsorted(offsets, offsets[first] + block_rows, side='right')) - 1
+        bounds.append(max(last, first + 1))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def sort_by_activity(activities, times):
+    """Ordena os tempos uma única vez por (atividade, tempo) e retorna os segmentos."""
+    codes, keys = pd.factorize(pd.Series(activities), sort=True)
+    times = np.asarray(times, dtype=np.float64)
+
+    valid = (codes >= 0) & ~np.isnan(times)
+    codes = codes[valid]
+    times = times[valid]
+
+    order = np.lexsort((times, codes))
+    sorted_times = times[order]
+    counts = np.bincount(codes, minlength=len(keys))
+
+    # Descartar atividades que ficaram sem tempos válidos
+    present = counts > 0
+    keys = np.asarray(keys, dtype=object)[present]
+    offsets = np.concatenate(([0], np.cumsum(counts[present]))).astype(np.int64)
+    return SortedSegments(keys, sorted_times, offsets)
+
+
+def _lerp(a, b, t):
+    """Interpolação linear idêntica à usada pelo NumPy (e portanto pelo pandas)."""
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def segment_quantiles(segments, q):
+    """Quantil q (interpolação linear) de cada segmento ordenado."""
+    counts = segments.counts
+    position = (counts - 1) * q
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    fraction = position - lower
+    start = segments.offsets[:-1]
+    return _lerp(segments.times[start + lower], segments.times[start + upper], fraction)
+
+
+def segment_medians(segments):
+    """Mediana de cada segmento ordenado (média dos dois centrais, como Series.median)."""
+    counts = segments.counts
+    start = segments.offsets[:-1]
+    lower = start + (counts - 1) // 2
+    upper = start + counts // 2
+    return (segments.times[lower] + segments.times[upper]) / 2
+
+
+def quartiles(values):
+    """
+    Q1, mediana e Q3 de valores fora de ordem com uma única chamada a
+    np.partition (usado pelo sketch enquanto exato; segmentos já ordenados
+    usam segment_quantiles/segment_medians por índice).
+
+    Reproduz exatamente Series.quantile(0.25), Series.median() e
+    Series.quantile(0.75): interpolação linear entre os elementos de posição
+    floor((n-1)q) e o seguinte, e média dos dois centrais para a mediana.
+    Valores NaN são ignorados.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    if missing.any():
+        values = values[~missing]
+    n = len(values)
+    if n == 0:
+        return np.nan, np.nan, np.nan
+
+    positions = (n - 1) * np.array([0.25, 0.75])
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, n - 1)
+    middle = np.array([(n - 1) // 2, n // 2])
+
+    # Apenas as posições necessárias ficam no lugar; o restante não é ordenado
+    part = np.partition(values, np.unique(np.concatenate((lower, upper, middle))))
+    q1, q3 = _lerp(part[lower], part[upper], positions - lower)
+    median = (part[middle[0]] + part[middle[1]]) / 2
+    return float(q1), float(median), float(q3)
+
+
+def segment_mad(segments, medians):
+    """Desvio absoluto mediano (escalado por MAD_SCALE) de cada segmento."""
+    if len(segments) == 0:
+        return np.zeros(0, dtype=np.float64)
+    return np.concatenate([_block_mad(segments.slice(first, last), medians[first:last])
+                           for first, last in segment_blocks(segments)])
+
+
+def _block_mad(segments, medians):
+    deviations = np.abs(segments.times - np.repeat(medians, segments.counts))
+    codes = np.repeat(np.arange(len(segments)), segments.counts)
+    deviations = deviations[np.lexsort((deviations, codes))]
+    return MAD_SCALE * segment_medians(SortedSegments(segments.keys, deviations, segments.offsets))
+
+
+def validate_outlier_method(method, multiplier):
+    """Valida método e multiplicador e retorna uma mensagem de erro (ou None se válidos)."""
+    if method not in OUTLIER_METHODS:
+        return f"Método de outliers desconhecido: {method}"
+    if not np.isfinite(multiplier) or multiplier < 0:
+        return "O multiplicador deve ser um número maior ou igual a zero"
+    if method == "percentile" and multiplier >= 50:
+        return "O corte por percentil deve ser menor que 50% em cada cauda"
+    return None
+
+
+def outlier_fences(segments, method, multiplier, q1, median, q3, mean_all, std_dev, mad=None, percentiles=None):
+    """
+    Limites inferior e superior de cada segmento para o método escolhido.
+
+    Todos os métodos são calculados de uma vez para todos os segmentos; tempos
+    dentro de [inferior, superior] são considerados normais. `mad` e
+    `percentiles` (quantis multiplier/100 e 1 - multiplier/100) permitem
+    fornecer valores já calculados; sem segmentos (banco SQLite, sketches)
+    eles são obrigatórios para os métodos correspondentes.
+    """
+    if method == "tukey":
+        iqr = q3 - q1
+        return q1 - multiplier * iqr, q3 + multiplier * iqr
+    if method == "mad":
+        if mad is None:
+            mad = segment_mad(segments, median)
+        return median - multiplier * mad, median + multiplier * mad
+    if method == "percentile":
+        if percentiles is None:
+            fraction = multiplier / 100
+            percentiles = segment_quantiles(segments, fraction), segment_quantiles(segments, 1 - fraction)
+        return percentiles
+    if method == "zscore":
+        # Atividades com uma única amostra não têm desvio: o próprio valor é o limite
+        spread = multiplier * np.nan_to_num(std_dev)
+        return mean_all - spread, mean_all + spread
+    raise ValueError(f"Método de outliers desconhecido: {method}")
+
+
+def search_ranges(array, low, high, values, side='left'):
+    """
+    np.searchsorted de cada valor na sua faixa ordenada array[low:high].
+
+    Busca binária vetorizada: todas as faixas avançam juntas, em
+    log2(maior faixa) passos. Retorna posições absolutas em `array`.
+    """
+    low = np.array(low, dtype=np.int64)
+    high = np.array(high, dtype=np.int64)
+    active = low < high
+    while active.any():
+        middle = (low + high) // 2
+        probe = array[np.minimum(middle, len(array) - 1)]
+        go_right = active & ((probe < values) if side == 'left' else (probe <= values))
+        low = np.where(go_right, middle + 1, low)
+        high = np.where(active & ~go_right, middle, high)
+        active = low < high
+    return low
+
+
+def segment_searchsorted(segments, values, side='left'):
+    """np.searchsorted de um valor por segmento, dentro do próprio segmento."""
+    return search_ranges(segments.times, segments.offsets[:-1], segments.offsets[1:], values, side)
+
+
+def segment_sums(values, segments):
+    """Soma de `values` (alinhado com segments.times) por segmento."""
+    if len(segments) == 0:
+        return np.zeros(0, dtype=np.float64)
+    return np.add.reduceat(values, segments.offsets[:-1])
+
+
+def segment_moments(segments):
+    """Contagem, soma e soma dos quadrados dos desvios (M2) de cada segmento."""
+    if len(segments) == 0:
+        return segments.counts, np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float64)
+    blocks = [_block_moments(segments.slice(first, last)) for first, last in segment_blocks(segments)]
+    return tuple(np.concatenate(values) for values in zip(*blocks))
+
+
+def _block_moments(segments):
+    counts = segments.counts
+    sums = segment_sums(segments.times, segments)
+    deviations = segments.times - np.repeat(sums / np.maximum(counts, 1), counts)
+    m2 = segment_sums(deviations * deviations, segments)
+    return counts, sums, m2
+
+
+def combine_moments(counts, sums, m2, members):
+    """
+    Combina momentos de vários segmentos (algoritmo paralelo de Chan).
+
+    `members` é uma lista de arrays de índices de segmentos; retorna
+    (counts, sums, m2) de cada combinação sem revisitar os tempos.
+    """
+    group_counts = np.array([counts[idx].sum() for idx in members], dtype=np.int64)
+    group_sums = np.array([sums[idx].sum() for idx in members], dtype=np.float64)
+    group_m2 = np.empty(len(members), dtype=np.float64)
+    for i, idx in enumerate(members):
+        group_mean = group_sums[i] / group_counts[i] if group_counts[i] else 0.0
+        member_means = sums[idx] / counts[idx]
+        group_m2[i] = m2[idx].sum() + (counts[idx] * (member_means - group_mean) ** 2).sum()
+    return group_counts, group_sums, group_m2
+
+
+def merge_segments(segments, members, keys):
+    """
+    Junta os segmentos ordenados de cada combinação em um novo SortedSegments.
+
+    Os arrays de cada membro já estão ordenados; a ordenação estável (timsort)
+    detecta essas sequências e faz apenas a intercalação (k-way merge) entre elas.
+    Cada combinação é gravada assim que intercalada (segments_on_disk), então
+    só ela fica em memória.
+    """
+    from columnStore import segments_on_disk
+    counts = segments.counts
+    counts = [counts[idx].sum() for idx in members]
+    return segments_on_disk(keys, counts, (merge_sorted([segments.segment(i) for i in idx]) for idx in members))
+
+
+def merge_sorted(parts):
+    """Intercala arrays já ordenados (ordenação estável), ou devolve o próprio array se for único."""
+    return np.sort(np.concatenate(parts), kind='stable') if len(parts) > 1 else parts[0]
+
+
+def required_sample_sizes(mean_all, std_dev, confidence=SAMPLE_SIZE_CONFIDENCE, accuracy=SAMPLE_SIZE_ACCURACY):
+    """
+    Número de observações necessárias para estimar a média com a precisão
+    relativa `accuracy` (ex.: 0.05 = ±5%) e a confiança dada, pela fórmula
+    usual de estudo de tempos: N' = (z · s / (a · x̄))², arredondado para cima.
+
+    Vetorizado sobre todas as linhas; NaN quando o desvio não pode ser
+    estimado (uma única amostra).
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    mean_all = np.asarray(mean_all, dtype=np.float64)
+    std_dev = np.asarray(std_dev, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.ceil((z * std_dev / (accuracy * mean_all)) ** 2)
+
+
+def validate_sample_size_settings(confidence, accuracy):
+    """Valida confiança e precisão e retorna uma mensagem de erro (ou None se válidas)."""
+    if not 0 < confidence < 1:
+        return "A confiança deve estar entre 0 e 100%"
+    if not 0 < accuracy < 1:
+        return "A precisão deve estar entre 0 e 100%"
+    return None
+
+
+def validate_time_factors(rating, allowance):
+    """Valida ritmo e tolerância (em frações) e retorna uma mensagem de erro (ou None se válidos)."""
+    if not rating > 0:
+        return "O ritmo deve ser maior que 0%"
+    if not allowance >= 0:
+        return "As tolerâncias não podem ser negativas"
+    return None
+
+
+def resolve_time_factors(results, activity_groups, activity_factors):
+    """
+    Ritmo e tolerância de cada linha da tabela de resultados.
+
+    Atividades usam seus próprios fatores (`activity_factors`, por nome
+    unificado) e, na falta deles, os do grupo em que aparecem; grupos usam os
+    seus. O que não for definido em lugar nenhum recebe os valores padrão.
+    """
+    is_activity = (results['kind'] == 'activity').to_numpy()
+    factors = []
+    for key, default in (('rating', DEFAULT_RATING), ('allowance', DEFAULT_ALLOWANCE)):
+        by_group = results['group'].map({name: data[key] for name, data in activity_groups.items() if key in data})
+        by_activity = results['activity'].map({name: values[key] for name, values in activity_factors.items()
+                                               if key in values})
+        values = by_activity.where(is_activity).fillna(by_group).fillna(default)
+        factors.append(values.to_numpy(dtype=np.float64))
+    return tuple(factors)
+
+
+def standard_times(time_norm, rating, allowance):
+    """Tempo padrão = tempo normalizado × ritmo × (1 + tolerâncias), vetorizado."""
+    return np.asarray(time_norm, dtype=np.float64) * rating * (1 + np.asarray(allowance, dtype=np.float64))
+
+
+def add_standard_times(results, activity_groups, activity_factors):
+    """
+    Acrescenta `rating`, `allowance` e `standard_time` (min) à tabela de resultados.
+
+    Nas atividades o tempo padrão vem do tempo normalizado; nos grupos é a soma
+    dos tempos padrão das suas atividades (o tempo padrão do processo), cada
+    uma com os próprios fatores. Por isso ritmo e tolerância ficam vazios
+    (NaN) nas linhas de grupo: não há um fator único que leve ao total.
+    """
+    rating, allowance = resolve_time_factors(results, activity_groups, activity_factors)
+    standard = standard_times(results['time_norm'].to_numpy(), rating, allowance)
+
+    is_group = (results['kind'] == 'group').to_numpy()
+    member_totals = pd.Series(standard[~is_group]).groupby(results['group'].to_numpy()[~is_group]).sum()
+    standard[is_group] = results['group'][is_group].map(member_totals).to_numpy(dtype=np.float64)
+    results['rating'] = np.where(is_group, np.nan, rating)
+    results['allowance'] = np.where(is_group, np.nan, allowance)
+    results['standard_time'] = standard
+    return results
+
+
+def compute_segment_metrics(segments, fence_multiplier=DEFAULT_FENCE_MULTIPLIER, moments=None,
+                            outlier_method=DEFAULT_OUTLIER_METHOD):
+    """
+    Calcula todas as métricas de todos os segmentos de uma só vez.
+
+    Retorna um DataFrame indexado pela chave do segmento com as colunas de
+    METRIC_COLUMNS, como se cada atividade fosse calculada separadamente
+    (quantis por interpolação linear, como o pandas). `moments` permite reaproveitar (counts, sums, m2) já calculados.
+    Os limites de outliers seguem `outlier_method` (ver OUTLIER_METHODS). Os
+    segmentos são lidos em blocos (segment_blocks).
+    """
+    if len(segments) == 0:
+        return pd.DataFrame(columns=list(METRIC_COLUMNS), dtype=np.float64)
+
+    frames = [_block_metrics(segments.slice(first, last), fence_multiplier,
+                             None if moments is None else tuple(values[first:last] for values in moments),
+                             outlier_method)
+              for first, last in segment_blocks(segments)]
+    return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+
+def _block_metrics(segments, fence_multiplier, moments, outlier_method):
+    times = segments.times
+    starts = segments.offsets[:-1]
+    ends = segments.offsets[1:]
+
+    # Média e desvio padrão amostral (ddof=1) em duas passadas, como o pandas
+    counts, sums, m2 = moments if moments is not None else segment_moments(segments)
+    mean_all = sums / counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std_dev = np.sqrt(m2 / (counts - 1))
+    std_dev[counts < 2] = np.nan
+
+    q1 = segment_quantiles(segments, 0.25)
+    median = segment_medians(segments)
+    q3 = segment_quantiles(segments, 0.75)
+    iqr = q3 - q1
+
+    lower_fence, upper_fence = outlier_fences(segments, outlier_method, fence_multiplier,
+                                              q1, median, q3, mean_all, std_dev)
+
+    # Outliers pelos limites do método escolhido
+    seg_counts = segments.counts
+    inside = (times >= np.repeat(lower_fence, seg_counts)) & (times <= np.repeat(upper_fence, seg_counts))
+    non_outlier_count = segment_sums(inside.astype(np.int64), segments)
+    outlier_count = counts - non_outlier_count
+    clean_sum = segment_sums(np.where(inside, times, 0.0), segments)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_no_outliers = np.where(non_outlier_count > 0, clean_sum / non_outlier_count, 0.0)
+
+    return pd.DataFrame({
+        "n": counts,
+        "std_dev": std_dev,
+        "min": times[starts],
+        "max": times[ends - 1],
+        "median": median,
+        "q1": q1,
+        "q3": q3,
+        "iqr": iqr,
+        "lower_fence": lower_fence,
+        "upper_fence": upper_fence,
+        "outlier_count": outlier_count,
+        "non_outlier_count": non_outlier_count,
+        "mean_all": mean_all,
+        "mean_no_outliers": mean_no_outliers,
+        "time_non_norm": mean_all / 60,
+        "time_norm": mean_no_outliers / 60,
+    }, index=pd.Index(segments.keys, name="Atividade"))
+
+
+def compute_group_metrics(segments, activity_groups, fence_multiplier=DEFAULT_FENCE_MULTIPLIER,
+                          moments=None, outlier_method=DEFAULT_OUTLIER_METHOD):
+    """
+    Calcula as métricas de cada grupo a partir dos segmentos das atividades membro.
+
+    Contagens, somas e M2 são combinados diretamente; quartis e outliers vêm da
+    intercalação dos arrays ordenados dos membros, sem varrer o conjunto de dados.
+    Grupos sem nenhuma atividade com dados são omitidos.
+    """
+    key_index = pd.Index(segments.keys)
+    names, members = [], []
+    for group_name, group_data in activity_groups.items():
+        idx = key_index.get_indexer(pd.unique(pd.Series(group_data['activities'], dtype=object)))
+        idx = idx[idx >= 0]
+        if len(idx):
+            names.append(group_name)
+            members.append(idx)
+
+    if not names:
+        return pd.DataFrame(columns=list(METRIC_COLUMNS), dtype=np.float64)
+
+    if moments is None:
+        moments = segment_moments(segments)
+    group_moments = combine_moments(*moments, members)
+    merged = merge_segments(segments, members, names)
+    metrics = compute_segment_metrics(merged, fence_multiplier, moments=group_moments,
+                                      outlier_method=outlier_method)
+    metrics.index.name = "Grupo"
+    return metrics
+
+
+def compute_activity_metrics(activities, times, fence_multiplier=DEFAULT_FENCE_MULTIPLIER,
+                             outlier_method=DEFAULT_OUTLIER_METHOD):
+    """Atalho: ordena por atividade e calcula as métricas de todas as atividades."""
+    return compute_segment_metrics(sort_by_activity(activities, times), fence_multiplier,
+                                   outlier_method=outlier_method)
+
+
+def build_results_table(activity_metrics, group_metrics, activity_groups):
+    """
+    Monta a tabela numérica de resultados (uma linha por grupo/atividade).
+
+    A ordem das linhas é a de exibição: cada grupo seguido das suas atividades
+    e, por fim, as atividades não agrupadas (com `group` vazio). `kind` vale
+    "group" ou "activity".
+    """
+    frames = []
+
+    def tagged(metrics, kind, group):
+        frame = metrics.reset_index(drop=True)
+        frame.insert(0, "activity", list(metrics.index) if kind == "activity" else "")
+        frame.insert(0, "group", group)
+        frame.insert(0, "kind", kind)
+        return frame
+
+    grouped_activities = set()
+    for group_name, group_data in activity_groups.items():
+        grouped_activities.update(group_data['activities'])
+        if group_name not in group_metrics.index:
+            continue
+        members = [act for act in group_data['activities'] if act in activity_metrics.index]
+        frames.append(tagged(group_metrics.loc[[group_name]], "group", group_name))
+        frames.append(tagged(activity_metrics.loc[members], "activity", group_name))
+
+    ungrouped = activity_metrics[~activity_metrics.index.isin(grouped_activities)]
+    frames.append(tagged(ungrouped, "activity", ""))
+
+    results = pd.concat(frames, ignore_index=True)
+    return results.astype({col: np.float64 for col in METRIC_COLUMNS})
+
+
+class FenceExplorer:
+    """
+    Recalcula outliers para outro multiplicador sem refazer a análise.
+
+    Guarda os tempos ordenados de cada linha de resultado e as estatísticas que
+    não dependem do multiplicador (quartis, média, desvio, MAD); a cada novo
+    multiplicador só os limites mudam, e as contagens e somas dentro deles vêm
+    de buscas binárias e de uma soma acumulada dos tempos.
+    """
+
+    def __init__(self, segments, metrics, outlier_method=DEFAULT_OUTLIER_METHOD):
+        self.segments = segments
+        self.outlier_method = outlier_method
+        self._stats = {col: metrics[col].to_numpy(dtype=np.float64)
+                       for col in ("q1", "median", "q3", "mean_all", "std_dev")}
+        from columnStore import cumulative_sums
+        self._cumsum = cumulative_sums(segments.times)
+        self._mad = segment_mad(segments, self._stats["median"]) if outlier_method == "mad" else None
+
+    def recompute(self, fence_multiplier):
+        """Colunas dependentes do multiplicador, na ordem das linhas recebidas."""
+        stats = self._stats
+        lower_fence, upper_fence = outlier_fences(self.segments, self.outlier_method, fence_multiplier,
+                                                  stats["q1"], stats["median"], stats["q3"],
+                                                  stats["mean_all"], stats["std_dev"], mad=self._mad)
+        first = segment_searchsorted(self.segments, lower_fence, side='left')
+        last = segment_searchsorted(self.segments, upper_fence, side='right')
+
+        non_outlier_count = np.maximum(last - first, 0)
+        clean_sum = np.where(non_outlier_count > 0, self._cumsum[last] - self._cumsum[first], 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_no_outliers = np.where(non_outlier_count > 0, clean_sum / non_outlier_count, 0.0)
+
+        return pd.DataFrame({
+            "lower_fence": lower_fence,
+            "upper_fence": upper_fence,
+            "outlier_count": self.segments.counts - non_outlier_count,
+            "non_outlier_count": non_outlier_count,
+            "mean_no_outliers": mean_no_outliers,
+            "time_norm": mean_no_outliers / 60,
+        })
+
+
+class MetricsCache:
+    """
+    Cache das métricas por atividade e por grupo com rastreamento de alterações.
+
+    Os tempos são ordenados uma vez por versão dos dados. Unificações e mudanças
+    de grupos marcam apenas as atividades/grupos afetados, e update() recalcula
+    somente o que estiver marcado. Qualquer mudança nos arquivos ou no
+    processamento deve chamar invalidate(), que força o recálculo completo.
+    """
+
+    def __init__(self):
+        self.data_version = 0
+        self._computed_version = None
+        self._fence_multiplier = None
+        self._outlier_method = None
+        self._base = None              # Segmentos pelo nome original da atividade
+        self._base_version = None      # Versão dos dados a que _base corresponde
+        self._times = {}               # Nome efetivo -> tempos ordenados
+        self._moments = None           # DataFrame (count, sum, m2) por nome efetivo
+        self._group_members = {}       # Grupo -> membros efetivos usados no último cálculo
+        self._dirty_activities = set()
+        self._dirty_groups = set()
+        self.activity_metrics = None
+        self.group_metrics = None
+        self.workers = 1               # > 1 ativa o cálculo multiprocesso em estudos grandes
+
+    def invalidate(self):
+        """Dados alterados: a próxima atualização recalcula tudo."""
+        self.data_version += 1
+
+    def mark_activities_dirty(self, names):
+        """Marca atividades (nomes originais ou unificados) para recálculo."""
+        self._dirty_activities.update(names)
+
+    def mark_groups_dirty(self, names):
+        """Marca grupos para recálculo."""
+        self._dirty_groups.update(names)
+
+    @property
+    def base(self):
+        """Segmentos atuais pelo nome original da atividade (None antes da primeira carga)."""
+        return self._base
+
+    def set_base(self, segments, changed_activities=None):
+        """
+        Usa segmentos já ordenados (ex.: mesclados dos resumos por arquivo) no
+        lugar de ordenar processed_data. Com `changed_activities` (nomes
+        originais), apenas essas atividades e seus grupos são recalculados.
+        """
+        if changed_activities is None or self._computed_version != self.data_version:
+            self.invalidate()
+        else:
+            self.mark_activities_dirty(changed_activities)
+        self._base = segments
+        self._base_version = self.data_version
+
+    def _parallel_min_rows(self):
+        from parallelEngine import PARALLEL_MIN_ROWS
+        return PARALLEL_MIN_ROWS
+
+    @staticmethod
+    def resolve_groups(activity_groups, unified_activities):
+        """Grupos com as atividades traduzidas para os nomes unificados."""
+        resolved = {}
+        for group_name, group_data in activity_groups.items():
+            members = pd.unique(pd.Series([unified_activities.get(act, act) for act in group_data['activities']],
+                                          dtype=object))
+            resolved[group_name] = {'activities': list(members)}
+        return resolved
+
+    def _effective_members(self, unified_activities):
+        """Nome efetivo -> índices dos segmentos originais que o compõem."""
+        members = {}
+        for index, key in enumerate(self._base.keys):
+            members.setdefault(unified_activities.get(key, key), []).append(index)
+        return dict(sorted(members.items()))
+
+    def _activity_segments(self, names, members):
+        """Segmentos dos nomes efetivos: a própria base sem unificações, senão intercalados em disco."""
+        base = self._base
+        if len(names) == len(base) and all(members[name] == [i] for i, name in enumerate(names)):
+            return base
+        from columnStore import segments_on_disk
+        counts = base.counts
+        counts = [counts[members[name]].sum() for name in names]
+        return segments_on_disk(names, counts,
+                                (merge_sorted([base.segment(i) for i in members[name]]) for name in names))
+
+    def _compute_activities(self, names, members):
+        segments = self._activity_segments(names, members)
+        if self.workers > 1 and len(segments.times) >= self._parallel_min_rows():
+            from parallelEngine import compute_segment_metrics_parallel
+            metrics, (counts, sums, m2) = compute_segment_metrics_parallel(segments, self._fence_multiplier,
+                                                                           self.workers, self._outlier_method)
+        else:
+            counts, sums, m2 = segment_moments(segments)
+            metrics = compute_segment_metrics(segments, self._fence_multiplier, moments=(counts, sums, m2),
+                                              outlier_method=self._outlier_method)
+        moments = pd.DataFrame({'count': counts, 'sum': sums, 'm2': m2}, index=pd.Index(names, dtype=object))
+        return {name: segments.segment(i) for i, name in enumerate(names)}, moments, metrics
+
+    def _compute_groups(self, groups):
+        if not groups:
+            return pd.DataFrame(columns=list(METRIC_COLUMNS), dtype=np.float64)
+        names = list(pd.unique(pd.Series([act for data in groups.values() for act in data['activities']],
+                                         dtype=object)))
+        names = [name for name in names if name in self._times]
+        segments = SegmentList(names, [self._times[name] for name in names])
+        moments = self._moments.loc[names]
+        return compute_group_metrics(segments, groups, self._fence_multiplier,
+                                     moments=(moments['count'].to_numpy(np.int64),
+                                              moments['sum'].to_numpy(), moments['m2'].to_numpy()),
+                                     outlier_method=self._outlier_method)
+
+    def result_parts(self, results):
+        """
+        Arrays ordenados que compõem cada linha da tabela de resultados (mesma
+        ordem): a própria atividade ou os membros do grupo, sem intercalar.
+        """
+        parts = []
+        for kind, group, activity in results[["kind", "group", "activity"]].itertuples(index=False):
+            if kind == "activity":
+                parts.append([self._times[activity]])
+            else:
+                parts.append([self._times[name] for name in self._group_members[group] if name in self._times])
+        return parts
+
+    def result_segments(self, results):
+        """
+        Tempos ordenados de cada linha da tabela de resultados (mesma ordem),
+        intercalando os membros no caso dos grupos.
+        """
+        from columnStore import segments_on_disk
+        parts = self.result_parts(results)
+        return segments_on_disk(list(range(len(parts))), [sum(len(values) for values in members) for members in parts],
+                                (merge_sorted(members) for members in parts))
+
+    def update(self, processed_data, unified_activities, activity_groups,
+               fence_multiplier=DEFAULT_FENCE_MULTIPLIER, outlier_method=DEFAULT_OUTLIER_METHOD):
+        """Atualiza o cache e retorna (métricas por atividade, métricas por grupo)."""
+        groups = self.resolve_groups(activity_groups, unified_activities)
+
+        full = (self._computed_version != self.data_version or self._fence_multiplier != fence_multiplier
+                or self._outlier_method != outlier_method)
+        if full:
+            self._fence_multiplier = fence_multiplier
+            self._outlier_method = outlier_method
+            if self._base_version != self.data_version:
+                if self.workers > 1 and len(processed_data) >= self._parallel_min_rows():
+                    from parallelEngine import sort_by_activity_parallel
+                    self._base = sort_by_activity_parallel(processed_data['Atividade'], processed_data['Tempo'],
+                                                           self.workers)
+                else:
+                    self._base = sort_by_activity(processed_data['Atividade'], processed_data['Tempo'])
+                self._base_version = self.data_version
+            members = self._effective_members(unified_activities)
+            self._times, self._moments, self.activity_metrics = self._compute_activities(list(members), members)
+            self.group_metrics = self._compute_groups(groups)
+        else:
+            members = self._effective_members(unified_activities)
+            dirty = {unified_activities.get(name, name) for name in self._dirty_activities} | self._dirty_activities
+
+            # Atividades afetadas: recalcular as que existem, descartar as que sumiram
+            removed = [name for name in dirty if name in self._times and name not in members]
+            recompute = sorted(name for name in dirty if name in members)
+            for name in removed:
+                del self._times[name]
+            keep = ~self.activity_metrics.index.isin(dirty)
+            if recompute:
+                times, moments, metrics = self._compute_activities(recompute, members)
+                self._times.update(times)
+                self._moments = pd.concat([self._moments[keep], moments]).sort_index()
+                self.activity_metrics = pd.concat([self.activity_metrics[keep], metrics]).sort_index()
+            else:
+                self._moments = self._moments[keep]
+                self.activity_metrics = self.activity_metrics[keep]
+
+            # Grupos afetados: marcados, com membros alterados ou contendo atividades recalculadas
+            dirty_groups = {name for name, data in groups.items()
+                            if name in self._dirty_groups
+                            or tuple(data['activities']) != self._group_members.get(name)
+                            or dirty.intersection(data['activities'])}
+            keep = self.group_metrics.index.isin(list(groups)) & ~self.group_metrics.index.isin(dirty_groups)
+            updated = self._compute_groups({name: groups[name] for name in groups if name in dirty_groups})
+            group_metrics = pd.concat([self.group_metrics[keep], updated])
+            # Manter a ordem de criação dos grupos
+            self.group_metrics = group_metrics.reindex([name for name in groups if name in group_metrics.index])
+            self.group_metrics.index.name = "Grupo"
+
+        self._group_members = {name: tuple(data['activities']) for name, data in groups.items()}
+        self._computed_version = self.data_version
+        self._dirty_activities.clear()
+        self._dirty_groups.clear()
+        return self.activity_metrics, self.group_metrics
@@ -0,0 +1,186 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from metricsEngine import (DEFAULT_FENCE_MULTIPLIER, DEFAULT_OUTLIER_METHOD, METRIC_COLUMNS, SortedSegments,
+                           compute_segment_metrics, segment_moments)
+
+# Abaixo deste número de tempos o custo de iniciar os processos não compensa
+PARALLEL_MIN_ROWS = 1_000_000
+
+# Blocos por processo, para equilibrar atividades de tamanhos muito diferentes
+CHUNKS_PER_WORKER = 4
+
+
+def default_workers():
+    """Número de processos padrão (todos os núcleos disponíveis)."""
+    return os.cpu_count() or 1
+
+
+def _split_ranges(offsets, chunks):
+    """Divide as atividades em faixas contíguas com quantidades de tempos parecidas."""
+    total = offsets[-1]
+    targets = np.linspace(0, total, chunks + 1)
+    bounds = np.unique(np.searchsorted(offsets, targets, side='left'))
+    bounds[0] = 0
+    bounds = np.unique(np.append(bounds, len(offsets) - 1))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+_executor = None
+_executor_workers = 0
+
+
+def _get_executor(workers):
+    """Pool de processos reaproveitado entre análises (o spawn dos processos é caro)."""
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+        _executor_workers = workers
+    return _executor
+
+
+def _create_shared(array):
+    """Copia um array para um novo bloco de memória compartilhada."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm
+
+
+def _release_shared(*blocks):
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+
+def _sort_worker(times_name, times_len, offsets_name, offsets_len, start, stop):
+    """Ordena, no próprio bloco compartilhado, os tempos das atividades [start, stop)."""
+    times_shm = shared_memory.SharedMemory(name=times_name)
+    offsets_shm = shared_memory.SharedMemory(name=offsets_name)
+    try:
+        times = np.ndarray((times_len,), dtype=np.float64, buffer=times_shm.buf)
+        offsets = np.ndarray((offsets_len,), dtype=np.int64, buffer=offsets_shm.buf)
+
+        first, last = offsets[start], offsets[stop]
+        chunk = times[first:last]
+        local_codes = np.repeat(np.arange(stop - start), np.diff(offsets[start:stop + 1]))
+        chunk[:] = chunk[np.lexsort((chunk, local_codes))]
+        del times, offsets, chunk
+        return stop - start
+    finally:
+        times_shm.close()
+        offsets_shm.close()
+
+
+def sort_by_activity_parallel(activities, times, workers=None):
+    """
+    Versão multiprocesso de sort_by_activity.
+
+    Os tempos são agrupados por atividade com uma ordenação estável dos códigos
+    e cada processo ordena, direto na memória compartilhada, os tempos de uma
+    faixa disjunta de atividades.
+    """
+    workers = workers or default_workers()
+    codes, keys = pd.factorize(pd.Series(activities), sort=True)
+    times = np.asarray(times, dtype=np.float64)
+
+    valid = (codes >= 0) & ~np.isnan(times)
+    codes = codes[valid]
+    times = times[valid]
+
+    counts = np.bincount(codes, minlength=len(keys))
+    present = counts > 0
+    keys = np.asarray(keys, dtype=object)[present]
+    offsets = np.concatenate(([0], np.cumsum(counts[present]))).astype(np.int64)
+    grouped = times[np.argsort(codes, kind='stable')]
+    if len(keys) == 0:
+        return SortedSegments(keys, grouped, offsets)
+
+    times_shm = _create_shared(grouped)
+    offsets_shm = _create_shared(offsets)
+    try:
+        executor = _get_executor(workers)
+        futures = [executor.submit(_sort_worker, times_shm.name, len(grouped),
+                                   offsets_shm.name, len(offsets), start, stop)
+                   for start, stop in _split_ranges(offsets, workers * CHUNKS_PER_WORKER)]
+        for future in futures:
+            future.result()
+        sorted_times = np.ndarray(grouped.shape, dtype=np.float64, buffer=times_shm.buf).copy()
+    finally:
+        _release_shared(times_shm, offsets_shm)
+
+    return SortedSegments(keys, sorted_times, offsets)
+
+
+def _metrics_worker(times_name, times_len, offsets_name, offsets_len, start, stop, fence_multiplier,
+                    outlier_method):
+    """Calcula as métricas das atividades [start, stop) lendo os arrays da memória compartilhada."""
+    times_shm = shared_memory.SharedMemory(name=times_name)
+    offsets_shm = shared_memory.SharedMemory(name=offsets_name)
+    try:
+        times = np.ndarray((times_len,), dtype=np.float64, buffer=times_shm.buf)
+        offsets = np.ndarray((offsets_len,), dtype=np.int64, buffer=offsets_shm.buf)
+
+        # Visões (sem cópia) da faixa de atividades deste bloco
+        first, last = offsets[start], offsets[stop]
+        segments = SortedSegments(np.arange(start, stop), times[first:last], offsets[start:stop + 1] - first)
+        counts, sums, m2 = segment_moments(segments)
+        metrics = compute_segment_metrics(segments, fence_multiplier, moments=(counts, sums, m2),
+                                          outlier_method=outlier_method)
+        result = (start, metrics.to_numpy(dtype=np.float64), sums, m2)
+        del times, offsets, segments
+        return result
+    finally:
+        times_shm.close()
+        offsets_shm.close()
+
+
+def compute_segment_metrics_parallel(segments, fence_multiplier=DEFAULT_FENCE_MULTIPLIER, workers=None,
+                                     outlier_method=DEFAULT_OUTLIER_METHOD):
+    """
+    Versão multiprocesso de compute_segment_metrics.
+
+    Os tempos ordenados e os offsets ficam em multiprocessing.shared_memory e
+    cada processo calcula faixas disjuntas de atividades sem copiar os dados.
+    Retorna (métricas, (counts, sums, m2)) como compute_segment_metrics + segment_moments.
+    """
+    workers = workers or default_workers()
+    if len(segments) == 0:
+        return (compute_segment_metrics(segments, fence_multiplier, outlier_method=outlier_method),
+                segment_moments(segments))
+
+    times = np.ascontiguousarray(segments.times, dtype=np.float64)
+    offsets = np.ascontiguousarray(segments.offsets, dtype=np.int64)
+
+    times_shm = _create_shared(times)
+    offsets_shm = _create_shared(offsets)
+    try:
+        ranges = _split_ranges(offsets, workers * CHUNKS_PER_WORKER)
+        values = np.empty((len(segments), len(METRIC_COLUMNS)), dtype=np.float64)
+        sums = np.empty(len(segments), dtype=np.float64)
+        m2 = np.empty(len(segments), dtype=np.float64)
+
+        executor = _get_executor(workers)
+        futures = [executor.submit(_metrics_worker, times_shm.name, len(times),
+                                   offsets_shm.name, len(offsets), start, stop, fence_multiplier,
+                                   outlier_method)
+                   for start, stop in ranges]
+        for future in futures:
+            start, chunk_values, chunk_sums, chunk_m2 = future.result()
+            stop = start + len(chunk_values)
+            values[start:stop] = chunk_values
+            sums[start:stop] = chunk_sums
+            m2[start:stop] = chunk_m2
+    finally:
+        _release_shared(times_shm, offsets_shm)
+
+    metrics = pd.DataFrame(values, columns=list(METRIC_COLUMNS),
+                           index=pd.Index(segments.keys, name="Atividade"))
+    for col in ("n", "outlier_count", "non_outlier_count"):
+        metrics[col] = metrics[col].astype(np.int64)
+    return metrics, (segments.counts, sums, m2)
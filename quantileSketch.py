@@ -0,0 +1,236 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from metricsEngine import (DEFAULT_FENCE_MULTIPLIER, DEFAULT_OUTLIER_METHOD, MAD_SCALE, METRIC_COLUMNS,
+                           outlier_fences, quartiles)
+
+# Erro de posto normalizado do KLL (constantes empíricas do Apache DataSketches)
+_KLL_ERROR_FACTOR = 2.296
+_KLL_ERROR_EXPONENT = 0.9723
+
+# Colunas estimadas a partir do sketch (as demais são exatas)
+APPROXIMATE_COLUMNS = (
+    "median", "q1", "q3", "iqr", "lower_fence", "upper_fence",
+    "outlier_count", "non_outlier_count", "mean_no_outliers", "time_norm"
+)
+
+DEFAULT_K = 200
+MIN_K = 8
+
+
+def k_for_error(rank_error):
+    """Menor k cujo erro de posto normalizado não passa de `rank_error` (ex.: 0.01 = 1%)."""
+    return max(MIN_K, int(math.ceil((_KLL_ERROR_FACTOR / rank_error) ** (1 / _KLL_ERROR_EXPONENT))))
+
+
+def rank_error_for_k(k):
+    """Erro de posto normalizado (em fração) garantido com alta probabilidade para um k."""
+    return _KLL_ERROR_FACTOR / k ** _KLL_ERROR_EXPONENT
+
+
+def _weighted_quantile(items, weights, q):
+    """Quantil q de itens ordenados com pesos (item cuja posição acumulada cobre q)."""
+    position = q * (weights.sum() - 1)
+    cumulative = np.cumsum(weights) - 1
+    index = min(int(np.searchsorted(cumulative, position, side='left')), len(items) - 1)
+    return float(items[index])
+
+
+class KLLSketch:
+    """
+    Sketch de quantis KLL mesclável, com memória O(k) independente do volume.
+
+    Enquanto o número de valores cabe no primeiro compactador os resultados são
+    exatos; a partir daí o erro de posto fica limitado por rank_error_for_k(k).
+    Contagem, soma, mínimo e máximo são mantidos de forma exata.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=0):
+        self.k = k
+        self.levels = [np.zeros(0, dtype=np.float64)]
+        self.count = 0
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def exact(self):
+        return len(self.levels) == 1
+
+    @property
+    def rank_error(self):
+        return 0.0 if self.exact else rank_error_for_k(self.k)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0, dtype=np.float64))
+                items = np.sort(items)
+                # Um elemento ímpar fica no nível atual; os demais são compactados
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[:len(items) - len(keep)]
+                promoted = pairs[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+            level += 1
+
+    def update(self, values):
+        """Adiciona um lote de valores ao sketch."""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+
+    def merge(self, other):
+        """Incorpora outro sketch (de outro arquivo, bloco ou atividade)."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate((self.levels[level], items))
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted(self):
+        """Itens ordenados com seus pesos (2^nível)."""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(values), 2.0 ** level) for level, values in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def quartiles(self):
+        """(Q1, mediana, Q3); idênticos aos da análise exata enquanto o sketch for exato."""
+        if self.exact:
+            return quartiles(self.levels[0])
+        return tuple(self.quantile(q) for q in (0.25, 0.5, 0.75))
+
+    def quantile(self, q):
+        """Quantil q com interpolação linear (exato enquanto não houve compactação)."""
+        items, weights = self._weighted()
+        if len(items) == 0:
+            return np.nan
+        if self.exact:
+            return float(np.quantile(items, q))
+        return _weighted_quantile(items, weights, q)
+
+    def mad(self, median):
+        """Desvio absoluto mediano (escalado por MAD_SCALE) em torno de `median`."""
+        items, weights = self._weighted()
+        if len(items) == 0:
+            return np.nan
+        deviations = np.abs(items - median)
+        if self.exact:
+            return MAD_SCALE * float(np.median(deviations))
+        order = np.argsort(deviations, kind='stable')
+        return MAD_SCALE * _weighted_quantile(deviations[order], weights[order], 0.5)
+
+    def weighted_stats_between(self, lower, upper):
+        """(peso, soma ponderada) dos itens em [lower, upper]; exato se o sketch for exato."""
+        items, weights = self._weighted()
+        inside = (items >= lower) & (items <= upper)
+        total_weight = weights.sum()
+        scale = self.count / total_weight if total_weight else 0.0
+        return (weights[inside].sum() * scale, (items[inside] * weights[inside]).sum() * scale)
+
+
+def merge_moments(current, count, mean, m2):
+    """Combina momentos [count, mean, m2] de dois conjuntos (fórmula de Chan)."""
+    if current is None:
+        return [count, mean, m2]
+    total = current[0] + count
+    delta = mean - current[1]
+    return [total,
+            current[1] + delta * count / total,
+            current[2] + m2 + delta * delta * current[0] * count / total]
+
+
+class ActivitySketches:
+    """Um KLLSketch por atividade, com momentos exatos, alimentado em blocos."""
+
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.sketches = {}
+        self.moments = {}  # atividade -> [count, mean, m2]
+
+    def update(self, activities, times):
+        """Adiciona um bloco de (atividade, tempo) agrupando por atividade uma única vez."""
+        times = np.asarray(times, dtype=np.float64)
+        codes, keys = pd.factorize(pd.Series(activities), sort=False)
+        valid = (codes >= 0) & ~np.isnan(times)
+        codes, times = codes[valid], times[valid]
+        order = np.argsort(codes, kind='stable')
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(keys)))))
+        grouped = times[order]
+
+        for index, key in enumerate(keys):
+            values = grouped[bounds[index]:bounds[index + 1]]
+            if len(values) == 0:
+                continue
+            sketch = self.sketches.get(key)
+            if sketch is None:
+                sketch = self.sketches[key] = KLLSketch(self.k, seed=len(self.sketches))
+            sketch.update(values)
+            mean = values.mean()
+            self.moments[key] = merge_moments(self.moments.get(key), len(values), mean,
+                                              ((values - mean) ** 2).sum())
+
+    def combined(self, names):
+        """Sketch e momentos resultantes da mescla de várias atividades."""
+        sketch = KLLSketch(self.k)
+        moments = None
+        for name in names:
+            if name in self.sketches:
+                sketch.merge(self.sketches[name])
+                moments = merge_moments(moments, *self.moments[name])
+        return sketch, moments
+
+    def metrics(self, groups, fence_multiplier=DEFAULT_FENCE_MULTIPLIER, outlier_method=DEFAULT_OUTLIER_METHOD):
+        """
+        Métricas aproximadas no formato de METRIC_COLUMNS para cada entrada de
+        `groups` ({nome: [atividades]}), mais a coluna `rank_error`. Os limites
+        de outliers vêm de metricsEngine.outlier_fences, com os quartis, o MAD e
+        os percentis lidos do sketch.
+        """
+        rows, names = [], []
+        for name, members in groups.items():
+            sketch, moments = self.combined(members)
+            if moments is None:
+                continue
+            count, mean_all, m2 = moments
+            std_dev = math.sqrt(m2 / (count - 1)) if count > 1 else np.nan
+            q1, median, q3 = sketch.quartiles()
+            iqr = q3 - q1
+            mad = sketch.mad(median) if outlier_method == "mad" else None
+            percentiles = None
+            if outlier_method == "percentile":
+                percentiles = sketch.quantile(fence_multiplier / 100), sketch.quantile(1 - fence_multiplier / 100)
+            lower_fence, upper_fence = outlier_fences(None, outlier_method, fence_multiplier, q1, median, q3,
+                                                      mean_all, std_dev, mad, percentiles)
+            non_outlier_count, clean_sum = sketch.weighted_stats_between(lower_fence, upper_fence)
+            non_outlier_count = int(round(non_outlier_count))
+            mean_no_outliers = clean_sum / non_outlier_count if non_outlier_count else 0.0
+            rows.append((count, std_dev, sketch.min, sketch.max, median, q1, q3, iqr, lower_fence, upper_fence,
+                         count - non_outlier_count, non_outlier_count, mean_all, mean_no_outliers,
+                         mean_all / 60, mean_no_outliers / 60, sketch.rank_error))
+            names.append(name)
+
+        return pd.DataFrame(rows, columns=list(METRIC_COLUMNS) + ['rank_error'],
+                            index=pd.Index(names, dtype=object, name="Atividade"))
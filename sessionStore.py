@@ -0,0 +1,485 @@
+import json
+import sqlite3
+from contextlib import contextmanager
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from bootstrapEngine import BOOTSTRAP_COLUMNS
+from metricsEngine import METRIC_COLUMNS, MetricsCache
+
+DEFAULT_DB_PATH = "time_study.db"
+
+# Colunas numéricas opcionais da tabela de resultados também guardadas em `statistics`
+EXTRA_STATISTIC_COLUMNS = ("rank_error",) + BOOTSTRAP_COLUMNS + ("required_n", "rating", "allowance", "standard_time")
+
+# Um registro por conteúdo de arquivo (hash), com o mapeamento de colunas usado na leitura
+_FILES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        content_hash TEXT,
+        parse_key TEXT,
+        position INTEGER,
+        enabled INTEGER DEFAULT 1,
+        processed INTEGER DEFAULT 0,
+        rows_read INTEGER,
+        rework_filtered INTEGER,
+        invalid_removed INTEGER
+    )
+'''
+
+# Registros compactos: código do nome (em activity_names) e tempo
+_ACTIVITIES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS activities (
+        id INTEGER PRIMARY KEY,
+        file_id INTEGER NOT NULL,
+        name_id INTEGER NOT NULL,
+        time_seconds REAL NOT NULL
+    )
+'''
+
+# Nomes originais, com o nome unificado e o grupo da sessão atual
+_ACTIVITY_NAMES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS activity_names (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        unified_name TEXT,
+        group_name TEXT
+    )
+'''
+
+_TABLES = (
+    _FILES_TABLE,
+    _ACTIVITIES_TABLE,
+    _ACTIVITY_NAMES_TABLE,
+    '''
+    CREATE TABLE IF NOT EXISTS groups (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        color TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS statistics (
+        id INTEGER PRIMARY KEY,
+        activity_name TEXT NOT NULL,
+        group_name TEXT,
+        q1 REAL,
+        median REAL,
+        q3 REAL,
+        iqr REAL,
+        outliers TEXT,
+        mean_all REAL,
+        mean_no_outliers REAL,
+        total_time REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS group_activities (
+        group_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        activity TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS unifications (
+        original TEXT PRIMARY KEY,
+        unified TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS activity_factors (
+        activity TEXT PRIMARY KEY,
+        rating REAL,
+        allowance REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS session_settings (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''',
+)
+
+# Colunas acrescentadas às tabelas originais: tabela -> {coluna: tipo}
+_ADDED_COLUMNS = {
+    "groups": {"position": "INTEGER", "rules": "TEXT", "rating": "REAL", "allowance": "REAL"},
+    "statistics": {"position": "INTEGER", "kind": "TEXT",
+                   **{col: "REAL" for col in METRIC_COLUMNS + EXTRA_STATISTIC_COLUMNS
+                      if col not in ("q1", "median", "q3", "iqr", "mean_all", "mean_no_outliers")}},
+}
+
+# Chave reservada em session_settings: ordem das colunas da tabela de resultados
+RESULT_COLUMNS_KEY = "_result_columns"
+
+# Índices dos registros: removidos durante cargas em massa e recriados uma única vez ao final
+_ACTIVITY_INDEXES = {
+    "idx_activities_file": "activities (file_id)",
+    "idx_activities_name_time": "activities (name_id, time_seconds)",
+}
+
+_INDEXES = tuple(f"CREATE INDEX IF NOT EXISTS {name} ON {target}" for name, target in _ACTIVITY_INDEXES.items()) + (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_group_activities_group ON group_activities (group_id, position)",
+    "CREATE INDEX IF NOT EXISTS idx_statistics_position ON statistics (position)",
+)
+
+# Tabelas reescritas por inteiro ao salvar (arquivos e registros são atualizados por hash)
+_SESSION_TABLES = ("group_activities", "groups", "unifications", "activity_factors", "session_settings",
+                   "statistics")
+
+
+def _optional_float(value):
+    """Número gravável no SQLite (NaN vira NULL)."""
+    return None if value is None or pd.isna(value) else float(value)
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _parse_key(summary_columns):
+    """Mapeamento de colunas (atividade, tempo, retrabalho) usado como chave da leitura."""
+    return json.dumps(list(summary_columns)) if summary_columns else None
+
+
+class SessionStore:
+    """
+    Sessões de estudo gravadas no banco SQLite: arquivos, registros
+    processados, unificações, grupos, fatores e a tabela de resultados.
+
+    Cada operação abre a conexão em modo WAL, roda em uma única transação e a
+    fecha ao final; os registros são gravados com executemany.
+
+    Os arquivos são identificados pelo hash do conteúdo: os registros de um
+    conteúdo são gravados uma única vez e reaproveitados nas gravações
+    seguintes e ao processar de novo o mesmo arquivo.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        with self.transaction() as conn:
+            self._ensure_schema(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Conexão com uma transação: confirmada ao sair, desfeita em caso de erro."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                # BEGIN explícito: alterações de esquema também ficam na transação
+                conn.execute("BEGIN")
+                yield conn
+        finally:
+            conn.close()
+
+    @classmethod
+    def _ensure_schema(cls, conn):
+        cls._migrate(conn)
+        for statement in _TABLES:
+            conn.execute(statement)
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = _table_columns(conn, table)
+            for column, column_type in columns.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        for statement in _INDEXES:
+            conn.execute(statement)
+
+    @staticmethod
+    def _migrate(conn):
+        """
+        Bancos de versões anteriores: `files` perde a coluna `data` (o arquivo
+        inteiro como texto) e `activities` passa a guardar o código do nome.
+        As tabelas são recriadas e os dados copiados.
+        """
+        files_columns = _table_columns(conn, "files")
+        if "data" in files_columns:
+            conn.execute("ALTER TABLE files RENAME TO files_legacy")
+            conn.execute(_FILES_TABLE)
+            new_columns = _table_columns(conn, "files")
+            common = ", ".join(col for col in files_columns if col in new_columns)
+            conn.execute(f"INSERT INTO files ({common}) SELECT {common} FROM files_legacy")
+            conn.execute("DROP TABLE files_legacy")
+
+        activities_columns = _table_columns(conn, "activities")
+        if "name" in activities_columns:
+            conn.execute("ALTER TABLE activities RENAME TO activities_legacy")
+            conn.execute(_ACTIVITIES_TABLE)
+            conn.execute(_ACTIVITY_NAMES_TABLE)
+            conn.execute("INSERT OR IGNORE INTO activity_names (name) SELECT DISTINCT name FROM activities_legacy")
+            if "file_id" in activities_columns:
+                conn.execute("INSERT INTO activities (id, file_id, name_id, time_seconds) "
+                             "SELECT a.id, a.file_id, n.id, a.time_seconds FROM activities_legacy a "
+                             "JOIN activity_names n ON n.name = a.name WHERE a.file_id IS NOT NULL")
+            conn.execute("DROP TABLE activities_legacy")
+
+    def save_session(self, uploaded_files, disabled_files, file_summaries, file_hashes, summary_columns,
+                     unified_activities, activity_groups, activity_factors, settings, results=None,
+                     keep_stored_records=False):
+        """
+        Substitui a sessão gravada pela atual, em uma única transação.
+
+        Conteúdos (hash) já gravados com o mesmo mapeamento de colunas mantêm
+        seus registros; só os novos são inseridos e os que saíram da sessão
+        são apagados. Com `keep_stored_records` (sessão aberta sem carregar os
+        registros), arquivos sem resumo também mantêm os registros gravados.
+        `settings` são valores serializáveis em JSON (parâmetros da
+        análise...). Retorna (registros gravados, registros reaproveitados).
+        """
+        parse_key = _parse_key(summary_columns)
+
+        with self.transaction() as conn:
+            stored = {content_hash: (file_id, key, bool(processed))
+                      for file_id, content_hash, key, processed in conn.execute(
+                          "SELECT id, content_hash, parse_key, processed FROM files WHERE content_hash IS NOT NULL")}
+            # Arquivos sem posição ao final não fazem mais parte da sessão
+            conn.execute("UPDATE files SET position = NULL")
+
+            pending = []
+            reused = 0
+            for position, file_path in enumerate(uploaded_files):
+                summary = file_summaries.get(file_path)
+                content_hash = file_hashes.get(file_path)
+                enabled = int(file_path not in disabled_files)
+                file_id, key, processed = stored.get(content_hash, (None, None, False))
+                kept = keep_stored_records and summary is None and processed
+                if file_id is not None and key == parse_key and (processed == (summary is not None) or kept):
+                    conn.execute("UPDATE files SET filename = ?, position = ?, enabled = ? WHERE id = ?",
+                                 (file_path, position, enabled, file_id))
+                    if kept:
+                        reused += conn.execute("SELECT COUNT(*) FROM activities WHERE file_id = ?",
+                                               (file_id,)).fetchone()[0]
+                    elif summary is not None:
+                        reused += len(summary)
+                    continue
+                if file_id is not None:
+                    conn.execute("UPDATE files SET content_hash = NULL WHERE id = ?", (file_id,))
+
+                cursor = conn.execute(
+                    "INSERT INTO files (filename, content_hash, parse_key, position, enabled, processed, rows_read, "
+                    "rework_filtered, invalid_removed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (file_path, content_hash, parse_key, position, enabled, int(summary is not None),
+                     *((summary.rows_read, summary.rework_filtered, summary.invalid_removed)
+                       if summary is not None else (None, None, None))))
+                if summary is not None:
+                    pending.append((cursor.lastrowid, summary))
+
+            conn.execute("DELETE FROM activities WHERE file_id IN (SELECT id FROM files WHERE position IS NULL)")
+            conn.execute("DELETE FROM files WHERE position IS NULL")
+
+            name_ids = self._save_activity_names(conn, file_summaries.values(), unified_activities,
+                                                 activity_groups)
+            new_records = sum(len(summary) for _, summary in pending)
+            written = self._insert_records(conn, pending, name_ids, bulk=new_records > reused)
+            conn.execute("DELETE FROM activity_names WHERE NOT EXISTS "
+                         "(SELECT 1 FROM activities WHERE activities.name_id = activity_names.id)")
+
+            for table in _SESSION_TABLES:
+                conn.execute(f"DELETE FROM {table}")
+            for position, (group_name, group_data) in enumerate(activity_groups.items()):
+                cursor = conn.execute(
+                    "INSERT INTO groups (name, color, position, rules, rating, allowance) VALUES (?, ?, ?, ?, ?, ?)",
+                    (group_name, group_data.get('color'), position, json.dumps(group_data.get('rules', [])),
+                     group_data.get('rating'), group_data.get('allowance')))
+                conn.executemany("INSERT INTO group_activities (group_id, position, activity) VALUES (?, ?, ?)",
+                                 [(cursor.lastrowid, index, activity)
+                                  for index, activity in enumerate(group_data['activities'])])
+
+            conn.executemany("INSERT INTO unifications (original, unified) VALUES (?, ?)",
+                             unified_activities.items())
+            conn.executemany("INSERT INTO activity_factors (activity, rating, allowance) VALUES (?, ?, ?)",
+                             [(activity, factors.get('rating'), factors.get('allowance'))
+                              for activity, factors in activity_factors.items()])
+            conn.executemany("INSERT INTO session_settings (key, value) VALUES (?, ?)",
+                             [(key, json.dumps(value, default=float)) for key, value in settings.items()])
+
+            if results is not None:
+                self._save_results(conn, results)
+                conn.execute("INSERT INTO session_settings (key, value) VALUES (?, ?)",
+                             (RESULT_COLUMNS_KEY, json.dumps(list(results.columns))))
+
+        return written, reused
+
+    @staticmethod
+    def _save_activity_names(conn, summaries, unified_activities, activity_groups):
+        """
+        Grava os nomes originais dos resumos e atualiza nome unificado e grupo
+        de todos os nomes do banco (inclusive os de registros não carregados);
+        retorna nome -> código.
+        """
+        resolved_groups = MetricsCache.resolve_groups(activity_groups, unified_activities)
+        activity_to_group = {activity: group_name
+                             for group_name, data in resolved_groups.items()
+                             for activity in data['activities']}
+        names = sorted(set().union(*(summary.activities for summary in summaries)))
+
+        conn.executemany("INSERT OR IGNORE INTO activity_names (name) VALUES (?)", ((name,) for name in names))
+        conn.execute("UPDATE activity_names SET unified_name = NULL, group_name = NULL")
+        rows = []
+        for (name,) in conn.execute("SELECT name FROM activity_names").fetchall():
+            unified = unified_activities.get(name, name)
+            rows.append((unified, activity_to_group.get(unified), name))
+        conn.executemany("UPDATE activity_names SET unified_name = ?, group_name = ? WHERE name = ?", rows)
+        return dict(conn.execute("SELECT name, id FROM activity_names"))
+
+    @staticmethod
+    def _insert_records(conn, pending, name_ids, bulk=False):
+        """
+        Insere os registros dos arquivos novos. Em cargas em massa (`bulk`) os
+        índices dos registros são removidos e recriados uma única vez.
+        """
+        if bulk:
+            for name in _ACTIVITY_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+        written = 0
+        for file_id, summary in pending:
+            data = summary.data
+            activities = pd.Categorical(data['Atividade'])
+            codes = np.array([name_ids[name] for name in activities.categories], dtype=np.int64)
+            conn.executemany("INSERT INTO activities (file_id, name_id, time_seconds) VALUES (?, ?, ?)",
+                             zip(repeat(file_id), codes[activities.codes].tolist(),
+                                 data['Tempo'].to_numpy(dtype=np.float64).tolist()))
+            written += len(data)
+
+        if bulk:
+            for name, target in _ACTIVITY_INDEXES.items():
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        return written
+
+    @staticmethod
+    def _save_results(conn, results):
+        columns = [col for col in METRIC_COLUMNS + EXTRA_STATISTIC_COLUMNS if col in results.columns]
+        values = zip(*(results[col].map(_optional_float).tolist() for col in columns))
+        rows = zip(range(len(results)), results['kind'], results['activity'], results['group'],
+                   (results['mean_all'] * results['n']).map(_optional_float), values)
+        conn.executemany(
+            f"INSERT INTO statistics (position, kind, activity_name, group_name, total_time, "
+            f"{', '.join(columns)}) VALUES (?, ?, ?, ?, ?, {', '.join('?' * len(columns))})",
+            ((position, kind, activity, group, total, *metrics)
+             for position, kind, activity, group, total, metrics in rows))
+
+    @staticmethod
+    def _read_records(conn, file_id=None):
+        """Registros (file_id, Atividade, Tempo) na ordem de gravação, de todos os arquivos ou de um só."""
+        names = dict(conn.execute("SELECT id, name FROM activity_names"))
+        lookup = np.empty(max(names, default=-1) + 1, dtype=object)
+        lookup[list(names)] = list(names.values())
+
+        query = "SELECT file_id, name_id, time_seconds FROM activities"
+        params = ()
+        if file_id is not None:
+            query += " WHERE file_id = ?"
+            params = (file_id,)
+        records = pd.read_sql_query(query + " ORDER BY id", conn, params=params)
+        return pd.DataFrame({'file_id': records['file_id'].to_numpy(),
+                             'Atividade': lookup[records['name_id'].to_numpy()],
+                             'Tempo': records['time_seconds'].to_numpy(dtype=np.float64)})
+
+    @staticmethod
+    def _file_entry(row, data, records=None):
+        file_id, path, content_hash, enabled, processed, rows_read, rework_filtered, invalid_removed = row
+        if processed and data is not None:
+            data = data[['Atividade', 'Tempo']].reset_index(drop=True)
+        else:
+            data = None
+        if records is None:
+            records = len(data) if data is not None else 0
+        return {'path': path, 'content_hash': content_hash, 'enabled': bool(enabled), 'data': data,
+                'processed': bool(processed), 'records': records,
+                'rows_read': rows_read or 0, 'rework_filtered': rework_filtered or 0,
+                'invalid_removed': invalid_removed or 0}
+
+    def load_parsed_file(self, content_hash, summary_columns):
+        """
+        Registros já gravados de um conteúdo lido com o mesmo mapeamento de
+        colunas (dicionário como os de `load_session()['files']`), ou None.
+        """
+        if content_hash is None:
+            return None
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT id, filename, content_hash, enabled, processed, rows_read, rework_filtered, invalid_removed "
+                "FROM files WHERE content_hash = ? AND parse_key = ? AND processed = 1",
+                (content_hash, _parse_key(summary_columns))).fetchone()
+            if row is None:
+                return None
+            return self._file_entry(row, self._read_records(conn, row[0]))
+
+    def load_session(self, include_records=True):
+        """
+        Lê a sessão gravada (None se não houver). Retorna um dicionário com
+        `files` (caminho, hash, ativo, estatísticas de leitura e os registros
+        de cada arquivo processado), `unified_activities`, `activity_groups`,
+        `activity_factors`, `settings` e `results`.
+
+        Sem `include_records`, os registros ficam só no banco (`data` é None
+        e `records` traz a contagem de cada arquivo), para a análise pelo SQLite.
+        """
+        with self.transaction() as conn:
+            settings = {key: json.loads(value)
+                        for key, value in conn.execute("SELECT key, value FROM session_settings")}
+            if not settings:
+                return None
+
+            if include_records:
+                records = self._read_records(conn)
+                by_file = dict(tuple(records.groupby('file_id', sort=False)))
+                entry = lambda row: self._file_entry(row, by_file.get(row[0], records.iloc[:0]))
+            else:
+                counts = dict(conn.execute("SELECT file_id, COUNT(*) FROM activities GROUP BY file_id"))
+                entry = lambda row: self._file_entry(row, None, counts.get(row[0], 0))
+            files = [entry(row) for row in conn.execute(
+                "SELECT id, filename, content_hash, enabled, processed, rows_read, rework_filtered, invalid_removed "
+                "FROM files ORDER BY position")]
+
+            members = {}
+            for group_id, activity in conn.execute("SELECT group_id, activity FROM group_activities "
+                                                   "ORDER BY group_id, position"):
+                members.setdefault(group_id, []).append(activity)
+            activity_groups = {}
+            for group_id, name, color, rules, rating, allowance in conn.execute(
+                    "SELECT id, name, color, rules, rating, allowance FROM groups ORDER BY position"):
+                group_data = {'color': color, 'activities': members.get(group_id, []),
+                              'rules': json.loads(rules) if rules else []}
+                if rating is not None:
+                    group_data['rating'] = rating
+                if allowance is not None:
+                    group_data['allowance'] = allowance
+                activity_groups[name] = group_data
+
+            activity_factors = {}
+            for activity, rating, allowance in conn.execute("SELECT activity, rating, allowance "
+                                                            "FROM activity_factors"):
+                activity_factors[activity] = {key: value for key, value in (('rating', rating),
+                                                                            ('allowance', allowance))
+                                              if value is not None}
+
+            return {
+                'files': files,
+                'unified_activities': dict(conn.execute("SELECT original, unified FROM unifications")),
+                'activity_groups': activity_groups,
+                'activity_factors': activity_factors,
+                'settings': settings,
+                'results': self._load_results(conn, settings.pop(RESULT_COLUMNS_KEY, None)),
+            }
+
+    @staticmethod
+    def _load_results(conn, result_columns=None):
+        columns = METRIC_COLUMNS + EXTRA_STATISTIC_COLUMNS
+        results = pd.read_sql_query(
+            f"SELECT kind, group_name AS \"group\", activity_name AS activity, {', '.join(columns)} "
+            f"FROM statistics ORDER BY position", conn)
+        if results.empty or result_columns is None:
+            return None
+        # Colunas opcionais que não existiam na análise gravada continuam ausentes
+        results = results[result_columns]
+        results['group'] = results['group'].fillna('')
+        return results.astype({col: np.float64 for col in columns if col in results.columns})
@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+
+from metricsEngine import (DEFAULT_FENCE_MULTIPLIER, DEFAULT_OUTLIER_METHOD, MAD_SCALE, METRIC_COLUMNS,
+                           MetricsCache, _lerp, combine_moments, outlier_fences)
+
+
+def _quantile_positions(counts, q):
+    """Posições (0-based) vizinhas e fração do quantil q (interpolação linear, como o NumPy)."""
+    position = (counts - 1) * q
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    return lower, upper, position - lower
+
+
+def _median_positions(counts):
+    """Posições centrais (iguais quando n é ímpar)."""
+    return (counts - 1) // 2, counts // 2
+
+
+def _enabled_filter(conn, files=None):
+    """
+    Condição extra que restringe os registros aos arquivos analisados: os
+    caminhos de `files` ou, sem eles, os ativos no banco (vazia se todos estão ativos).
+    """
+    if files is not None:
+        conn.execute("CREATE TEMP TABLE analysis_files (filename TEXT PRIMARY KEY)")
+        conn.executemany("INSERT OR IGNORE INTO analysis_files (filename) VALUES (?)", ((path,) for path in files))
+        return " AND a.file_id IN (SELECT f.id FROM files f JOIN analysis_files s ON s.filename = f.filename)"
+    if conn.execute("SELECT EXISTS (SELECT 1 FROM files WHERE enabled = 0)").fetchone()[0]:
+        return " AND a.file_id IN (SELECT id FROM files WHERE enabled = 1)"
+    return ""
+
+
+def _name_moments(conn, enabled):
+    """
+    Contagem, soma, mínimo, máximo e M2 de cada nome original, em duas
+    passadas agregadas (a média da primeira centraliza a segunda).
+    """
+    names = pd.read_sql_query(
+        "SELECT a.name_id, n.name, COUNT(*) AS n, SUM(a.time_seconds) AS sum, "
+        "MIN(a.time_seconds) AS min, MAX(a.time_seconds) AS max "
+        f"FROM activities a JOIN activity_names n ON n.id = a.name_id WHERE 1{enabled} GROUP BY a.name_id", conn)
+
+    conn.execute("CREATE TEMP TABLE name_means (name_id INTEGER PRIMARY KEY, mean REAL NOT NULL)")
+    conn.executemany("INSERT INTO name_means (name_id, mean) VALUES (?, ?)",
+                     zip(names['name_id'].tolist(), (names['sum'] / names['n']).tolist()))
+    m2 = pd.read_sql_query(
+        "SELECT a.name_id, SUM((a.time_seconds - m.mean) * (a.time_seconds - m.mean)) AS m2 "
+        f"FROM activities a JOIN name_means m ON m.name_id = a.name_id WHERE 1{enabled} GROUP BY a.name_id",
+        conn).set_index('name_id')['m2']
+    names['m2'] = m2.reindex(names['name_id']).to_numpy(dtype=np.float64)
+    return names
+
+
+def _scopes(names, unified_activities, activity_groups):
+    """
+    Atividades (nomes unificados, em ordem) e grupos com dados: chaves e, para
+    cada um, os índices em `names` dos nomes originais que o compõem.
+    """
+    unified = pd.Series([unified_activities.get(name, name) for name in names['name']], dtype=object)
+    activity_members = {key: np.asarray(idx, dtype=np.int64)
+                        for key, idx in sorted(unified.groupby(unified).indices.items())}
+
+    group_keys, group_members = [], []
+    for group_name, group_data in MetricsCache.resolve_groups(activity_groups, unified_activities).items():
+        idx = [activity_members[name] for name in group_data['activities'] if name in activity_members]
+        if idx:
+            group_keys.append(group_name)
+            group_members.append(np.concatenate(idx))
+    return list(activity_members), list(activity_members.values()), group_keys, group_members
+
+
+def _ordered_values(conn, enabled, scope_ids, positions, order_by="a.time_seconds", join=""):
+    """
+    Valores nas posições pedidas da sequência ordenada de cada escopo, com
+    ROW_NUMBER() particionado por escopo (uma única ordenação no SQLite).
+    """
+    conn.execute("DELETE FROM wanted_positions")
+    conn.executemany("INSERT OR IGNORE INTO wanted_positions (scope_id, pos) VALUES (?, ?)",
+                     zip(scope_ids.tolist(), positions.tolist()))
+    found = pd.read_sql_query(
+        "SELECT r.scope_id, r.pos, r.value FROM ("
+        f"SELECT m.scope_id, {order_by} AS value, "
+        f"ROW_NUMBER() OVER (PARTITION BY m.scope_id ORDER BY {order_by}) - 1 AS pos "
+        f"FROM activities a JOIN scope_members m ON m.name_id = a.name_id{join} WHERE 1{enabled}) r "
+        "JOIN wanted_positions w ON w.scope_id = r.scope_id AND w.pos = r.pos", conn)
+    values = found.set_index(['scope_id', 'pos'])['value']
+    return values.reindex(pd.MultiIndex.from_arrays([scope_ids, positions])).to_numpy(dtype=np.float64)
+
+
+def sql_metrics(store, unified_activities, activity_groups, fence_multiplier=DEFAULT_FENCE_MULTIPLIER,
+                outlier_method=DEFAULT_OUTLIER_METHOD, files=None):
+    """
+    Métricas por atividade e por grupo calculadas no próprio banco da sessão
+    (registros dos arquivos ativos ou, com `files`, dos caminhos informados),
+    sem carregar os tempos em um DataFrame.
+
+    Contagem, soma, mínimo, máximo e M2 saem de consultas agregadas por nome
+    original e são combinados por atividade unificada e por grupo; quartis,
+    mediana, MAD e cortes por percentil vêm de ROW_NUMBER() sobre os tempos
+    ordenados de cada escopo; outliers e média sem outliers, de uma última
+    passada com os limites. Retorna DataFrames no formato de
+    compute_segment_metrics/compute_group_metrics.
+    """
+    with store.transaction() as conn:
+        enabled = _enabled_filter(conn, files)
+        names = _name_moments(conn, enabled)
+        activity_keys, activity_members, group_keys, group_members = _scopes(names, unified_activities,
+                                                                             activity_groups)
+        members = activity_members + group_members
+        if not members:
+            empty = pd.DataFrame(columns=list(METRIC_COLUMNS), dtype=np.float64)
+            return empty, empty.copy()
+
+        # Escopos: atividades (0..A-1) e depois grupos; cada registro entra em todos os seus escopos
+        conn.execute("CREATE TEMP TABLE scope_members (scope_id INTEGER NOT NULL, name_id INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX temp.idx_scope_members_name ON scope_members (name_id)")
+        name_ids = names['name_id'].to_numpy()
+        conn.executemany("INSERT INTO scope_members (scope_id, name_id) VALUES (?, ?)",
+                         ((scope_id, int(name_id)) for scope_id, idx in enumerate(members)
+                          for name_id in name_ids[idx]))
+        conn.execute("CREATE TEMP TABLE wanted_positions (scope_id INTEGER NOT NULL, pos INTEGER NOT NULL, "
+                     "PRIMARY KEY (scope_id, pos))")
+
+        counts, sums, m2 = combine_moments(names['n'].to_numpy(dtype=np.int64), names['sum'].to_numpy(),
+                                           names['m2'].to_numpy(), members)
+        minimum = np.array([names['min'].to_numpy()[idx].min() for idx in members])
+        maximum = np.array([names['max'].to_numpy()[idx].max() for idx in members])
+        mean_all = sums / counts
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std_dev = np.sqrt(m2 / (counts - 1))
+        std_dev[counts < 2] = np.nan
+
+        # Quartis, mediana (e cortes por percentil) em uma única consulta ordenada
+        scope_ids = np.arange(len(members))
+        quantiles = [0.25, 0.75]
+        if outlier_method == "percentile":
+            quantiles += [fence_multiplier / 100, 1 - fence_multiplier / 100]
+        neighbours = [_quantile_positions(counts, q) for q in quantiles]
+        middle = _median_positions(counts)
+        positions = [pos for lower, upper, _ in neighbours for pos in (lower, upper)] + list(middle)
+        values = _ordered_values(conn, enabled, np.tile(scope_ids, len(positions)), np.concatenate(positions))
+        values = values.reshape(len(positions), len(members))
+
+        quantile_values = [_lerp(values[2 * i], values[2 * i + 1], fraction)
+                           for i, (_, _, fraction) in enumerate(neighbours)]
+        q1, q3 = quantile_values[0], quantile_values[1]
+        median = (values[-2] + values[-1]) / 2
+
+        mad = None
+        if outlier_method == "mad":
+            conn.execute("CREATE TEMP TABLE scope_medians (scope_id INTEGER PRIMARY KEY, median REAL)")
+            conn.executemany("INSERT INTO scope_medians (scope_id, median) VALUES (?, ?)",
+                             zip(scope_ids.tolist(), median.tolist()))
+            deviations = _ordered_values(conn, enabled, np.tile(scope_ids, 2), np.concatenate(middle),
+                                         order_by="abs(a.time_seconds - s.median)",
+                                         join=" JOIN scope_medians s ON s.scope_id = m.scope_id")
+            mad = MAD_SCALE * (deviations[:len(members)] + deviations[len(members):]) / 2
+        percentiles = tuple(quantile_values[2:]) if outlier_method == "percentile" else None
+        lower_fence, upper_fence = outlier_fences(None, outlier_method, fence_multiplier,
+                                                  q1, median, q3, mean_all, std_dev, mad, percentiles)
+
+        # Outliers e média sem outliers pelos limites de cada escopo
+        conn.execute("CREATE TEMP TABLE scope_fences (scope_id INTEGER PRIMARY KEY, lower REAL, upper REAL)")
+        conn.executemany("INSERT INTO scope_fences (scope_id, lower, upper) VALUES (?, ?, ?)",
+                         zip(scope_ids.tolist(), np.asarray(lower_fence, dtype=np.float64).tolist(),
+                             np.asarray(upper_fence, dtype=np.float64).tolist()))
+        inside = pd.read_sql_query(
+            "SELECT m.scope_id, "
+            "SUM(a.time_seconds BETWEEN f.lower AND f.upper) AS count, "
+            "SUM(CASE WHEN a.time_seconds BETWEEN f.lower AND f.upper THEN a.time_seconds ELSE 0 END) AS sum "
+            "FROM activities a JOIN scope_members m ON m.name_id = a.name_id "
+            f"JOIN scope_fences f ON f.scope_id = m.scope_id WHERE 1{enabled} GROUP BY m.scope_id",
+            conn).set_index('scope_id').reindex(scope_ids).fillna(0)
+
+    non_outlier_count = inside['count'].to_numpy(dtype=np.int64)
+    clean_sum = inside['sum'].to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_no_outliers = np.where(non_outlier_count > 0, clean_sum / non_outlier_count, 0.0)
+
+    metrics = pd.DataFrame({
+        "n": counts,
+        "std_dev": std_dev,
+        "min": minimum,
+        "max": maximum,
+        "median": median,
+        "q1": q1,
+        "q3": q3,
+        "iqr": q3 - q1,
+        "lower_fence": lower_fence,
+        "upper_fence": upper_fence,
+        "outlier_count": counts - non_outlier_count,
+        "non_outlier_count": non_outlier_count,
+        "mean_all": mean_all,
+        "mean_no_outliers": mean_no_outliers,
+        "time_non_norm": mean_all / 60,
+        "time_norm": mean_no_outliers / 60,
+    })
+    activity_metrics = metrics.iloc[:len(activity_keys)].set_axis(pd.Index(activity_keys, name="Atividade"))
+    group_metrics = metrics.iloc[len(activity_keys):].set_axis(pd.Index(group_keys, name="Grupo"))
+    return activity_metrics, group_metrics